@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+"""
+Compares the capsule approximation of PrimitiveSyncer with betterpybullet in accuracy and speed.
+usage: benchmark_collision_checkers.py [urdf] [number of configurations]
+"""
+import sys
+from itertools import combinations
+from timeit import default_timer as timer
+
+import numpy as np
+import rospy
+
+from giskardpy import identifier
+from giskardpy.configs.default_giskard import Giskard
+from giskardpy.model.better_pybullet_syncer import BetterPyBulletSyncer
+from giskardpy.model.primitive_syncer import PrimitiveSyncer
+from giskardpy.utils.utils import resolve_ros_iris
+
+cut_off_distance = 0.1
+
+if __name__ == '__main__':
+    rospy.init_node('benchmark_collision_checkers')
+    urdf_path = sys.argv[1] if len(sys.argv) > 1 else 'package://giskardpy/test/urdfs/pr2.urdf'
+    number_of_configurations = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    with open(resolve_ros_iris(urdf_path), 'r') as f:
+        urdf = f.read()
+    giskard = Giskard(root_link_name='map')
+    world = giskard.world
+    world.add_urdf(urdf, group_name='robot', actuated=True)
+    world.register_controlled_joints(world.movable_joint_names)
+    group = world.groups['robot']
+    god_map = world.god_map
+
+    bpb = BetterPyBulletSyncer(world)
+    primitives = PrimitiveSyncer(world)
+    god_map.set_data(identifier.collision_scene, bpb)
+    bpb.sync()
+    bpb.reset_collision_blacklist()
+    link_pairs = [x for x in combinations(sorted(group.link_names_with_collisions), 2)
+                  if x not in bpb.black_list and (x[1], x[0]) not in bpb.black_list]
+    cut_off_distances = {link_pair: cut_off_distance for link_pair in link_pairs}
+    print(f'{len(link_pairs)} link pairs, {number_of_configurations} configurations')
+
+    np.random.seed(0)
+    errors = []
+    missed = 0
+    false_alarms = 0
+    times = {'betterpybullet': 0., 'primitives': 0.}
+    for _ in range(number_of_configurations):
+        bpb.set_rnd_joint_state(group)
+        world.notify_state_change()
+        for name, collision_scene in [('betterpybullet', bpb), ('primitives', primitives)]:
+            god_map.set_data(identifier.collision_scene, collision_scene)
+            start = timer()
+            collision_scene.sync()
+            collision_scene.check_collisions(cut_off_distances, 1)
+            times[name] += timer() - start
+        bpb_distances = bpb.check_collisions_batch([], np.zeros((1, 0)), link_pairs, cut_off_distance)[0]
+        primitive_distances = primitives.get_distances(link_pairs)
+        close = np.isfinite(bpb_distances)
+        errors.extend(primitive_distances[close] - bpb_distances[close])
+        missed += np.sum((bpb_distances < 0) & (primitive_distances >= 0))
+        false_alarms += np.sum((bpb_distances >= 0) & (primitive_distances < 0))
+
+    for name, t in times.items():
+        print(f'{name}: {t / number_of_configurations * 1000:.3f}ms per check')
+    errors = np.array(errors)
+    if len(errors) > 0:
+        print(f'distance error of pairs closer than {cut_off_distance}m: '
+              f'mean {np.mean(errors):.4f}m, mean abs {np.mean(np.abs(errors)):.4f}m, '
+              f'min {np.min(errors):.4f}m, max {np.max(errors):.4f}m')
+    print(f'collisions missed: {missed}, false collisions: {false_alarms}')
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Compares how long it takes to update the pose of a group, when it is a state change, with the old behavior,
+which changed the model and recompiled all fks.
+usage: benchmark_group_pose_update.py [urdf] [number of boxes] [number of updates]
+"""
+import sys
+from timeit import default_timer as timer
+
+import numpy as np
+import rospy
+from geometry_msgs.msg import Pose
+
+import giskardpy.casadi_wrapper as w
+from giskardpy.configs.default_giskard import Giskard
+from giskardpy.model.utils import make_world_body_box
+from giskardpy.utils.utils import resolve_ros_iris
+
+if __name__ == '__main__':
+    rospy.init_node('benchmark_group_pose_update')
+    urdf_path = sys.argv[1] if len(sys.argv) > 1 else 'package://giskardpy/test/urdfs/pr2.urdf'
+    number_of_boxes = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    number_of_updates = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    with open(resolve_ros_iris(urdf_path), 'r') as f:
+        urdf = f.read()
+    giskard = Giskard(root_link_name='map')
+    world = giskard.world
+    world.add_urdf(urdf, group_name='robot', actuated=True)
+    world.register_controlled_joints(world.movable_joint_names)
+    for i in range(number_of_boxes):
+        pose = Pose()
+        pose.position.x = 2 + i * 0.2
+        pose.orientation.w = 1
+        world.add_world_body(f'box{i}', make_world_body_box(0.1, 0.1, 0.1), pose, world.root_link_name)
+    joint_name = world.groups['box0'].root_link.parent_joint_name
+    print(f'{len(world.links)} links, {number_of_boxes} boxes, {number_of_updates} updates')
+
+    np.random.seed(0)
+    times = {'state change': 0., 'model change': 0.}
+    for _ in range(number_of_updates):
+        parent_T_child = w.TransMatrix.from_xyz_rpy(*np.random.uniform(-1, 1, 6)).evaluate()
+        start = timer()
+        world.update_joint_parent_T_child(joint_name, w.TransMatrix(parent_T_child))
+        world.compute_fk_np(world.root_link_name, world.groups['box0'].root_link_name)
+        times['state change'] += timer() - start
+
+        start = timer()
+        world.update_joint_parent_T_child(joint_name, w.TransMatrix(parent_T_child), notify=False)
+        world.notify_model_change()
+        world.compute_fk_np(world.root_link_name, world.groups['box0'].root_link_name)
+        times['model change'] += timer() - start
+
+    for name, t in times.items():
+        print(f'{name}: {t / number_of_updates * 1000:.3f}ms per pose update')
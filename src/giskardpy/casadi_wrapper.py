@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import json
+import os
+import shutil
+import subprocess
 from copy import copy
-from typing import Union
+from functools import lru_cache
+from typing import Union, Optional, Dict, Tuple
 
 import casadi as ca  # type: ignore
 import numpy as np
@@ -10,19 +15,77 @@ import rospy
 
 from giskardpy.my_types import PrefixName
 from giskardpy.utils import logging
+from giskardpy.utils.file_cache import LRUFileCache
 
 _EPS = np.finfo(float).eps * 4.0
 pi = ca.pi
 
+c_compiler_flags = ['-O3', '-fPIC', '-shared']
+
+
+@lru_cache(maxsize=None)
+def find_c_compiler() -> Optional[str]:
+    for compiler in [os.environ.get('CC'), 'gcc', 'clang', 'cc']:
+        if compiler is not None and shutil.which(compiler) is not None:
+            return compiler
+    logging.logwarn('No C compiler found, falling back to casadi\'s virtual machine.')
+    return None
+
+
+def compile_to_c(f: ca.Function, c_code_cache: LRUFileCache) -> ca.Function:
+    """
+    Generates C code for f and compiles it into a shared library, which is stored in c_code_cache.
+    If no compiler is available or compilation fails, f is returned unchanged.
+    """
+    compiler = find_c_compiler()
+    if compiler is None:
+        return f
+    key = c_code_cache.hash(ca.__version__, compiler, *c_compiler_flags, f.serialize())
+    path = c_code_cache.get(key)
+    if path is None:
+        try:
+            with c_code_cache.add(key) as tmp_path:
+                code_generator = ca.CodeGenerator(f'{f.name()}.c')
+                code_generator.add(f)
+                c_file = code_generator.generate(tmp_path + os.sep)
+                subprocess.run([compiler, *c_compiler_flags, c_file, '-o', os.path.join(tmp_path, 'f.so')],
+                               check=True, capture_output=True)
+        except subprocess.CalledProcessError as e:
+            logging.logwarn(f'Failed to compile C code, falling back to casadi\'s virtual machine: {e.stderr}')
+            return f
+        except (OSError, RuntimeError) as e:
+            logging.logwarn(f'Failed to generate C code, falling back to casadi\'s virtual machine: {e}')
+            return f
+        path = c_code_cache.get(key)
+        if path is None:
+            logging.logwarn('C code cache is too small, falling back to casadi\'s virtual machine.')
+            return f
+    try:
+        return ca.external(f.name(), os.path.join(path, 'f.so'))
+    except (OSError, RuntimeError) as e:
+        # e.g. a truncated library, remove it such that it is compiled again next time
+        logging.logwarn(f'Failed to load compiled C code, falling back to casadi\'s virtual machine: {e}')
+        c_code_cache.delete(key)
+        return f
+
 
 class CompiledFunction:
-    def __init__(self, str_params, fast_f, shape):
+    def __init__(self, str_params, fast_f, shape, c_code_cache: Optional[LRUFileCache] = None):
+        """
+        :param c_code_cache: if not None, fast_f is compiled to C code, which is stored in this cache
+        """
         self.str_params = str_params
+        # the casadi function is kept around for serialization, in case fast_f is compiled to C code
+        self.casadi_f = fast_f
+        if c_code_cache is not None:
+            fast_f = compile_to_c(fast_f, c_code_cache)
         self.fast_f = fast_f
         self.shape = shape
         self.buf, self.f_eval = fast_f.buffer()
         self.out = np.zeros(self.shape, order='F')
         self.buf.set_res(0, memoryview(self.out))  # type: ignore
+        # mapped versions of fast_f, by number of evaluations and threads
+        self.batch_fs: Dict[Tuple[int, int], ca.Function] = {}
         if len(str_params) == 0:
             self.f_eval()
             self.__call__ = lambda **kwargs: self.out
@@ -32,16 +95,54 @@ class CompiledFunction:
         filtered_args = [kwargs[k] for k in self.str_params]
         return self.call2(filtered_args)
 
-    def call2(self, filtered_args):
+    def save(self, file_name: str):
         """
-        :param filtered_args: parameter values in the same order as in self.str_params
+        Serializes the casadi function to file_name and the parameter names to file_name.json.
         """
+        self.casadi_f.save(file_name)
+        with open(f'{file_name}.json', 'w') as f:
+            json.dump({'str_params': self.str_params}, f)
 
-        filtered_args = np.array(filtered_args, dtype=float)
+    @classmethod
+    def load(cls, file_name: str, c_code_cache: Optional[LRUFileCache] = None) -> CompiledFunction:
+        with open(f'{file_name}.json', 'r') as f:
+            meta_data = json.load(f)
+        fast_f = ca.Function.load(file_name)
+        return cls(meta_data['str_params'], fast_f, fast_f.size_out(0), c_code_cache=c_code_cache)
+
+    def call2(self, filtered_args):
+        """
+        :param filtered_args: parameter values in the same order as in self.str_params,
+                                float arrays are used without copying them
+        """
+        filtered_args = np.asarray(filtered_args, dtype=float)
         self.buf.set_arg(0, memoryview(filtered_args))  # type: ignore
         self.f_eval()
         return self.out
 
+    def call2_batch(self, filtered_args: np.ndarray, number_of_threads: int = 1) -> np.ndarray:
+        """
+        Evaluates the function for many parameter vectors with a single call.
+        :param filtered_args: shape (number of evaluations, len(self.str_params))
+        :param number_of_threads: if > 1, the evaluations are distributed over this many threads
+        :return: dense array of shape (number of evaluations, *self.shape)
+        """
+        filtered_args = np.asarray(filtered_args, dtype=float)
+        number_of_evaluations = filtered_args.shape[0]
+        if len(self.str_params) == 0:
+            return np.repeat(self.out[None], number_of_evaluations, axis=0)
+        # max and min of this module create expressions
+        number_of_threads = int(np.clip(number_of_threads, 1, number_of_evaluations))
+        key = (number_of_evaluations, number_of_threads)
+        if key not in self.batch_fs:
+            if number_of_threads > 1:
+                self.batch_fs[key] = self.fast_f.map(number_of_evaluations, 'thread', number_of_threads)
+            else:
+                self.batch_fs[key] = self.fast_f.map(number_of_evaluations)
+        result = self.batch_fs[key](filtered_args.T).full()
+        # the results of all evaluations are stacked horizontally
+        return result.reshape(self.shape[0], number_of_evaluations, self.shape[1]).transpose(1, 0, 2)
+
 
 def _operation_type_error(arg1, operation, arg2):
     return TypeError(f'unsupported operand type(s) for {operation}: \'{arg1.__class__.__name__}\' '
@@ -89,7 +190,13 @@ class Symbol_:
         else:
             return np.array(ca.evalf(self.s))
 
-    def compile(self, parameters=None):
+    def compile(self, parameters=None, c_code_cache: Optional[LRUFileCache] = None):
+        """
+        :param parameters: symbols in the order in which their values will be passed to call2
+        :param c_code_cache: if not None, the expression is compiled to C code with the system's C compiler,
+                        instead of being evaluated by casadi's virtual machine.
+                        The shared libraries are stored in this cache.
+        """
         if parameters is None:
             parameters = self.free_symbols()
         str_params = [str(x) for x in parameters]
@@ -99,7 +206,7 @@ class Symbol_:
             f = ca.Function('f', parameters, [ca.densify(self.s)])
         except Exception:
             f = ca.Function('f', parameters, ca.densify(self.s))
-        return CompiledFunction(str_params, f, self.shape)
+        return CompiledFunction(str_params, f, self.shape, c_code_cache=c_code_cache)
 
 
 class Symbol(Symbol_):
@@ -23,6 +23,7 @@ class CollisionCheckerLib(Enum):
     bpb = 1
     pybullet = 2
     none = 3
+    primitives = 4
 
 
 class SupportedQPSolver(Enum):
@@ -57,6 +58,26 @@ class GeneralConfig:
         self.path_to_data_folder: str = resolve_ros_iris('package://giskardpy/tmp/')
         self.test_mode: bool = False
         self.debug: bool = False
+        # size of the cache for shared libraries in MB, 0 means expressions are evaluated with casadi's virtual machine
+        self.c_code_cache_size: float = 0
+        # number of forked processes used to compute self collision matrices, 0 means one per cpu
+        self.self_collision_matrix_processes: int = 1
+        # size of the cache for self collision matrices in MB, 0 turns it off
+        self.self_collision_matrix_cache_size: float = 10
+        # link pairs that are far apart are not checked for up to this many control cycles, 0 turns it off
+        self.collision_check_max_skipped_ticks: int = 0
+        # size of the cache for preprocessed collision meshes in MB
+        self.mesh_cache_size: float = 100
+        # number of spawned processes used to preprocess collision meshes, 0 means one per cpu
+        self.mesh_preprocessing_processes: int = 1
+        # max number of vertices per convex part of collision meshes, 0 means no simplification
+        self.collision_mesh_vertex_budget: int = 0
+        # voxel size of the distance fields of static environment objects, 0 turns them off
+        self.collision_distance_field_resolution: float = 0
+        # distance fields extend this far beyond the bounding box of the objects
+        self.collision_distance_field_padding: float = 0.3
+        # size of the cache for distance fields in MB
+        self.collision_distance_field_cache_size: float = 1000
         self.joint_limits: Dict[Derivatives, Dict[PrefixName, float]] = {
             Derivatives.velocity: defaultdict(lambda: 1),
             Derivatives.acceleration: defaultdict(lambda: 1e3),
@@ -73,13 +94,17 @@ class QPSolverConfig:
                  added_slack: float = 100,
                  sample_period: float = 0.05,
                  weight_factor: float = 100,
-                 joint_weights: Optional[Dict[Derivatives, Dict[PrefixName, float]]] = None):
+                 joint_weights: Optional[Dict[Derivatives, Dict[PrefixName, float]]] = None,
+                 mask_zero_weight_slacks: bool = False,
+                 controller_cache_size: float = 0):
         self.qp_solver = qp_solver
         self.prediction_horizon = prediction_horizon
         self.retries_with_relaxed_constraints = retries_with_relaxed_constraints
         self.added_slack = added_slack
         self.sample_period = sample_period
         self.weight_factor = weight_factor
+        self.mask_zero_weight_slacks = mask_zero_weight_slacks
+        self.controller_cache_size = controller_cache_size
         if joint_weights is None:
             self.joint_weights = {
                 Derivatives.velocity: defaultdict(lambda: 0.001),
@@ -163,6 +188,9 @@ class BehaviorTreeConfig:
             'enabled': True,
             'in_planning_loop': False
         },
+        'CollisionChecker': {
+            'pipelined': False
+        },
         'PublishDebugExpressions': {
             'enabled': False,
             'enabled_base': False,
@@ -148,6 +148,20 @@ class Giskard:
         self.behavior_tree_config.plugin_config['CollisionMarker']['enabled'] = enabled
         self.behavior_tree_config.plugin_config['CollisionMarker']['in_planning_loop'] = in_planning_loop
 
+    def configure_CollisionChecker(self, pipelined: bool = False):
+        """
+        :param pipelined: whether collisions are checked on a worker thread, while the rest of the control loop runs.
+                            The controller then uses collision data that is one control step old, except in the first
+                            step of a goal. Speeds up the control loop, if collision checking and solving the QP take
+                            similarly long.
+                            The worker thread must not read the world, while the control loop changes it. Everything
+                            the collision check needs, e.g. the fks and, if set_collision_check_max_skipped_ticks is
+                            used, the link motion bounds, is computed before the check is handed to the worker.
+                            Collision checkers that read the world in check_collisions itself, must do that in
+                            prepare_collision_check instead to support this mode.
+        """
+        self.behavior_tree_config.plugin_config['CollisionChecker']['pipelined'] = pipelined
+
     def configure_PlotTrajectory(self, enabled: bool = False, normalize_position: bool = False):
         self.behavior_tree_config.plugin_config['PlotTrajectory']['enabled'] = enabled
         self.behavior_tree_config.plugin_config['PlotTrajectory']['normalize_position'] = normalize_position
@@ -375,6 +389,10 @@ class Giskard:
             except ImportError as e:
                 logging.logerr(f'{e}; turning off collision avoidance.')
                 self._collision_checker = CollisionCheckerLib.none
+        if self._collision_checker == CollisionCheckerLib.primitives:
+            logging.loginfo('Using capsule approximations for collision checking.')
+            from giskardpy.model.primitive_syncer import PrimitiveSyncer
+            return PrimitiveSyncer(world)
         if self._collision_checker == CollisionCheckerLib.none:
             logging.logwarn('Using no collision checking.')
             from giskardpy.model.collision_world_syncer import CollisionWorldSynchronizer
@@ -560,6 +578,72 @@ class Giskard:
                     self.ignore_self_collisions_of_pair(link1, link2, group_name)
         logging.loginfo(f'loaded {path_to_srdf} for self collision avoidance matrix')
 
+    def set_self_collision_matrix_processes(self, number_of_processes: int):
+        """
+        The self collision matrix is computed by moving each joint through its range and checking which links can
+        touch. These checks can be distributed over number_of_processes processes, which are forked from Giskard's
+        process. Forking a process that already runs other threads can deadlock, if one of them holds a lock at that
+        moment, therefore this is off by default.
+        :param number_of_processes: 1 does all checks in Giskard's process, 0 uses one process per cpu
+        """
+        self._general_config.self_collision_matrix_processes = number_of_processes
+
+    def set_self_collision_matrix_cache_size(self, size_in_mb: float):
+        """
+        Computed self collision matrices are saved in the tmp folder and reused, if the robot model and
+        collision avoidance config did not change.
+        :param size_in_mb: 0 turns the cache off
+        """
+        self._general_config.self_collision_matrix_cache_size = size_in_mb
+
+    def set_collision_check_max_skipped_ticks(self, ticks: int):
+        """
+        Link pairs, that can't get closer than their collision avoidance threshold within the next control cycles,
+        are not checked during these cycles. How fast links can approach each other is estimated using the velocity
+        limits of the controlled joints. Only used by the betterpybullet collision checker.
+        :param ticks: upper bound for how many control cycles a link pair is skipped, 0 turns it off
+        """
+        self._general_config.collision_check_max_skipped_ticks = ticks
+
+    def set_mesh_preprocessing(self,
+                               cache_size_in_mb: Optional[float] = None,
+                               processes: Optional[int] = None,
+                               vertex_budget: Optional[int] = None):
+        """
+        Collision meshes are split into convex parts, which are stored in a cache in the tmp folder, keyed by the
+        content of the mesh files. Only meshes that are not in the cache are preprocessed.
+        :param cache_size_in_mb: old entries are deleted, if the cache gets bigger than this
+        :param processes: number of processes used for preprocessing, 1 does it in Giskard's process, 0 means one per
+                          cpu. The processes are spawned instead of forked, which makes them slower to start.
+        :param vertex_budget: max number of vertices per convex part, 0 means no simplification
+        """
+        if cache_size_in_mb is not None:
+            self._general_config.mesh_cache_size = cache_size_in_mb
+        if processes is not None:
+            self._general_config.mesh_preprocessing_processes = processes
+        if vertex_budget is not None:
+            self._general_config.collision_mesh_vertex_budget = vertex_budget
+
+    def set_collision_distance_fields(self,
+                                      resolution: float,
+                                      padding: Optional[float] = None,
+                                      cache_size_in_mb: Optional[float] = None):
+        """
+        Collisions between robots and environment objects without movable joints are computed by looking up spheres,
+        which cover the robot links, in a precomputed signed distance field of each object.
+        The distance fields are stored in a cache in the tmp folder, keyed by the shape of the objects.
+        Only supported by the betterpybullet and primitives collision checkers.
+        :param resolution: voxel size in m, 0 turns distance fields off
+        :param padding: the distance fields extend this far beyond the objects, should be bigger than the
+                        largest collision avoidance threshold
+        :param cache_size_in_mb: old entries are deleted, if the cache gets bigger than this
+        """
+        self._general_config.collision_distance_field_resolution = resolution
+        if padding is not None:
+            self._general_config.collision_distance_field_padding = padding
+        if cache_size_in_mb is not None:
+            self._general_config.collision_distance_field_cache_size = cache_size_in_mb
+
     def ignore_all_self_collisions_of_link(self, link_name: str, group_name: Optional[str] = None):
         """
         Completely turn off self collision avoidance for this link.
@@ -635,6 +719,32 @@ class Giskard:
     def set_qp_solver(self, new_solver: SupportedQPSolver):
         self._qp_solver_config.qp_solver = new_solver
 
+    def set_mask_zero_weight_slacks(self, new_value: bool = True):
+        """
+        If True, slack variables of constraints with weight 0 stay in the qp, they are fixed to 0 and their
+        constraints are relaxed. The shape and sparsity of the qp then stays the same for the whole goal,
+        which allows solvers to reuse their setup between control cycles.
+        If False, they are removed from the qp.
+        """
+        self._qp_solver_config.mask_zero_weight_slacks = new_value
+
+    def set_compile_to_c_code(self, cache_size_in_mb: float = 500):
+        """
+        Compile the controller and forward kinematics to C code with the system's C compiler, instead of evaluating
+        them with casadi's virtual machine. Falls back to the virtual machine, if no compiler is found.
+        The shared libraries are cached in the tmp folder.
+        :param cache_size_in_mb: 0 turns C code generation off
+        """
+        self._general_config.c_code_cache_size = cache_size_in_mb
+
+    def set_controller_cache_size(self, size_in_mb: float):
+        """
+        Compiled controllers are saved in the tmp folder and reused, if a goal results in the same controller.
+        The least recently used controllers are deleted, once the cache grows larger than size_in_mb.
+        :param size_in_mb: 0 turns the cache off
+        """
+        self._qp_solver_config.controller_cache_size = size_in_mb
+
     def set_default_joint_limits(self,
                                  velocity_limit: float = 1,
                                  acceleration_limit: Optional[float] = 1e3,
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 from collections import defaultdict, deque
-from copy import deepcopy
-from typing import Optional, Dict
+from collections.abc import MutableMapping
+from itertools import count
+from typing import Optional, Dict, List, Union
 
+import numpy as np
 from sensor_msgs.msg import JointState
 
 from giskardpy.my_types import PrefixName, Derivatives
@@ -46,6 +48,15 @@ class FIFOSet(set):
 
 
 class _JointState:
+    """
+    State of a single free variable.
+    If it belongs to a JointStates, it is a view on one row of JointStates.data.
+    """
+    # object whose _data holds the state, either the JointStates it belongs to or itself
+    _storage: Union[JointStates, _JointState]
+    _index: int
+    _data: np.ndarray
+
     def __init__(self,
                  position: float = 0,
                  velocity: float = 0,
@@ -54,80 +65,93 @@ class _JointState:
                  snap: float = 0,
                  crackle: float = 0,
                  pop: float = 0):
-        self.state: Dict[Derivatives, float] = {
-            Derivatives.position: position,
-            Derivatives.velocity: velocity,
-            Derivatives.acceleration: acceleration,
-            Derivatives.jerk: jerk,
-            Derivatives.snap: snap,
-            Derivatives.crackle: crackle,
-            Derivatives.pop: pop,
-        }
+        self._data = np.array([[position, velocity, acceleration, jerk, snap, crackle, pop]], dtype=float)
+        self._storage = self
+        self._index = 0
+
+    @classmethod
+    def _view(cls, storage: JointStates, index: int) -> _JointState:
+        self = cls.__new__(cls)
+        self._storage = storage
+        self._index = index
+        return self
+
+    def _detach(self):
+        """
+        Turns this view into a standalone state, with a copy of the current values.
+        """
+        self._data = self._storage._data[self._index:self._index + 1].copy()
+        self._storage = self
+        self._index = 0
+
+    @property
+    def state(self) -> np.ndarray:
+        return self._storage._data[self._index]
 
     def __getitem__(self, derivative):
-        return self.state[derivative]
+        return self._storage._data[self._index, derivative]
 
     def __setitem__(self, derivative, value):
-        self.state[derivative] = value
+        self._storage._data[self._index, derivative] = value
 
     @property
     def position(self) -> float:
-        return self.state[Derivatives.position]
+        return self._storage._data[self._index, Derivatives.position]
 
     @position.setter
     def position(self, value: float):
-        self.state[Derivatives.position] = value
+        self._storage._data[self._index, Derivatives.position] = value
 
     @property
     def velocity(self) -> float:
-        return self.state[Derivatives.velocity]
+        return self._storage._data[self._index, Derivatives.velocity]
 
     @velocity.setter
     def velocity(self, value: float):
-        self.state[Derivatives.velocity] = value
+        self._storage._data[self._index, Derivatives.velocity] = value
 
     @property
     def acceleration(self) -> float:
-        return self.state[Derivatives.acceleration]
+        return self._storage._data[self._index, Derivatives.acceleration]
 
     @acceleration.setter
     def acceleration(self, value: float):
-        self.state[Derivatives.acceleration] = value
+        self._storage._data[self._index, Derivatives.acceleration] = value
 
     @property
     def jerk(self) -> float:
-        return self.state[Derivatives.jerk]
+        return self._storage._data[self._index, Derivatives.jerk]
 
     @jerk.setter
     def jerk(self, value: float):
-        self.state[Derivatives.jerk] = value
+        self._storage._data[self._index, Derivatives.jerk] = value
 
     @property
     def snap(self) -> float:
-        return self.state[Derivatives.snap]
+        return self._storage._data[self._index, Derivatives.snap]
 
     @snap.setter
     def snap(self, value: float):
-        self.state[Derivatives.snap] = value
+        self._storage._data[self._index, Derivatives.snap] = value
 
     @property
     def crackle(self) -> float:
-        return self.state[Derivatives.crackle]
+        return self._storage._data[self._index, Derivatives.crackle]
 
     @crackle.setter
     def crackle(self, value: float):
-        self.state[Derivatives.crackle] = value
+        self._storage._data[self._index, Derivatives.crackle] = value
 
     @property
     def pop(self) -> float:
-        return self.state[Derivatives.pop]
+        return self._storage._data[self._index, Derivatives.pop]
 
     @pop.setter
     def pop(self, value: float):
-        self.state[Derivatives.pop] = value
+        self._storage._data[self._index, Derivatives.pop] = value
 
     def set_derivative(self, d: Derivatives, item: float):
-        self.state[d] = item
+        self._storage._data[self._index, d] = item
 
     def __str__(self):
         return f'{self.position}'
@@ -136,37 +160,148 @@ class _JointState:
         return str(self)
 
     def __deepcopy__(self, memodict=None):
-        return _JointState(self.position, self.velocity, self.acceleration, self.jerk, self.snap, self.crackle,
-                           self.pop)
+        return _JointState(*self.state)
 
 
-class JointStates(defaultdict):
+class JointStates(MutableMapping):
+    """
+    Maps free variable names to their _JointState.
+    All states are stored in one (number of free variables, number of derivatives) array, self.data,
+    the _JointStates are views on its rows.
+    Like a defaultdict, accessing an unknown name adds a state with all derivatives set to 0.
+    """
+    _versions = count()
+
     def __init__(self, *args, **kwargs):
-        super().__init__(_JointState, *args, **kwargs)
+        self._data = np.zeros((8, len(Derivatives)))
+        self._names: List[PrefixName] = []
+        self._index: Dict[PrefixName, int] = {}
+        self._views: Dict[PrefixName, _JointState] = {}
+        self.version = next(self._versions)
+        self.update(*args, **kwargs)
+
+    @property
+    def data(self) -> np.ndarray:
+        """
+        The rows are in the same order as self.keys().
+        """
+        return self._data[:len(self._names)]
+
+    @property
+    def names(self) -> List[PrefixName]:
+        return self._names
+
+    def index(self, name: PrefixName) -> int:
+        """
+        :return: row of name in self.data, the row is added if name is unknown
+        """
+        try:
+            return self._index[name]
+        except KeyError:
+            self._add(name)
+            return self._index[name]
+
+    def _add(self, name: PrefixName, values: Optional[np.ndarray] = None):
+        i = len(self._names)
+        if i == self._data.shape[0]:
+            new_data = np.zeros((max(8, self._data.shape[0] * 2), len(Derivatives)))
+            new_data[:i] = self._data[:i]
+            self._data = new_data
+        if values is None:
+            self._data[i] = 0
+        else:
+            self._data[i] = values
+        self._names.append(name)
+        self._index[name] = i
+        # the names changed, cached indices are no longer valid
+        self.version = next(self._versions)
+
+    def __getitem__(self, name: PrefixName) -> _JointState:
+        try:
+            return self._views[name]
+        except KeyError:
+            view = self._views[name] = _JointState._view(self, self.index(name))
+            return view
+
+    def __setitem__(self, name: PrefixName, joint_state: _JointState):
+        """
+        Copies the values of joint_state, later changes to joint_state don't affect self[name].
+        """
+        if name in self._index:
+            self._data[self._index[name]] = joint_state.state
+        else:
+            self._add(name, joint_state.state)
+
+    def __delitem__(self, name: PrefixName):
+        i = self._index.pop(name)
+        view = self._views.pop(name, None)
+        if view is not None:
+            view._detach()
+        n = len(self._names)
+        self._data[i:n - 1] = self._data[i + 1:n]
+        del self._names[i]
+        for j, moved_name in enumerate(self._names[i:], start=i):
+            self._index[moved_name] = j
+            if moved_name in self._views:
+                self._views[moved_name]._index = j
+        self.version = next(self._versions)
+
+    def __contains__(self, name) -> bool:
+        return name in self._index
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def get(self, name, default=None):
+        if name in self._index:
+            return self[name]
+        return default
+
+    def update(self, *args, **kwargs):
+        if len(args) == 1 and not kwargs and isinstance(args[0], JointStates):
+            other = args[0]
+            for name in other._names:
+                if name not in self._index:
+                    self._add(name)
+            rows = np.fromiter((self._index[name] for name in other._names), dtype=int, count=len(other))
+            self._data[rows] = other.data
+        else:
+            super().update(*args, **kwargs)
+
+    @classmethod
+    def from_array(cls, names: List[PrefixName], data: np.ndarray) -> JointStates:
+        """
+        :param data: (len(names), number of derivatives) array, which is used without copying it
+        """
+        self = cls()
+        self._data = data
+        self._names = list(names)
+        self._index = {name: i for i, name in enumerate(self._names)}
+        return self
 
     @classmethod
     def from_msg(cls, msg: JointState, prefix: Optional[str] = None) -> JointStates:
         self = cls()
         for i, joint_name in enumerate(msg.name):
             joint_name = PrefixName(joint_name, prefix)
-            sjs = _JointState(position=msg.position[i],
-                              velocity=0,
-                              acceleration=0,
-                              jerk=0,
-                              snap=0,
-                              crackle=0,
-                              pop=0)
-            self[joint_name] = sjs
+            self._add(joint_name)
+            self._data[self._index[joint_name], Derivatives.position] = msg.position[i]
         return self
 
     def __deepcopy__(self, memodict={}):
         new_js = JointStates()
-        for joint_name, joint_state in self.items():
-            new_js[joint_name] = deepcopy(joint_state)
+        new_js._data = self._data.copy()
+        new_js._names = list(self._names)
+        new_js._index = dict(self._index)
+        # same names in the same order
+        new_js.version = self.version
         return new_js
 
     def to_position_dict(self):
-        return {k: v.position for k, v in self.items()}
+        return dict(zip(self._names, self.data[:, Derivatives.position]))
 
     def pretty_print(self):
         for joint_name, joint_state in self.items():
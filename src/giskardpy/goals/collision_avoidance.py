@@ -1,254 +1,207 @@
-from typing import Dict, Optional
+from typing import Dict, List, Tuple
 
 import giskardpy.utils.tfwrapper as tf
 from giskardpy import casadi_wrapper as w, identifier
 from giskardpy.goals.goal import Goal, WEIGHT_COLLISION_AVOIDANCE, WEIGHT_ABOVE_CA
+from giskardpy.model.collision_world_syncer import Collisions
 from giskardpy.my_types import my_string
 
 
 class ExternalCollisionAvoidance(Goal):
 
     def __init__(self,
-                 link_name: my_string,
                  robot_name: str,
-                 max_velocity: float = 0.2,
-                 hard_threshold: float = 0.0,
-                 soft_thresholds: Optional[Dict[my_string, float]] = None,
-                 idx: int = 0,
-                 num_repeller: int = 1):
+                 link_names: List[my_string],
+                 hard_thresholds: Dict[my_string, float],
+                 number_of_repellers: Dict[my_string, int],
+                 max_velocity: float = 0.2):
         """
         Don't use me
+        Pushes all link_names away from their closest external contacts. The fk of each link is shared by its
+        repellers, contact data and soft thresholds are read from Collisions.external_collision_data.
+        :param hard_thresholds: maps each link to its hard threshold
+        :param number_of_repellers: maps each link to its number of repellers
         """
+        self.robot_name = robot_name
+        self.link_names = link_names
+        self.hard_thresholds = hard_thresholds
+        self.number_of_repellers = number_of_repellers
         self.max_velocity = max_velocity
-        self.hard_threshold = hard_threshold
-        self.soft_thresholds = soft_thresholds
-        self.num_repeller = num_repeller
-        self.link_name = link_name
-        self.idx = idx
         super().__init__()
         self.root = self.world.root_link_name
-        self.robot_name = robot_name
-
-    # def get_contact_normal_on_b_in_root(self):
-    #     return self.god_map.list_to_vector3(identifier.closest_point + ['get_external_collisions',
-    #                                                                           (self.link_name,),
-    #                                                                           self.idx,
-    #                                                                           'root_V_n'])
-
-    def map_V_n_symbol(self):
-        return self.god_map.list_to_vector3(identifier.closest_point + ['get_external_collisions',
-                                                                        (self.link_name,),
-                                                                        self.idx,
-                                                                        'map_V_n'])
-
-    def get_closest_point_on_a_in_a(self):
-        return self.god_map.list_to_point3(identifier.closest_point + ['get_external_collisions',
-                                                                       (self.link_name,),
-                                                                       self.idx,
-                                                                       'new_a_P_pa'])
-
-    def map_P_a_symbol(self):
-        return self.god_map.list_to_point3(identifier.closest_point + ['get_external_collisions',
-                                                                       (self.link_name,),
-                                                                       self.idx,
-                                                                       'new_map_P_pa'])
-
-    # def get_closest_point_on_b_in_root(self):
-    #     return self.god_map.list_to_point3(identifier.closest_point + ['get_external_collisions',
-    #                                                                          (self.link_name,),
-    #                                                                          self.idx,
-    #                                                                          'root_P_b'])
-
-    def get_actual_distance(self):
-        return self.god_map.to_symbol(identifier.closest_point + ['get_external_collisions',
-                                                                  (self.link_name,),
-                                                                  self.idx,
-                                                                  'contact_distance'])
-
-    def get_link_b_hash(self):
-        return self.god_map.to_symbol(identifier.closest_point + ['get_external_collisions',
-                                                                  (self.link_name,),
-                                                                  self.idx,
-                                                                  'link_b_hash'])
-
-    def get_number_of_external_collisions(self):
-        return self.god_map.to_symbol(identifier.closest_point + ['get_number_of_external_collisions',
-                                                                  (self.link_name,)])
+        self.collision_scene = self.god_map.get_data(identifier.collision_scene)
+
+    def get_data_symbol(self, link_name: my_string, idx: int, field: str) -> w.Symbol:
+        column = Collisions.external_data_columns[field]
+        return self.god_map.to_symbol(identifier.closest_point + ['external_collision_data',
+                                                                  self.collision_scene.get_link_id(link_name),
+                                                                  idx,
+                                                                  column])
+
+    def get_data_vector(self, link_name: my_string, idx: int, field: str) -> List[w.Symbol]:
+        column = Collisions.external_data_columns[field]
+        return [self.god_map.to_symbol(identifier.closest_point + ['external_collision_data',
+                                                                   self.collision_scene.get_link_id(link_name),
+                                                                   idx,
+                                                                   column + i]) for i in range(3)]
 
     @profile
     def make_constraints(self):
-        a_P_pa = self.get_closest_point_on_a_in_a()
-        map_V_n = self.map_V_n_symbol()
-        actual_distance = self.get_actual_distance()
         sample_period = self.sample_period
-        number_of_external_collisions = self.get_number_of_external_collisions()
-
-        map_T_a = self.get_fk(self.root, self.link_name)
-
-        map_P_pa = map_T_a.dot(a_P_pa)
-
-        # the position distance is not accurate, but the derivative is still correct
-        dist = map_V_n.dot(map_P_pa)
-
         qp_limits_for_lba = self.max_velocity * sample_period * self.control_horizon
-
-        soft_threshold = 0
-        actual_link_b_hash = self.get_link_b_hash()
-        parent_joint = self.world.links[self.link_name].parent_joint_name
-        direct_children = set(self.world.get_directly_controlled_child_links_with_collisions(parent_joint))
-        b_result_cases = [(k[1].__hash__(), v) for k, v in self.soft_thresholds.items() if k[0] in direct_children]
-        soft_threshold = w.if_eq_cases(a=actual_link_b_hash,
-                                       b_result_cases=b_result_cases,
-                                       else_result=soft_threshold)
-
-        hard_threshold = w.min(self.hard_threshold, soft_threshold / 2)
-        lower_limit = soft_threshold - actual_distance
-
-        lower_limit_limited = w.limit(lower_limit,
-                                      -qp_limits_for_lba,
-                                      qp_limits_for_lba)
-
-        upper_slack = w.if_greater(actual_distance, hard_threshold,
-                                   w.limit(soft_threshold - hard_threshold,
-                                           -qp_limits_for_lba,
-                                           qp_limits_for_lba),
-                                   lower_limit_limited)
-        # undo factor in A
-        upper_slack /= (sample_period * self.prediction_horizon)
-
-        upper_slack = w.if_greater(actual_distance, 50,  # assuming that distance of unchecked closest points is 100
-                                   1e4,
-                                   w.max(0, upper_slack))
-
-        weight = w.if_greater(actual_distance, 50, 0, WEIGHT_COLLISION_AVOIDANCE)
-
-        weight = w.save_division(weight,  # divide by number of active repeller per link
-                                 w.min(number_of_external_collisions, self.num_repeller))
-        # if self.link_name == 'base_footprint' and self.idx <= 1:
-        #     self.add_debug_expr('soft_threshold', soft_threshold)
-        #     self.add_debug_expr('weight', weight)
-        #     self.add_debug_expr('soft_threshold', soft_threshold)
-        #     self.add_debug_expr('dist', dist)
-        #     self.add_debug_expr('actual_distance', actual_distance)
-        self.add_constraint(reference_velocity=self.max_velocity,
-                            lower_error=lower_limit,
-                            upper_error=100,
-                            weight=weight,
-                            task_expression=dist,
-                            lower_slack_limit=-1e4,
-                            upper_slack_limit=upper_slack)
+        for link_name in self.link_names:
+            # shared by all repellers of this link
+            map_T_a = self.get_fk(self.root, link_name)
+            number_of_external_collisions = self.get_data_symbol(link_name, 0, 'number_of_contacts')
+            num_repeller = self.number_of_repellers[link_name]
+            for idx in range(num_repeller):
+                a_P_pa = w.Point3(self.get_data_vector(link_name, idx, 'new_a_P_pa'))
+                map_V_n = w.Vector3(self.get_data_vector(link_name, idx, 'map_V_n'))
+                actual_distance = self.get_data_symbol(link_name, idx, 'contact_distance')
+                soft_threshold = self.get_data_symbol(link_name, idx, 'soft_threshold')
+
+                map_P_pa = map_T_a.dot(a_P_pa)
+
+                # the position distance is not accurate, but the derivative is still correct
+                dist = map_V_n.dot(map_P_pa)
+
+                hard_threshold = w.min(self.hard_thresholds[link_name], soft_threshold / 2)
+                lower_limit = soft_threshold - actual_distance
+
+                lower_limit_limited = w.limit(lower_limit,
+                                              -qp_limits_for_lba,
+                                              qp_limits_for_lba)
+
+                upper_slack = w.if_greater(actual_distance, hard_threshold,
+                                           w.limit(soft_threshold - hard_threshold,
+                                                   -qp_limits_for_lba,
+                                                   qp_limits_for_lba),
+                                           lower_limit_limited)
+                # undo factor in A
+                upper_slack /= (sample_period * self.prediction_horizon)
+
+                upper_slack = w.if_greater(actual_distance, 50,  # assuming that distance of unchecked closest points is 100
+                                           1e4,
+                                           w.max(0, upper_slack))
+
+                weight = w.if_greater(actual_distance, 50, 0, WEIGHT_COLLISION_AVOIDANCE)
+
+                weight = w.save_division(weight,  # divide by number of active repeller per link
+                                         w.min(number_of_external_collisions, num_repeller))
+                self.add_constraint(reference_velocity=self.max_velocity,
+                                    lower_error=lower_limit,
+                                    upper_error=100,
+                                    weight=weight,
+                                    task_expression=dist,
+                                    name=f'/{link_name}/{idx}',
+                                    lower_slack_limit=-1e4,
+                                    upper_slack_limit=upper_slack)
 
     def __str__(self):
         s = super().__str__()
-        return f'{s}/{self.link_name}/{self.idx}'
+        return f'{s}/{self.robot_name}'
 
 
 class SelfCollisionAvoidance(Goal):
 
     def __init__(self,
-                 link_a: my_string,
-                 link_b: my_string,
                  robot_name: str,
-                 max_velocity: float = 0.2,
-                 hard_threshold: float = 0.0,
-                 soft_threshold: float = 0.05,
-                 idx: float = 0,
-                 num_repeller: int = 1):
-        self.link_a = link_a
-        self.link_b = link_b
+                 link_pairs: List[Tuple[my_string, my_string]],
+                 hard_thresholds: Dict[Tuple[my_string, my_string], float],
+                 soft_thresholds: Dict[Tuple[my_string, my_string], float],
+                 number_of_repellers: Dict[Tuple[my_string, my_string], int],
+                 max_velocity: float = 0.2):
+        """
+        Don't use me
+        Pushes the links of all link_pairs away from each other. Contact data is read from
+        Collisions.self_collision_data.
+        :param link_pairs: (link_a, link_b) with link_a < link_b
+        """
+        self.robot_name = robot_name
+        self.link_pairs = link_pairs
+        self.hard_thresholds = hard_thresholds
+        self.soft_thresholds = soft_thresholds
+        self.number_of_repellers = number_of_repellers
         self.max_velocity = max_velocity
-        self.hard_threshold = hard_threshold
-        self.soft_threshold = soft_threshold
-        self.num_repeller = num_repeller
-        self.idx = idx
-        if self.link_a.prefix != self.link_b.prefix:
-            raise Exception(f'Links {self.link_a} and {self.link_b} have different prefix.')
+        for link_a, link_b in self.link_pairs:
+            if link_a.prefix != link_b.prefix:
+                raise Exception(f'Links {link_a} and {link_b} have different prefix.')
         super().__init__()
         self.root = self.world.root_link_name
-        self.robot_name = robot_name
-
-    def get_contact_normal_in_b(self):
-        return self.god_map.list_to_vector3(identifier.closest_point + ['get_self_collisions',
-                                                                        (self.link_a, self.link_b),
-                                                                        self.idx,
-                                                                        'new_b_V_n'])
-
-    def get_position_on_a_in_a(self):
-        return self.god_map.list_to_point3(identifier.closest_point + ['get_self_collisions',
-                                                                       (self.link_a, self.link_b),
-                                                                       self.idx,
-                                                                       'new_a_P_pa'])
-
-    def get_b_T_pb(self) -> w.TransMatrix:
-        return self.god_map.list_to_translation3(identifier.closest_point + ['get_self_collisions',
-                                                                             (self.link_a, self.link_b),
-                                                                             self.idx,
-                                                                             'new_b_P_pb'])
-
-    def get_actual_distance(self):
-        return self.god_map.to_symbol(identifier.closest_point + ['get_self_collisions',
-                                                                  (self.link_a, self.link_b),
-                                                                  self.idx,
-                                                                  'contact_distance'])
-
-    def get_number_of_self_collisions(self):
-        return self.god_map.to_symbol(identifier.closest_point + ['get_number_of_self_collisions',
-                                                                  (self.link_a, self.link_b)])
+        self.collision_scene = self.god_map.get_data(identifier.collision_scene)
+
+    def get_data_symbol(self, link_pair: Tuple[my_string, my_string], idx: int, field: str) -> w.Symbol:
+        column = Collisions.self_data_columns[field]
+        return self.god_map.to_symbol(identifier.closest_point + ['self_collision_data',
+                                                                  self.collision_scene.get_pair_id(*link_pair),
+                                                                  idx,
+                                                                  column])
+
+    def get_data_vector(self, link_pair: Tuple[my_string, my_string], idx: int, field: str) -> List[w.Symbol]:
+        column = Collisions.self_data_columns[field]
+        return [self.god_map.to_symbol(identifier.closest_point + ['self_collision_data',
+                                                                   self.collision_scene.get_pair_id(*link_pair),
+                                                                   idx,
+                                                                   column + i]) for i in range(3)]
 
     @profile
     def make_constraints(self):
-        hard_threshold = w.min(self.hard_threshold, self.soft_threshold / 2)
-        actual_distance = self.get_actual_distance()
-        number_of_self_collisions = self.get_number_of_self_collisions()
         sample_period = self.sample_period
-
-        # b_T_a2 = self.get_fk_evaluated(self.link_b, self.link_a)
-        b_T_a = self.get_fk(self.link_b, self.link_a)
-        pb_T_b = self.get_b_T_pb().inverse()
-        a_P_pa = self.get_position_on_a_in_a()
-
-        pb_V_n = self.get_contact_normal_in_b()
-
-        pb_P_pa = pb_T_b.dot(b_T_a).dot(a_P_pa)
-
-        dist = pb_V_n.dot(pb_P_pa)
-
-        weight = w.if_greater(actual_distance, 50, 0, WEIGHT_COLLISION_AVOIDANCE)
-        weight = w.save_division(weight,  # divide by number of active repeller per link
-                                 w.min(number_of_self_collisions, self.num_repeller))
-
         qp_limits_for_lba = self.max_velocity * sample_period * self.control_horizon
-
-        lower_limit = self.soft_threshold - actual_distance
-
-        lower_limit_limited = w.limit(lower_limit,
-                                      -qp_limits_for_lba,
-                                      qp_limits_for_lba)
-
-        upper_slack = w.if_greater(actual_distance, hard_threshold,
-                                   w.limit(self.soft_threshold - hard_threshold,
-                                           -qp_limits_for_lba,
-                                           qp_limits_for_lba),
-                                   lower_limit_limited)
-
-        # undo factor in A
-        upper_slack /= (sample_period * self.prediction_horizon)
-
-        upper_slack = w.if_greater(actual_distance, 50,  # assuming that distance of unchecked closest points is 100
-                                   1e4,
-                                   w.max(0, upper_slack))
-
-        self.add_constraint(reference_velocity=self.max_velocity,
-                            lower_error=lower_limit,
-                            upper_error=100,
-                            weight=weight,
-                            task_expression=dist,
-                            lower_slack_limit=-1e4,
-                            upper_slack_limit=upper_slack)
+        for link_pair in self.link_pairs:
+            link_a, link_b = link_pair
+            b_T_a = self.get_fk(link_b, link_a)
+            number_of_self_collisions = self.get_data_symbol(link_pair, 0, 'number_of_contacts')
+            soft_threshold = self.soft_thresholds[link_pair]
+            hard_threshold = min(self.hard_thresholds[link_pair], soft_threshold / 2)
+            num_repeller = self.number_of_repellers[link_pair]
+            # only the closest contact of each pair is avoided, num_repeller only normalizes the weight
+            idx = 0
+            actual_distance = self.get_data_symbol(link_pair, idx, 'contact_distance')
+            pb_T_b = w.TransMatrix.from_xyz_rpy(*self.get_data_vector(link_pair, idx, 'new_b_P_pb')).inverse()
+            a_P_pa = w.Point3(self.get_data_vector(link_pair, idx, 'new_a_P_pa'))
+
+            pb_V_n = w.Vector3(self.get_data_vector(link_pair, idx, 'new_b_V_n'))
+
+            pb_P_pa = pb_T_b.dot(b_T_a).dot(a_P_pa)
+
+            dist = pb_V_n.dot(pb_P_pa)
+
+            weight = w.if_greater(actual_distance, 50, 0, WEIGHT_COLLISION_AVOIDANCE)
+            weight = w.save_division(weight,  # divide by number of active repeller per link
+                                     w.min(number_of_self_collisions, num_repeller))
+
+            lower_limit = soft_threshold - actual_distance
+
+            lower_limit_limited = w.limit(lower_limit,
+                                          -qp_limits_for_lba,
+                                          qp_limits_for_lba)
+
+            upper_slack = w.if_greater(actual_distance, hard_threshold,
+                                       w.limit(soft_threshold - hard_threshold,
+                                               -qp_limits_for_lba,
+                                               qp_limits_for_lba),
+                                       lower_limit_limited)
+
+            # undo factor in A
+            upper_slack /= (sample_period * self.prediction_horizon)
+
+            upper_slack = w.if_greater(actual_distance, 50,  # assuming that distance of unchecked closest points is 100
+                                       1e4,
+                                       w.max(0, upper_slack))
+
+            self.add_constraint(reference_velocity=self.max_velocity,
+                                lower_error=lower_limit,
+                                upper_error=100,
+                                weight=weight,
+                                task_expression=dist,
+                                name=f'/{link_a}/{link_b}/{idx}',
+                                lower_slack_limit=-1e4,
+                                upper_slack_limit=upper_slack)
 
     def __str__(self):
         s = super().__str__()
-        return f'{s}/{self.link_a}/{self.link_b}/{self.idx}'
+        return f'{s}/{self.robot_name}'
 
 
 class CollisionAvoidanceHint(Goal):
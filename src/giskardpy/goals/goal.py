@@ -3,6 +3,7 @@ from __future__ import annotations
 import abc
 from abc import ABC
 from collections import OrderedDict
+from itertools import chain
 from typing import Optional, Tuple, Dict, List, Union, Callable
 
 import giskardpy.identifier as identifier
@@ -212,6 +213,9 @@ class Goal(ABC):
             self._constraints.update(_prepend_prefix(self.__class__.__name__, c))
             self._velocity_constraints.update(_prepend_prefix(self.__class__.__name__, c_vel))
             self._debug_expressions.update(_prepend_prefix(self.__class__.__name__, debug_expressions))
+        # the qp controller uses this to group constraints by goal, sub goals get overwritten by their parent
+        for constraint in chain(self._constraints.values(), self._velocity_constraints.values()):
+            constraint.goal_name = str(self)
         return self._constraints, self._velocity_constraints, self._debug_expressions
 
     def add_constraints_of_goal(self, goal: Goal):
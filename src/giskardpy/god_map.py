@@ -10,7 +10,9 @@ from geometry_msgs.msg import Pose, Point, Vector3, PoseStamped, PointStamped, V
     Quaternion
 
 from giskardpy import casadi_wrapper as w
-from giskardpy.data_types import KeyDefaultDict
+from giskardpy.data_types import KeyDefaultDict, JointStates
+from giskardpy.exceptions import GiskardException
+from giskardpy.my_types import Derivatives
 from giskardpy.utils.singleton import SingletonMeta
 
 
@@ -182,6 +184,130 @@ def get_data(identifier: Sequence[Union[str, int, Sequence[Union[str, int]]]], d
     return result, shortcut
 
 
+class _ParameterGroup:
+    """
+    Symbols whose values are stored in the same container, e.g. the _JointState of a joint or a numpy array.
+    """
+
+    def __init__(self, container_identifier: tuple, buffer_indices: list, members: list):
+        """
+        :param container_identifier: identifier of the container, () for the root of the god map
+        :param buffer_indices: where the values are written to in the buffer
+        :param members: for each symbol the identifier of its value relative to the container
+        """
+        self.container_identifier = container_identifier
+        self.buffer_indices = np.array(buffer_indices, dtype=int)
+        self.members = members
+        self.shortcuts = [None] * len(members)
+        self.array_indices = None
+        if all(type(m) is int for member in members for m in member) and len({len(m) for m in members}) == 1:
+            self.array_indices = tuple(np.array(index, dtype=int) for index in zip(*members))
+
+    def fill(self, buffer: np.ndarray, god_map: 'GodMap'):
+        if self.container_identifier:
+            container = god_map.unsafe_get_data(self.container_identifier)
+        else:
+            container = god_map._data
+        if self.array_indices is not None \
+                and isinstance(container, np.ndarray) \
+                and container.ndim == len(self.array_indices):
+            buffer[self.buffer_indices] = container[self.array_indices]
+            return
+        for i, buffer_index in enumerate(self.buffer_indices):
+            shortcut = self.shortcuts[i]
+            if shortcut is None:
+                buffer[buffer_index], self.shortcuts[i] = get_data(self.members[i], container)
+            else:
+                buffer[buffer_index] = shortcut.c(container)
+
+
+class _JointStatesGroup:
+    """
+    Symbols whose values are stored in the same JointStates, they are copied with a single indexing operation.
+    """
+
+    def __init__(self, container_identifier: tuple, buffer_indices: list, names: list, derivatives: list):
+        self.container_identifier = container_identifier
+        self.buffer_indices = np.array(buffer_indices, dtype=int)
+        self.names = names
+        self.derivatives = np.array(derivatives, dtype=int)
+        self.rows = None
+        self.version = None
+
+    def fill(self, buffer: np.ndarray, god_map: 'GodMap'):
+        joint_states: JointStates = god_map.unsafe_get_data(self.container_identifier)
+        if self.version != joint_states.version:
+            self.rows = np.array([joint_states.index(name) for name in self.names], dtype=int)
+            self.version = joint_states.version
+        buffer[self.buffer_indices] = joint_states.data[self.rows, self.derivatives]
+
+
+class ParameterPlan:
+    """
+    Gathers the values of a fixed list of symbols into a preallocated buffer.
+    Symbols are grouped by the container that holds their values, such that each container is only looked up once.
+    Values stored in numpy arrays, like the results of compute_fk_np, or in JointStates are copied with a single
+    indexing operation.
+    """
+
+    def __init__(self, god_map: 'GodMap', symbols: Sequence[str]):
+        self.god_map = god_map
+        self.symbols = list(symbols)
+        self.buffer = np.zeros(len(self.symbols))
+        groups = defaultdict(lambda: ([], []))
+        joint_states_groups = defaultdict(lambda: ([], [], []))
+        is_joint_states = {}
+        for buffer_index, symbol in enumerate(self.symbols):
+            identifier = tuple(self.god_map.expr_to_key[symbol])
+            if len(identifier) > 2 and isinstance(identifier[-1], Derivatives):
+                joint_states_identifier = identifier[:-2]
+                if joint_states_identifier not in is_joint_states:
+                    try:
+                        joint_states = self.god_map.unsafe_get_data(joint_states_identifier)
+                        is_joint_states[joint_states_identifier] = isinstance(joint_states, JointStates)
+                    except Exception:
+                        is_joint_states[joint_states_identifier] = False
+                if is_joint_states[joint_states_identifier]:
+                    buffer_indices, names, derivatives = joint_states_groups[joint_states_identifier]
+                    buffer_indices.append(buffer_index)
+                    names.append(identifier[-2])
+                    derivatives.append(identifier[-1])
+                    continue
+            # trailing ints are indices into a potential numpy array
+            number_of_indices = 0
+            for member in reversed(identifier[1:]):
+                if type(member) is not int:
+                    break
+                number_of_indices += 1
+            number_of_indices = max(number_of_indices, 1)
+            buffer_indices, members = groups[identifier[:-number_of_indices]]
+            buffer_indices.append(buffer_index)
+            members.append(identifier[-number_of_indices:])
+        self.groups = [_ParameterGroup(container_identifier, buffer_indices, members)
+                       for container_identifier, (buffer_indices, members) in groups.items()]
+        self.groups.extend(_JointStatesGroup(container_identifier, buffer_indices, names, derivatives)
+                           for container_identifier, (buffer_indices, names, derivatives)
+                           in joint_states_groups.items())
+
+    def get_values(self) -> np.ndarray:
+        with self.god_map.lock:
+            return self.unsafe_get_values()
+
+    def unsafe_get_values(self) -> np.ndarray:
+        """
+        :return: the values of the symbols in the same order in which they were passed to __init__.
+                    The buffer is reused for every call.
+        """
+        for group in self.groups:
+            try:
+                group.fill(self.buffer, self.god_map)
+            except (KeyError, IndexError, AttributeError) as e:
+                raise type(e)(f'{e}; path: {group.container_identifier}') from e
+            except Exception as e:
+                raise GiskardException(f'{type(e).__name__}: {e}; path: {group.container_identifier}') from e
+        return self.buffer
+
+
 class GodMap(metaclass=SingletonMeta):
     """
     Data structure used by tree to exchange information.
@@ -404,6 +530,12 @@ class GodMap(metaclass=SingletonMeta):
         """
         return [self.unsafe_get_data(self.expr_to_key[expr]) for expr in symbols]
 
+    def create_parameter_plan(self, symbols: Sequence[str]) -> ParameterPlan:
+        """
+        Use this instead of get_values, if the values of the same symbols are needed repeatedly.
+        """
+        return ParameterPlan(self, symbols)
+
     def evaluate_expr(self, expr: w.Expression):
         if isinstance(expr, (int, float)):
             return expr
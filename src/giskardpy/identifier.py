@@ -46,6 +46,16 @@ general_options = giskard + ['_general_config']
 max_derivative = general_options + ['maximum_derivative']
 action_server_name = general_options + ['action_server_name']
 tmp_folder = general_options + ['path_to_data_folder']
+c_code_cache_size = general_options + ['c_code_cache_size']
+self_collision_matrix_processes = general_options + ['self_collision_matrix_processes']
+self_collision_matrix_cache_size = general_options + ['self_collision_matrix_cache_size']
+collision_check_max_skipped_ticks = general_options + ['collision_check_max_skipped_ticks']
+mesh_cache_size = general_options + ['mesh_cache_size']
+mesh_preprocessing_processes = general_options + ['mesh_preprocessing_processes']
+collision_mesh_vertex_budget = general_options + ['collision_mesh_vertex_budget']
+collision_distance_field_resolution = general_options + ['collision_distance_field_resolution']
+collision_distance_field_padding = general_options + ['collision_distance_field_padding']
+collision_distance_field_cache_size = general_options + ['collision_distance_field_cache_size']
 debug_expr_needed = ['debug_expr_needed']
 test_mode = general_options + ['test_mode']
 control_mode = general_options + ['control_mode']
@@ -70,6 +80,8 @@ prediction_horizon = qp_solver_config + ['prediction_horizon']
 retries_with_relaxed_constraints = qp_solver_config + ['retries_with_relaxed_constraints']
 retry_added_slack = qp_solver_config + ['added_slack']
 retry_weight_factor = qp_solver_config + ['weight_factor']
+mask_zero_weight_slacks = qp_solver_config + ['mask_zero_weight_slacks']
+controller_cache_size = qp_solver_config + ['controller_cache_size']
 
 # tree
 plugins = giskard + ['behavior_tree_config', 'plugin_config']
@@ -78,6 +90,7 @@ VisualizationBehavior_in_planning_loop = plugins + ['VisualizationBehavior', 'in
 enable_WorldVisualizationBehavior = plugins + ['WorldVisualizationBehavior', 'enabled']
 enable_CPIMarker = plugins + ['CollisionMarker', 'enabled']
 CPIMarker_in_planning_loop = plugins + ['CollisionMarker', 'in_planning_loop']
+CollisionChecker_pipelined = plugins + ['CollisionChecker', 'pipelined']
 
 PlotTrajectory = plugins + ['PlotTrajectory']
 PlotTrajectory_enabled = PlotTrajectory + ['enabled']
@@ -120,6 +133,7 @@ tree_tick_rate = giskard + ['behavior_tree_config', 'tree_tick_rate']
 collision_avoidance_configs = giskard + ['_collision_avoidance_configs']
 collision_scene = ['collision_scene']
 collision_matrix = ['collision_matrix']
+external_collision_soft_thresholds = ['external_collision_soft_thresholds']
 closest_point = ['cpi']
 added_collision_checks = ['added_collision_checks']
 
@@ -1,25 +1,50 @@
 from collections import defaultdict
+from typing import Sequence, Tuple, Dict, List, NamedTuple
 
 import betterpybullet as bpb
+import numpy as np
 from betterpybullet import ClosestPair
 from betterpybullet import ContactPoint
 from geometry_msgs.msg import PoseStamped, Quaternion
 from sortedcontainers import SortedDict
 
+from giskardpy import identifier
 from giskardpy.model.bpb_wrapper import create_cube_shape, create_object, create_sphere_shape, create_cylinder_shape, \
     load_convex_mesh_shape
 from giskardpy.model.collision_world_syncer import CollisionWorldSynchronizer, Collision, Collisions
+from giskardpy.model.distance_field import DistanceFieldChecker
+from giskardpy.model.joints import PrismaticJoint, RevoluteJoint, ParameterizedFixedJoint
 from giskardpy.model.links import BoxGeometry, SphereGeometry, CylinderGeometry, MeshGeometry, Link
+from giskardpy.my_types import PrefixName, Derivatives
 from giskardpy.utils import logging
+from giskardpy.utils.mesh_cache import preprocess_meshes
+from giskardpy.utils.time_collector import TimeCollector
+
+
+class FilteredClosestPair(NamedTuple):
+    obj_b: bpb.CollisionObject
+    points: List[ContactPoint]
 
 
 class BetterPyBulletSyncer(CollisionWorldSynchronizer):
+    # how a joint moves a link in compute_link_motion_bounds
+    prismatic_term = 0
+    revolute_term = 1
+    other_term = 2
+
     def __init__(self, world):
         self.kw = bpb.KineverseWorld()
         self.object_name_to_id = defaultdict(list)
         self.query = None
+        self.pair_skip_ticks = None
+        self.synced_state_version = None
+        self.pushed_collision_fks = None
+        self.controlled_state_names_key = None
+        self.link_motion_bounds_key = None
+        self.is_prepared = False
+        self.time_collector = TimeCollector()
         super().__init__(world)
-
+        self.distance_fields = DistanceFieldChecker(self)
 
     @profile
     def add_object(self, link: Link):
@@ -33,8 +58,8 @@ class BetterPyBulletSyncer(CollisionWorldSynchronizer):
             elif isinstance(geometry, CylinderGeometry):
                 shape = create_cylinder_shape(geometry.radius * 2, geometry.height)
             elif isinstance(geometry, MeshGeometry):
+                # geometry.file_name stays the original mesh, the convex parts in the mesh cache can get evicted
                 shape = load_convex_mesh_shape(geometry.file_name, scale=geometry.scale)
-                geometry.file_name = 'file://' + shape.file_path
             else:
                 raise NotImplementedError()
             map_T_o = bpb.Transform()
@@ -46,6 +71,10 @@ class BetterPyBulletSyncer(CollisionWorldSynchronizer):
 
     def reset_cache(self):
         self.query = None
+        self.is_prepared = False
+        self.pair_skip_ticks = None
+        self.synced_state_version = None
+        self.pushed_collision_fks = None
         for method_name in dir(self):
             try:
                 getattr(self, method_name).memo.clear()
@@ -56,12 +85,187 @@ class BetterPyBulletSyncer(CollisionWorldSynchronizer):
     def cut_off_distances_to_query(self, cut_off_distances, buffer=0.05):
         if self.query is None:
             self.query = defaultdict(set)
+            pairs = []
             for (link_a, link_b), dist in cut_off_distances.items():
                 for collision_object_a in self.object_name_to_id[link_a]:
                     for collision_object_b in self.object_name_to_id[link_b]:
                         self.query[collision_object_a].add((collision_object_b, dist+buffer))
+                        pairs.append((collision_object_a, collision_object_b, link_a, link_b, dist+buffer))
+            self.init_pair_skip_ticks(pairs)
         return self.query
 
+    def init_pair_skip_ticks(self, pairs: List[tuple]):
+        """
+        Sets up the per pair arrays used by get_closest_with_skipping.
+        :param pairs: (collision object a, collision object b, link a, link b, cut off distance)
+        """
+        self.pair_objects = [(obj_a, obj_b) for obj_a, obj_b, _, _, _ in pairs]
+        self.pair_index = {pair: i for i, pair in enumerate(self.pair_objects)}
+        self.pair_cut_offs = np.array([dist for _, _, _, _, dist in pairs], dtype=float)
+        self.pair_skip_ticks = np.zeros(len(pairs), dtype=int)
+        self.motion_links = list({link for _, _, link_a, link_b, _ in pairs for link in (link_a, link_b)})
+        link_index = {link_name: i for i, link_name in enumerate(self.motion_links)}
+        self.pair_link_a = np.array([link_index[link_a] for _, _, link_a, _, _ in pairs], dtype=int)
+        self.pair_link_b = np.array([link_index[link_b] for _, _, _, link_b, _ in pairs], dtype=int)
+        self.uncontrolled_state_version = None
+        self.uncontrolled_state = None
+        self.link_motion_bounds_key = None
+
+    def controlled_state_names(self) -> set:
+        key = (self.world.model_version, self.world.controlled_joints_version)
+        if self.controlled_state_names_key != key:
+            result = set()
+            for joint_name in self.world.controlled_joints:
+                joint = self.world.joints[joint_name]
+                result.update(free_variable.name for free_variable in joint.free_variables)
+                result.update(joint.get_position_variables())
+            self.controlled_state_names_cache = result
+            self.controlled_state_names_key = key
+        return self.controlled_state_names_cache
+
+    @profile
+    def has_uncontrolled_state_changed(self) -> bool:
+        """
+        :return: True, if a free variable, that is not moved by the controller, or the pose of a group changed since
+                    the last call.
+        """
+        state = self.world.state
+        if self.uncontrolled_state_version != state.version:
+            controlled = self.controlled_state_names()
+            self.uncontrolled_rows = np.array([i for i, name in enumerate(state.names) if name not in controlled],
+                                              dtype=int)
+            self.parameterized_joints = [joint for joint in self.world.joints.values()
+                                         if isinstance(joint, ParameterizedFixedJoint)]
+            self.uncontrolled_state_version = state.version
+            self.uncontrolled_state = None
+        uncontrolled_state = np.concatenate([state.data[self.uncontrolled_rows, 0]] +
+                                            [joint.parent_T_child_np[:3].ravel() for joint in self.parameterized_joints])
+        changed = self.uncontrolled_state is None or not np.array_equal(uncontrolled_state, self.uncontrolled_state)
+        self.uncontrolled_state = uncontrolled_state
+        return changed
+
+    def init_link_motion_bounds(self):
+        """
+        Collects, which controlled free variables move the links in self.motion_links and through which joints.
+        Every (link, joint, free variable) combination is one term of the sum in compute_link_motion_bounds.
+        Links without controlled joints don't get any terms.
+        """
+        controlled = self.controlled_state_names()
+        root = self.world.root_link_name
+        _, link_index = self.compute_all_fks_np()
+        free_variable_index = {}
+        self.motion_free_variables = []
+        self.motion_link_fk_rows = np.array([link_index[link_name] for link_name in self.motion_links], dtype=int)
+        self.motion_link_radii = np.array([self.world.links[link_name].bounding_radius()
+                                           for link_name in self.motion_links])
+        term_links, term_joint_fk_rows, term_free_variables, term_multipliers, term_kinds = [], [], [], [], []
+        for i, link_name in enumerate(self.motion_links):
+            for joint_name in self.world.compute_chain(root, link_name, add_joints=True, add_links=False,
+                                                       add_fixed_joints=False, add_non_controlled_joints=True):
+                joint = self.world.joints[joint_name]
+                for free_variable in getattr(joint, 'free_variables', []):
+                    if free_variable.name not in controlled:
+                        continue
+                    if free_variable.name not in free_variable_index:
+                        free_variable_index[free_variable.name] = len(self.motion_free_variables)
+                        self.motion_free_variables.append(free_variable)
+                    term_links.append(i)
+                    term_joint_fk_rows.append(link_index[joint.child_link_name])
+                    term_free_variables.append(free_variable_index[free_variable.name])
+                    if isinstance(joint, PrismaticJoint):
+                        term_multipliers.append(abs(joint.multiplier))
+                        term_kinds.append(self.prismatic_term)
+                    elif isinstance(joint, RevoluteJoint):
+                        term_multipliers.append(abs(joint.multiplier))
+                        term_kinds.append(self.revolute_term)
+                    else:
+                        term_multipliers.append(1)
+                        term_kinds.append(self.other_term)
+        self.term_links = np.array(term_links, dtype=int)
+        self.term_joint_fk_rows = np.array(term_joint_fk_rows, dtype=int)
+        self.term_free_variables = np.array(term_free_variables, dtype=int)
+        self.term_multipliers = np.array(term_multipliers, dtype=float)
+        self.term_kinds = np.array(term_kinds, dtype=int)
+        self.link_motion_bounds_key = (self.world.model_version, self.world.controlled_joints_version)
+
+    @profile
+    def compute_link_motion_bounds(self) -> np.ndarray:
+        """
+        Estimates how far each link in self.motion_links can move in one control cycle, using the velocity limits
+        of the controlled free variables and the distance of the link to the joints that move it.
+        The lever arms are evaluated at the current configuration.
+        :return: upper bound of the distance per link, inf if a velocity limit is unknown
+        """
+        if self.link_motion_bounds_key != (self.world.model_version, self.world.controlled_joints_version):
+            self.init_link_motion_bounds()
+        sample_period = self.god_map.get_data(identifier.sample_period)
+        # None becomes nan
+        velocity_limits = np.array([free_variable.get_upper_limit(Derivatives.velocity, default=False, evaluated=True)
+                                    for free_variable in self.motion_free_variables], dtype=float)
+        steps = np.abs(velocity_limits) * sample_period
+        steps[np.isnan(steps)] = np.inf
+        map_T_links, _ = self.compute_all_fks_np()
+        map_P_links = map_T_links[self.motion_link_fk_rows[self.term_links], :3, 3]
+        map_P_joints = map_T_links[self.term_joint_fk_rows, :3, 3]
+        levers = np.linalg.norm(map_P_links - map_P_joints, axis=1) + self.motion_link_radii[self.term_links]
+        levers = np.where(self.term_kinds == self.prismatic_term, 1,
+                          np.where(self.term_kinds == self.revolute_term, levers, np.maximum(1, levers)))
+        term_steps = steps[self.term_free_variables]
+        with np.errstate(invalid='ignore'):
+            terms = np.where(np.isinf(term_steps), np.inf, term_steps * self.term_multipliers * levers)
+        return np.bincount(self.term_links, weights=terms, minlength=len(self.motion_links))
+
+    @profile
+    def get_closest_with_skipping(self, max_skipped_ticks: int) -> Dict[bpb.CollisionObject, List[ClosestPair]]:
+        """
+        Same result as get_closest_filtered_POD_batch(self.query), but pairs that can't get within their cut off
+        distance in the next ticks, are not checked during these ticks.
+        Checked pairs are queried with their cut off distance extended by how far they can approach each other in
+        max_skipped_ticks ticks. The returned distance tells how many ticks the pair can safely be skipped.
+        All pairs are checked again, if free variables which are not controlled by Giskard change.
+        Uses the link motion bounds computed by prepare_collision_check, this method doesn't read the world.
+        """
+        pair_motion = self.link_motion[self.pair_link_a] + self.link_motion[self.pair_link_b]
+        active = np.flatnonzero(self.pair_skip_ticks <= 0)
+        query_cut_offs = self.pair_cut_offs[active] + max_skipped_ticks * pair_motion[active]
+        query_cut_offs[~np.isfinite(query_cut_offs)] = self.pair_cut_offs[active][~np.isfinite(query_cut_offs)]
+        query = defaultdict(set)
+        for i, cut_off in zip(active, query_cut_offs):
+            obj_a, obj_b = self.pair_objects[i]
+            query[obj_a].add((obj_b, cut_off))
+
+        distances = np.full(len(self.pair_objects), np.inf)
+        result = {}
+        for obj_a, contacts in self.kw.get_closest_filtered_POD_batch(query).items():
+            filtered_contacts = []
+            for contact in contacts:  # type: ClosestPair
+                i = self.pair_index[obj_a, contact.obj_b]
+                if contact.points:
+                    distances[i] = min(p.distance for p in contact.points)
+                points = [p for p in contact.points if p.distance <= self.pair_cut_offs[i]]
+                if points:
+                    filtered_contacts.append(FilteredClosestPair(contact.obj_b, points))
+            result[obj_a] = filtered_contacts
+
+        self.pair_skip_ticks -= 1
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # number of ticks after which the pair could be within its cut off distance
+            skip_ticks = np.ceil((distances[active] - self.pair_cut_offs[active]) / pair_motion[active]) - 1
+        skip_ticks[~np.isfinite(pair_motion[active]) | np.isnan(skip_ticks)] = 0
+        self.pair_skip_ticks[active] = np.clip(skip_ticks, 0, max_skipped_ticks)
+        return result
+
+    def prepare_collision_check(self, cut_off_distances):
+        if self.distance_fields.is_enabled():
+            cut_off_distances = self.distance_fields.split_cut_off_distances(cut_off_distances)
+        self.cut_off_distances_to_query(cut_off_distances)
+        self.max_skipped_ticks = self.god_map.get_data(identifier.collision_check_max_skipped_ticks)
+        if self.max_skipped_ticks > 0:
+            if self.has_uncontrolled_state_changed():
+                self.pair_skip_ticks[:] = 0
+            self.link_motion = self.compute_link_motion_bounds()
+        self.is_prepared = True
+
     @profile
     def check_collisions(self, cut_off_distances, collision_list_sizes):
         """
@@ -74,11 +278,18 @@ class BetterPyBulletSyncer(CollisionWorldSynchronizer):
         :return: (robot_link, body_b, link_b) -> Collision
         :rtype: Collisions
         """
+        if not self.is_prepared:
+            self.prepare_collision_check(cut_off_distances)
+        self.is_prepared = False
+        if self.max_skipped_ticks > 0:
+            result = self.get_closest_with_skipping(self.max_skipped_ticks)
+        else:
+            result = self.kw.get_closest_filtered_POD_batch(self.query)
 
-        query = self.cut_off_distances_to_query(cut_off_distances)
-        result = self.kw.get_closest_filtered_POD_batch(query)
-
-        return self.bpb_result_to_collisions(result, collision_list_sizes)
+        collisions = self.bpb_result_to_collisions(result, collision_list_sizes)
+        if self.distance_fields.is_enabled():
+            self.distance_fields.add_collisions(collisions)
+        return collisions
 
     @profile
     def bpb_result_to_list(self, result):
@@ -111,9 +322,29 @@ class BetterPyBulletSyncer(CollisionWorldSynchronizer):
 
     @profile
     def bpb_result_to_collisions(self, result, collision_list_size):
+        link_a, link_b, contact_distance = [], [], []
+        map_T_a, map_T_b, a_P_pa, b_P_pb, map_V_n = [], [], [], [], []
+        for obj_a, contacts in result.items():
+            if not contacts:
+                continue
+            for contact in contacts:  # type: ClosestPair
+                for p in contact.points:  # type: ContactPoint
+                    link_a.append(obj_a.name)
+                    link_b.append(contact.obj_b.name)
+                    contact_distance.append(p.distance)
+                    map_T_a.append(obj_a.np_transform)
+                    map_T_b.append(contact.obj_b.np_transform)
+                    a_P_pa.append(p.point_a.reshape(4))
+                    b_P_pb.append(p.point_b.reshape(4))
+                    map_V_n.append(p.normal_world_b.reshape(4))
         collisions = Collisions(collision_list_size)
-        for c in self.bpb_result_to_list(result):
-            collisions.add(c)
+        if contact_distance:
+            collisions.add_batch(link_a=link_a,
+                                 link_b=link_b,
+                                 contact_distance=contact_distance,
+                                 map_P_pa=np.einsum('nij,nj->ni', np.array(map_T_a), np.array(a_P_pa)),
+                                 map_P_pb=np.einsum('nij,nj->ni', np.array(map_T_b), np.array(b_P_pb)),
+                                 map_V_n=map_V_n)
         return collisions
 
     def check_collision(self, link_a, link_b, distance):
@@ -122,6 +353,76 @@ class BetterPyBulletSyncer(CollisionWorldSynchronizer):
         query[self.object_name_to_id[link_a]].add((self.object_name_to_id[link_b], distance))
         return self.kw.get_closest_filtered_POD_batch(query)
 
+    @profile
+    def check_collisions_batch(self,
+                               free_variable_names: Sequence[PrefixName],
+                               positions: np.ndarray,
+                               link_combinations: Sequence[Tuple[PrefixName, PrefixName]],
+                               cut_off_distance: float) -> np.ndarray:
+        """
+        Computes the distances between link pairs for many configurations, with one query per configuration.
+        The collision objects are moved back to the current state afterwards.
+        :param positions: shape (number of configurations, len(free_variable_names)),
+                            free variables that are not in free_variable_names keep their current position
+        :return: shape (number of configurations, len(link_combinations)), the distance of each link pair or inf,
+                    if it is further away than cut_off_distance
+        """
+        self.sync()
+        positions = np.asarray(positions, dtype=float)
+        distances = np.full((len(positions), len(link_combinations)), np.inf)
+        if len(link_combinations) == 0:
+            return distances
+        query = defaultdict(set)
+        pair_indices = defaultdict(list)
+        for i, (link_a, link_b) in enumerate(link_combinations):
+            pair_indices[link_a, link_b].append(i)
+            for collision_object_a in self.object_name_to_id[link_a]:
+                for collision_object_b in self.object_name_to_id[link_b]:
+                    query[collision_object_a].add((collision_object_b, cut_off_distance))
+        for configuration, map_T_objects in enumerate(self.world.compute_all_fks_matrix_batch(free_variable_names,
+                                                                                              positions)):
+            bpb.batch_set_transforms(self.objects_in_order, np.asfortranarray(map_T_objects))
+            for obj_a, contacts in self.kw.get_closest_filtered_POD_batch(query).items():
+                for contact in contacts:  # type: ClosestPair
+                    if not contact.points:
+                        continue
+                    indices = pair_indices[obj_a.name, contact.obj_b.name]
+                    distance = min(p.distance for p in contact.points)
+                    distances[configuration, indices] = np.minimum(distances[configuration, indices], distance)
+        bpb.batch_set_transforms(self.objects_in_order, self.world.compute_all_fks_matrix())
+        return distances
+
+    def in_collision_batch(self,
+                           free_variable_names: Sequence[PrefixName],
+                           positions: np.ndarray,
+                           link_combinations: Sequence[Tuple[PrefixName, PrefixName]],
+                           distance: float) -> np.ndarray:
+        """
+        :return: shape (number of configurations, len(link_combinations)), True if a link pair is closer than distance
+        """
+        return self.check_collisions_batch(free_variable_names, positions, link_combinations, distance) < distance
+
+    def check_collisions2(self, link_combinations, distance):
+        link_combinations = list(link_combinations)
+        in_collision = self.in_collision_batch([], np.zeros((1, 0)), link_combinations, distance)[0]
+        return {link_combination for link_combination, x in zip(link_combinations, in_collision) if x}
+
+    def in_collision_at(self, joint_state, link_combinations, distance):
+        free_variable_names = [name for name in joint_state if name in self.world.free_variables]
+        positions = np.array([[joint_state[name] for name in free_variable_names]])
+        in_collision = self.in_collision_batch(free_variable_names, positions, link_combinations, distance)[0]
+        return {self.world.sort_links(*link_combination)
+                for link_combination, x in zip(link_combinations, in_collision) if x}
+
+    def in_collision_during(self, joint_names, positions, link_combinations, distance):
+        link_combinations = list(link_combinations)
+        columns = [i for i, name in enumerate(joint_names) if name in self.world.free_variables]
+        free_variable_names = [joint_names[i] for i in columns]
+        positions = np.asarray(positions, dtype=float)[:, columns]
+        in_collision = self.in_collision_batch(free_variable_names, positions, link_combinations, distance).any(axis=0)
+        return {self.world.sort_links(*link_combination)
+                for link_combination, x in zip(link_combinations, in_collision) if x}
+
     @profile
     def in_collision(self, link_a, link_b, distance):
         result = False
@@ -140,14 +441,40 @@ class BetterPyBulletSyncer(CollisionWorldSynchronizer):
                 self.kw.remove_collision_object(o)
             self.object_name_to_id = defaultdict(list)
 
+            preprocess_meshes(geometry.file_name for link_name in self.world.link_names_with_collisions
+                              for geometry in self.world.links[link_name].collisions
+                              if isinstance(geometry, MeshGeometry))
             for link_name in self.world.link_names_with_collisions:
                 link = self.world.links[link_name]
                 self.add_object(link)
             self.objects_in_order = [x for link_name in self.world._fk_computer.collision_link_order for x in self.object_name_to_id[link_name]]
             # self.objects_in_order = [self.object_name_to_id[link_name] for link_name in self.world.link_names_with_collisions]
-            bpb.batch_set_transforms(self.objects_in_order, self.world.compute_all_fks_matrix())
+            if self.distance_fields.is_enabled():
+                self.distance_fields.sync()
             # self.update_collision_blacklist()
-        bpb.batch_set_transforms(self.objects_in_order, self.world.compute_all_fks_matrix())
+        if self.synced_state_version != self.world.state_version:
+            self.push_changed_transforms()
+            self.synced_state_version = self.world.state_version
+
+    @profile
+    def push_changed_transforms(self):
+        """
+        Moves the collision objects whose pose changed since the last push to their current pose.
+        """
+        map_T_objects = self.world.compute_all_fks_matrix()
+        if self.pushed_collision_fks is None:
+            bpb.batch_set_transforms(self.objects_in_order, map_T_objects)
+            number_of_pushed_transforms = len(self.objects_in_order)
+        else:
+            changed = np.flatnonzero(np.any(map_T_objects.reshape(-1, 16) != self.pushed_collision_fks.reshape(-1, 16),
+                                            axis=1))
+            if len(changed) > 0:
+                bpb.batch_set_transforms([self.objects_in_order[i] for i in changed],
+                                         np.asfortranarray(map_T_objects.reshape(-1, 4, 4)[changed].reshape(-1, 4)))
+            number_of_pushed_transforms = len(changed)
+        # compute_all_fks_matrix returns a buffer that is overwritten with the next state
+        self.pushed_collision_fks = np.array(map_T_objects)
+        self.time_collector.add_pushed_collision_transforms(number_of_pushed_transforms)
 
     @profile
     def get_pose(self, link_name, collision_id=0):
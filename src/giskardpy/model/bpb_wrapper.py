@@ -1,6 +1,7 @@
 import betterpybullet as pb
 
-from giskardpy.utils.utils import resolve_ros_iris, convert_to_decomposed_obj_and_save_in_tmp
+from giskardpy.utils.mesh_cache import get_convex_parts
+from giskardpy.utils.utils import resolve_ros_iris
 
 
 class MyCollisionObject(pb.CollisionObject):
@@ -73,13 +74,8 @@ def create_compound_shape(shapes_poses=[]):
 # Technically the tracker is not required here,
 # since the loader keeps references to the loaded shapes.
 def load_convex_mesh_shape(pkg_filename: str, single_shape=False, scale=(1, 1, 1)):
-    if pkg_filename.startswith('file://'):
-        pkg_filename = pkg_filename.split('file://')[1]
-    if not pkg_filename.endswith('.obj'):
-        obj_pkg_filename = convert_to_decomposed_obj_and_save_in_tmp(pkg_filename)
-    else:
-        obj_pkg_filename = pkg_filename
-    return pb.load_convex_shape(resolve_ros_iris(obj_pkg_filename),
+    obj_pkg_filename = get_convex_parts(pkg_filename)
+    return pb.load_convex_shape(obj_pkg_filename,
                                 single_shape=single_shape,
                                 scaling=pb.Vector3(scale[0], scale[1], scale[2]))
 
@@ -0,0 +1,81 @@
+import numpy as np
+
+from giskardpy.model.links import LinkGeometry, BoxGeometry, SphereGeometry, CylinderGeometry, MeshGeometry
+from giskardpy.utils.mesh_cache import load_convex_part_vertices
+
+
+def box_to_capsules(center: np.ndarray, axes: np.ndarray, extents: np.ndarray, max_capsules: int) -> np.ndarray:
+    """
+    Covers a box with capsules along its longest axis, placed side by side along its middle axis.
+    :param center: center of the box
+    :param axes: columns are the axes of the box
+    :param extents: full size of the box along each axis
+    :return: shape (number of capsules, 7), each row is start point, end point and radius
+    """
+    order = np.argsort(extents)[::-1]
+    length, width, depth = extents[order]
+    length_axis, width_axis, depth_axis = axes[:, order].T
+    number_of_capsules = int(min(max(np.ceil(width / max(depth, 1e-6) - 1e-9), 1), max_capsules))
+    cell_width = width / number_of_capsules
+    cross_section_radius = np.sqrt(cell_width ** 2 + depth ** 2) / 2
+    # shorten the segment and grow the radius, such that the corners are still covered
+    shortening = min(length / 2, cross_section_radius / 2)
+    radius = np.sqrt(shortening ** 2 + cross_section_radius ** 2)
+    half_segment = (length / 2 - shortening) * length_axis
+    capsules = []
+    for i in range(number_of_capsules):
+        cell_center = center + (-width / 2 + cell_width * (i + 0.5)) * width_axis
+        capsules.append(np.concatenate([cell_center - half_segment, cell_center + half_segment, [radius]]))
+    return np.array(capsules)
+
+
+def geometry_to_capsules(geometry: LinkGeometry, max_capsules: int) -> np.ndarray:
+    """
+    Approximates geometry with capsules that cover it, spheres are capsules of length 0.
+    :return: shape (number of capsules, 7) in the frame of the geometry, each row is start point, end point and radius
+    """
+    if isinstance(geometry, SphereGeometry):
+        return np.array([[0, 0, 0, 0, 0, 0, geometry.radius]], dtype=float)
+    if isinstance(geometry, BoxGeometry):
+        return box_to_capsules(np.zeros(3), np.eye(3), np.array([geometry.depth, geometry.width, geometry.height]),
+                               max_capsules)
+    if isinstance(geometry, CylinderGeometry):
+        if geometry.height < geometry.radius:
+            return box_to_capsules(np.zeros(3), np.eye(3),
+                                   np.array([geometry.radius * 2, geometry.radius * 2, geometry.height]),
+                                   max_capsules)
+        shortening = min(geometry.height / 2, geometry.radius / 2)
+        half_length = geometry.height / 2 - shortening
+        radius = np.sqrt(shortening ** 2 + geometry.radius ** 2)
+        return np.array([[0, 0, -half_length, 0, 0, half_length, radius]], dtype=float)
+    if isinstance(geometry, MeshGeometry):
+        capsules = []
+        for vertices in load_convex_part_vertices(geometry.file_name):
+            vertices = vertices * np.array(geometry.scale)
+            # oriented bounding box from the principal axes of the vertices
+            center = vertices.mean(axis=0)
+            _, _, axes = np.linalg.svd(vertices - center, full_matrices=True)
+            local_vertices = (vertices - center).dot(axes.T)
+            local_min, local_max = local_vertices.min(axis=0), local_vertices.max(axis=0)
+            center = center + ((local_min + local_max) / 2).dot(axes)
+            capsules.append(box_to_capsules(center, axes.T, local_max - local_min, max_capsules))
+        return np.vstack(capsules)
+    raise NotImplementedError(f'{type(geometry)} geometry is not supported')
+
+
+def capsules_to_spheres(capsules: np.ndarray) -> np.ndarray:
+    """
+    Covers each capsule with spheres, whose centers are evenly spaced along its segment.
+    :param capsules: shape (n, 7), each row is start point, end point and radius
+    :return: shape (m, 4), each row is center and radius
+    """
+    spheres = []
+    for capsule in capsules:
+        start, end, radius = capsule[:3], capsule[3:6], capsule[6]
+        length = np.linalg.norm(end - start)
+        number_of_spheres = int(np.ceil(length / radius - 1e-9)) + 1
+        # the spheres have to be bigger than the capsule to cover it between their centers
+        sphere_radius = np.sqrt(radius ** 2 + (length / max(number_of_spheres - 1, 1) / 2) ** 2)
+        for center in np.linspace(start, end, number_of_spheres):
+            spheres.append(np.append(center, sphere_radius))
+    return np.array(spheres).reshape(-1, 4)
@@ -1,10 +1,13 @@
+import multiprocessing
+import os
+import xml.etree.ElementTree as ET
 from collections import defaultdict
 from itertools import product, combinations_with_replacement, combinations
 from time import time
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence, Tuple, Set
+from xml.dom import minidom
 
 import numpy as np
-from sortedcontainers import SortedKeyList
 
 from giskard_msgs.msg import CollisionEntry
 from giskardpy import identifier
@@ -12,10 +15,13 @@ from giskardpy.configs.data_types import CollisionAvoidanceConfig
 from giskardpy.data_types import JointStates
 from giskardpy.exceptions import UnknownGroupException
 from giskardpy.god_map import GodMap
+from giskardpy.model.links import MeshGeometry
 from giskardpy.model.world import WorldBranch
 from giskardpy.model.world import WorldTree
-from giskardpy.my_types import my_string
+from giskardpy.my_types import my_string, PrefixName
 from giskardpy.utils import logging
+from giskardpy.utils.file_cache import LRUFileCache
+from giskardpy.utils.utils import resolve_ros_iris
 
 np.random.seed(1337)
 
@@ -70,6 +76,40 @@ class Collision:
 
 
 class Collisions:
+    """
+    Result of a collision check.
+    All contacts are stored in the structured array self.contacts, links are referenced by their id in the collision
+    scene, see CollisionWorldSynchronizer.get_link_id.
+    For each key, a robot link for external collisions or a link pair for self collisions, the collision_list_size
+    closest contacts are kept in a row of a preallocated table, sorted by contact distance.
+    Unused entries hold default contacts.
+    """
+    dtype = np.dtype([('contact_distance', float),
+                      ('soft_threshold', float),
+                      ('link_b_hash', np.int64),
+                      ('map_P_pa', float, 4),
+                      ('map_P_pb', float, 4),
+                      ('map_V_n', float, 4),
+                      ('new_a_P_pa', float, 4),
+                      ('new_b_P_pb', float, 4),
+                      ('new_b_V_n', float, 4),
+                      ('is_external', bool),
+                      ('link_a', np.int32),
+                      ('link_b', np.int32),
+                      ('original_link_a', np.int32),
+                      ('original_link_b', np.int32)])
+    # columns of external_collision_data and self_collision_data, vectors take 3 columns
+    external_data_columns = {'contact_distance': 0,
+                             'soft_threshold': 1,
+                             'number_of_contacts': 2,
+                             'map_V_n': 3,
+                             'new_a_P_pa': 6}
+    self_data_columns = {'contact_distance': 0,
+                         'number_of_contacts': 1,
+                         'new_b_V_n': 2,
+                         'new_a_P_pa': 5,
+                         'new_b_P_pb': 8}
+
     @profile
     def __init__(self, collision_list_size):
         self.god_map = GodMap()
@@ -78,131 +118,280 @@ class Collisions:
             identifier.collision_avoidance_configs)
         self.fixed_joints = self.collision_scene.fixed_joints
         self.world: WorldTree = self.god_map.get_data(identifier.world)
-        self.collision_list_size = collision_list_size
-
-        # @profile
-        def sort(x):
-            return x.contact_distance
-
-        # @profile
-        def default_f():
-            return SortedKeyList([self._default_collision('', '', '')] * collision_list_size,
-                                 key=sort)
+        self.collision_list_size = int(collision_list_size)
+        try:
+            self.soft_thresholds = self.god_map.get_data(identifier.external_collision_soft_thresholds)
+        except KeyError:
+            self.soft_thresholds = {}
 
-        self.default_result = default_f()
+        self.default_result = self._default_collisions(self.collision_list_size)
+        self.contacts = np.zeros(0, dtype=self.dtype)
+        self._all_collisions = None
 
-        self.self_collisions = defaultdict(default_f)
-        self.external_collision = defaultdict(default_f)
-        self.external_collision_long_key = defaultdict(lambda: self._default_collision('', '', ''))
-        self.all_collisions = set()
+        self.self_collisions: Dict[Tuple[my_string, my_string], np.ndarray] = {}
+        self.external_collision: Dict[my_string, np.ndarray] = {}
+        self.external_collision_long_key = defaultdict(lambda: self.default_result[0])
         self.number_of_self_collisions = defaultdict(int)
         self.number_of_external_collisions = defaultdict(int)
+        self._external_collision_data = None
+        self._self_collision_data = None
 
-    def get_robot_from_self_collision(self, collision):
-        link_a, link_b = collision.link_a, collision.link_b
-        for robot in self.collision_scene.robots:
-            if link_a in robot.link_names_as_set and link_b in robot.link_names_as_set:
-                return robot
+    @property
+    def link_names(self) -> List[my_string]:
+        return self.collision_scene.collision_link_names
+
+    def get_link_id(self, link_name: my_string) -> int:
+        return self.collision_scene.get_link_id(link_name)
+
+    @classmethod
+    def _default_collisions(cls, number: int) -> np.ndarray:
+        collisions = np.zeros(number, dtype=cls.dtype)
+        collisions['contact_distance'] = 100
+        for field in ['map_P_pa', 'map_P_pb', 'new_a_P_pa', 'new_b_P_pb']:
+            collisions[field] = [0, 0, 0, 1]
+        for field in ['map_V_n', 'new_b_V_n']:
+            collisions[field] = [0, 0, 1, 0]
+        return collisions
+
+    @staticmethod
+    def _to_4d(vectors: Sequence[Sequence[float]], w: float) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=float).reshape(len(vectors), -1)
+        if vectors.shape[1] == 3:
+            return np.hstack([vectors, np.full((len(vectors), 1), w)])
+        return vectors
+
+    @staticmethod
+    def _inverse_frames(a_T_b: np.ndarray) -> np.ndarray:
+        """
+        :param a_T_b: transformation matrices of shape (n, 4, 4)
+        :return: b_T_a of the same shape
+        """
+        b_T_a = np.zeros_like(a_T_b)
+        b_R_a = a_T_b[:, :3, :3].transpose(0, 2, 1)
+        b_T_a[:, :3, :3] = b_R_a
+        b_T_a[:, :3, 3] = -np.einsum('nij,nj->ni', b_R_a, a_T_b[:, :3, 3])
+        b_T_a[:, 3, 3] = 1
+        return b_T_a
 
-    @profile
     def add(self, collision: Collision):
-        robot = self.get_robot_from_self_collision(collision)
-        # is_external = collision.link_b not in robot.link_names_with_collisions \
-        #               or collision.link_a not in robot.link_names_with_collisions
-        collision.is_external = robot is None
-        if collision.is_external:
-            collision = self.transform_external_collision(collision)
-            key = collision.link_a
-            self.external_collision[key].add(collision)
-            self.number_of_external_collisions[key] = min(self.collision_list_size,
-                                                          self.number_of_external_collisions[key] + 1)
-            key_long = (collision.original_link_a, None, collision.original_link_b)
-            if key_long not in self.external_collision_long_key:
-                self.external_collision_long_key[key_long] = collision
-            else:
-                self.external_collision_long_key[key_long] = min(collision, self.external_collision_long_key[key_long],
-                                                                 key=lambda x: x.contact_distance)
-        else:
-            collision = self.transform_self_collision(collision, robot)
-            key = collision.link_a, collision.link_b
-            self.self_collisions[key].add(collision)
-            self.number_of_self_collisions[key] = min(self.collision_list_size,
-                                                      self.number_of_self_collisions[key] + 1)
-        self.all_collisions.add(collision)
+        """
+        Adds a single contact, use add_batch to add many at once.
+        """
+        map_P_pa = collision.map_P_pa
+        if map_P_pa is None:
+            map_T_a = self.world.compute_fk_np(self.world.root_link_name, collision.original_link_a)
+            map_P_pa = np.dot(map_T_a, collision.a_P_pa)
+        map_P_pb = collision.map_P_pb
+        if map_P_pb is None:
+            map_T_b = self.world.compute_fk_np(self.world.root_link_name, collision.original_link_b)
+            map_P_pb = np.dot(map_T_b, collision.b_P_pb)
+        self.add_batch(link_a=[collision.original_link_a],
+                       link_b=[collision.original_link_b],
+                       contact_distance=[collision.contact_distance],
+                       map_P_pa=[map_P_pa],
+                       map_P_pb=[map_P_pb],
+                       map_V_n=[collision.map_V_n])
 
     @profile
-    def transform_self_collision(self, collision: Collision, robot: WorldBranch) -> Collision:
-        link_a = collision.original_link_a
-        link_b = collision.original_link_b
-        new_link_a, new_link_b = self.world.compute_chain_reduced_to_controlled_joints(link_a, link_b,
-                                                                                       self.fixed_joints)
-        if not self.world.link_order(new_link_a, new_link_b):
-            collision = collision.reverse()
-            new_link_a, new_link_b = new_link_b, new_link_a
-        collision.link_a = new_link_a
-        collision.link_b = new_link_b
-
-        new_b_T_r = self.world.compute_fk_np(new_link_b, robot.root_link_name)
-        root_T_map = self.world.compute_fk_np(robot.root_link_name, self.world.root_link_name)
-        new_b_T_map = np.dot(new_b_T_r, root_T_map)
-        collision.new_b_V_n = np.dot(new_b_T_map, collision.map_V_n)
-
-        if collision.map_P_pa is not None:
-            new_a_T_r = self.world.compute_fk_np(new_link_a, robot.root_link_name)
-            new_a_P_pa = np.dot(np.dot(new_a_T_r, root_T_map), collision.map_P_pa)
-            new_b_P_pb = np.dot(new_b_T_map, collision.map_P_pb)
-        else:
-            new_a_T_a = self.world.compute_fk_np(new_link_a, collision.original_link_a)
-            new_a_P_pa = np.dot(new_a_T_a, collision.a_P_pa)
-            new_b_T_b = self.world.compute_fk_np(new_link_b, collision.original_link_b)
-            new_b_P_pb = np.dot(new_b_T_b, collision.b_P_pb)
-        collision.new_a_P_pa = new_a_P_pa
-        collision.new_b_P_pb = new_b_P_pb
-        return collision
+    def add_batch(self,
+                  link_a: Sequence[my_string],
+                  link_b: Sequence[my_string],
+                  contact_distance: Sequence[float],
+                  map_P_pa: Sequence[Sequence[float]],
+                  map_P_pb: Sequence[Sequence[float]],
+                  map_V_n: Sequence[Sequence[float]]):
+        """
+        Adds the contacts between link_a[i] and link_b[i]. Points and normals are expressed in map.
+        Self collisions are reduced to the links of the closest controlled joints, external collisions to the
+        child link of the closest controlled parent joint of link_a.
+        :param map_V_n: contact normals pointing from b to a
+        """
+        number_of_contacts = len(contact_distance)
+        if number_of_contacts == 0:
+            return
+        map_P_pa = self._to_4d(map_P_pa, 1)
+        map_P_pb = self._to_4d(map_P_pb, 1)
+        map_V_n = self._to_4d(map_V_n, 0)
+        pair_infos = [self.collision_scene.get_collision_pair_info(a, b) for a, b in zip(link_a, link_b)]
+        is_external, reverse, new_link_a, new_link_b = zip(*pair_infos)
+        is_external = np.array(is_external, dtype=bool)
+        reverse = np.array(reverse, dtype=bool)
+        original_link_a = [b if r else a for a, b, r in zip(link_a, link_b, reverse)]
+        original_link_b = [a if r else b for a, b, r in zip(link_a, link_b, reverse)]
+
+        contacts = np.empty(number_of_contacts, dtype=self.dtype)
+        contacts['contact_distance'] = contact_distance
+        contacts['soft_threshold'] = [self.get_soft_threshold(a, b) if external else 0
+                                      for a, b, external in zip(original_link_a, original_link_b, is_external)]
+        contacts['link_b_hash'] = [link.__hash__() for link in original_link_b]
+        contacts['map_P_pa'] = np.where(reverse[:, None], map_P_pb, map_P_pa)
+        contacts['map_P_pb'] = np.where(reverse[:, None], map_P_pa, map_P_pb)
+        contacts['map_V_n'] = np.where(reverse[:, None], -map_V_n, map_V_n)
+        contacts['is_external'] = is_external
+        contacts['link_a'] = [self.get_link_id(link) for link in new_link_a]
+        contacts['link_b'] = [self.get_link_id(link) for link in new_link_b]
+        contacts['original_link_a'] = [self.get_link_id(link) for link in original_link_a]
+        contacts['original_link_b'] = [self.get_link_id(link) for link in original_link_b]
+
+        map_T_links, link_index = self.collision_scene.compute_all_fks_np()
+        new_a_T_map = self._inverse_frames(map_T_links[[link_index[link] for link in new_link_a]])
+        contacts['new_a_P_pa'] = np.einsum('nij,nj->ni', new_a_T_map, contacts['map_P_pa'])
+        contacts['new_b_P_pb'] = [0, 0, 0, 1]
+        contacts['new_b_V_n'] = [0, 0, 1, 0]
+        is_self = ~is_external
+        if np.any(is_self):
+            new_b_T_map = self._inverse_frames(map_T_links[[link_index[link]
+                                                            for link, external in zip(new_link_b, is_external)
+                                                            if not external]])
+            contacts['new_b_P_pb'][is_self] = np.einsum('nij,nj->ni', new_b_T_map, contacts['map_P_pb'][is_self])
+            contacts['new_b_V_n'][is_self] = np.einsum('nij,nj->ni', new_b_T_map, contacts['map_V_n'][is_self])
+
+        self.contacts = np.concatenate([self.contacts, contacts])
+        self._all_collisions = None
+        self._sort_contacts()
+
+    def get_soft_threshold(self, link_a: my_string, link_b: my_string) -> float:
+        """
+        :return: soft threshold of an external collision between robot link link_a and link_b, 0 if it is not avoided
+        """
+        if (link_a, link_b) in self.soft_thresholds:
+            return self.soft_thresholds[link_a, link_b]
+        return self.soft_thresholds.get((link_b, link_a), 0)
 
-    @profile
-    def transform_external_collision(self, collision: Collision) -> Collision:
-        try:
-            link_name = collision.original_link_a
-            joint = self.world.links[link_name].parent_joint_name
-            if self.world.is_joint_controlled(joint) and joint not in self.fixed_joints:
-                movable_joint = joint
+    @staticmethod
+    def _rank_in_group(group_ids: np.ndarray, distances: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: indices that sort by group and distance and the rank of each of them within its group
+        """
+        order = np.lexsort((distances, group_ids))
+        sorted_group_ids = group_ids[order]
+        group_starts = np.flatnonzero(np.r_[True, sorted_group_ids[1:] != sorted_group_ids[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, len(order)])
+        rank = np.arange(len(order)) - np.repeat(group_starts, group_sizes)
+        return order, rank
 
-            def stopper(joint_name):
-                return self.world.is_joint_controlled(joint_name) and joint_name not in self.fixed_joints
+    @profile
+    def _sort_contacts(self):
+        contacts = self.contacts
+        is_external = contacts['is_external']
+        keys = np.stack([is_external,
+                         contacts['link_a'],
+                         np.where(is_external, -1, contacts['link_b'])], axis=1)
+        unique_keys, key_ids = np.unique(keys, axis=0, return_inverse=True)
+        key_ids = key_ids.reshape(-1)
+        order, rank = self._rank_in_group(key_ids, contacts['contact_distance'])
+        closest = order[rank < self.collision_list_size]
+        table = np.tile(self.default_result, (len(unique_keys), 1))
+        table[key_ids[closest], rank[rank < self.collision_list_size]] = contacts[closest]
+        number_of_contacts = np.minimum(np.bincount(key_ids), self.collision_list_size)
+
+        self.self_collisions = {}
+        self.external_collision = {}
+        self.number_of_self_collisions = defaultdict(int)
+        self.number_of_external_collisions = defaultdict(int)
+        self._external_collision_data = None
+        self._self_collision_data = None
+        for row, (external, link_a_id, link_b_id) in enumerate(unique_keys):
+            link_a = self.link_names[link_a_id]
+            if external:
+                self.external_collision[link_a] = table[row]
+                self.number_of_external_collisions[link_a] = int(number_of_contacts[row])
+            else:
+                key = link_a, self.link_names[link_b_id]
+                self.self_collisions[key] = table[row]
+                self.number_of_self_collisions[key] = int(number_of_contacts[row])
+
+        self.external_collision_long_key = defaultdict(lambda: self.default_result[0])
+        external_contacts = contacts[is_external]
+        if len(external_contacts) > 0:
+            long_keys = np.stack([external_contacts['original_link_a'], external_contacts['original_link_b']], axis=1)
+            _, long_key_ids = np.unique(long_keys, axis=0, return_inverse=True)
+            order, rank = self._rank_in_group(long_key_ids.reshape(-1), external_contacts['contact_distance'])
+            for contact in external_contacts[order[rank == 0]]:
+                key_long = (self.link_names[contact['original_link_a']], None,
+                            self.link_names[contact['original_link_b']])
+                self.external_collision_long_key[key_long] = contact
+
+    @staticmethod
+    def _to_columns(contacts: np.ndarray, number_of_contacts: int, columns: Dict[str, int]) -> np.ndarray:
+        """
+        :param contacts: row of the contact table
+        :return: the fields in columns as float array of shape (len(contacts), number of columns)
+        """
+        data = np.empty((len(contacts), max(columns.values()) + 3))
+        for field, column in columns.items():
+            if field == 'number_of_contacts':
+                data[:, column] = number_of_contacts
+            elif contacts.dtype[field].shape:
+                data[:, column:column + 3] = contacts[field][:, :3]
+            else:
+                data[:, column] = contacts[field]
+        return data
 
-            movable_joint = self.world.search_for_parent_joint(joint, stopper)
-            # movable_joint = self.world.get_controlled_parent_joint_of_link(collision.original_link_a)
-        except Exception as e:
-            pass
-        new_a = self.world.joints[movable_joint].child_link_name
-        collision.link_a = new_a
-        if collision.map_P_pa is not None:
-            new_a_T_map = self.world.compute_fk_np(new_a, self.world.root_link_name)
-            new_a_P_a = np.dot(new_a_T_map, collision.map_P_pa)
-        else:
-            new_a_T_a = self.world.compute_fk_np(new_a, collision.original_link_a)
-            new_a_P_a = np.dot(new_a_T_a, collision.a_P_pa)
+    @property
+    def external_collision_data(self) -> np.ndarray:
+        """
+        The contact table of external collisions as a single float array, such that all symbols of collision
+        avoidance goals can be gathered with one indexing operation.
+        Shape: (number of link ids, collision_list_size, number of columns), indexed by
+        CollisionWorldSynchronizer.get_link_id of the robot link, the repeller index and external_data_columns.
+        """
+        if self._external_collision_data is None or len(self._external_collision_data) != len(self.link_names):
+            default = self._to_columns(self.default_result, 0, self.external_data_columns)
+            data = np.tile(default, (len(self.link_names), 1, 1))
+            for link_name, contacts in self.external_collision.items():
+                data[self.get_link_id(link_name)] = self._to_columns(contacts,
+                                                                     self.number_of_external_collisions[link_name],
+                                                                     self.external_data_columns)
+            self._external_collision_data = data
+        return self._external_collision_data
 
-        collision.new_a_P_pa = new_a_P_a
+    @property
+    def self_collision_data(self) -> np.ndarray:
+        """
+        Like external_collision_data, for self collisions.
+        Shape: (number of pair ids, collision_list_size, number of columns), indexed by
+        CollisionWorldSynchronizer.get_pair_id of the link pair, the repeller index and self_data_columns.
+        """
+        pair_ids = self.collision_scene.collision_pair_ids
+        if self._self_collision_data is None or len(self._self_collision_data) != len(pair_ids):
+            default = self._to_columns(self.default_result, 0, self.self_data_columns)
+            data = np.tile(default, (len(pair_ids), 1, 1))
+            for key, contacts in self.self_collisions.items():
+                if key in pair_ids:
+                    data[pair_ids[key]] = self._to_columns(contacts,
+                                                                self.number_of_self_collisions[key],
+                                                                self.self_data_columns)
+            self._self_collision_data = data
+        return self._self_collision_data
+
+    def to_collision(self, contact: np.void) -> Collision:
+        collision = Collision(link_a=self.link_names[contact['original_link_a']],
+                              link_b=self.link_names[contact['original_link_b']],
+                              contact_distance=float(contact['contact_distance']),
+                              map_P_pa=contact['map_P_pa'],
+                              map_P_pb=contact['map_P_pb'],
+                              map_V_n=contact['map_V_n'])
+        collision.link_a = self.link_names[contact['link_a']]
+        collision.link_b = self.link_names[contact['link_b']]
+        collision.is_external = bool(contact['is_external'])
+        collision.new_a_P_pa = contact['new_a_P_pa']
+        if not collision.is_external:
+            collision.new_b_P_pb = contact['new_b_P_pb']
+            collision.new_b_V_n = contact['new_b_V_n']
         return collision
 
-    def _default_collision(self, link_a, body_b, link_b):
-        c = Collision(link_a=link_a,
-                      link_b=link_b,
-                      contact_distance=100,
-                      map_P_pa=[0, 0, 0, 1],
-                      map_P_pb=[0, 0, 0, 1],
-                      map_V_n=[0, 0, 1, 0],
-                      a_P_pa=[0, 0, 0, 1],
-                      b_P_pb=[0, 0, 0, 1])
-        c.new_a_P_pa = [0, 0, 0, 1]
-        c.new_b_P_pb = [0, 0, 0, 1]
-        c.new_b_V_n = [0, 0, 1, 0]
-        return c
+    @property
+    def all_collisions(self) -> List[Collision]:
+        """
+        All contacts as Collision objects, they are only created when needed.
+        """
+        if self._all_collisions is None:
+            self._all_collisions = [self.to_collision(contact) for contact in self.contacts]
+        return self._all_collisions
 
     @profile
-    def get_external_collisions(self, joint_name: str) -> SortedKeyList:
+    def get_external_collisions(self, joint_name: str) -> np.ndarray:
         """
         Collisions are saved as a list for each movable robot joint, sorted by contact distance
         """
@@ -210,11 +399,9 @@ class Collisions:
             return self.external_collision[joint_name]
         return self.default_result
 
-    def get_external_collisions_long_key(self, link_a, body_b, link_b):
+    def get_external_collisions_long_key(self, link_a, body_b, link_b) -> np.void:
         """
-        Collisions are saved as a list for each movable robot joint, sorted by contact distance
-        :type joint_name: str
-        :rtype: SortedKeyList
+        :return: the closest contact between link_a and link_b
         """
         return self.external_collision_long_key[link_a, body_b, link_b]
 
@@ -223,7 +410,7 @@ class Collisions:
         return self.number_of_external_collisions[joint_name]
 
     # @profile
-    def get_self_collisions(self, link_a: my_string, link_b: my_string) -> SortedKeyList:
+    def get_self_collisions(self, link_a: my_string, link_b: my_string) -> np.ndarray:
         """
         Make sure that link_a < link_b, the reverse collision is not saved.
         """
@@ -241,8 +428,17 @@ class Collisions:
         return self.all_collisions
 
 
+# set before worker processes are forked, such that each of them inherits a copy of the collision world
+_collision_world_replica: Optional['CollisionWorldSynchronizer'] = None
+
+
+def _in_collision_during(sweep: tuple) -> Set[Tuple[PrefixName, PrefixName]]:
+    return _collision_world_replica.in_collision_during(*sweep)
+
+
 class CollisionWorldSynchronizer:
     black_list: set
+    black_list_reasons: Dict[Tuple[PrefixName, PrefixName], str]
 
     def __init__(self, world):
         self.world = world  # type: WorldTree
@@ -262,6 +458,61 @@ class CollisionWorldSynchronizer:
         self.fixed_joints = tuple(self.fixed_joints)
 
         self.world_version = -1
+        self._collision_pair_info = {}
+        self._collision_pair_info_version = -1
+        self.frozen_fks = None
+        # ids of links and link pairs in the contact tables of Collisions, they are reset when the model changes
+        self._collision_ids_version = -1
+        self.collision_link_names: List[my_string] = ['']
+        self.collision_link_ids: Dict[my_string, int] = {'': 0}
+        self.collision_pair_ids: Dict[Tuple[my_string, my_string], int] = {}
+
+    def compute_all_fks_np(self) -> Tuple[np.ndarray, Dict[PrefixName, int]]:
+        """
+        Used to express contacts relative to links.
+        :return: the fks frozen with freeze_fks, or the current ones, if they are not frozen
+        """
+        if self.frozen_fks is not None:
+            return self.frozen_fks
+        return self.world.compute_all_fks_np()
+
+    def freeze_fks(self):
+        """
+        Keeps a copy of the current fks for compute_all_fks_np, such that collision checks can run on another thread,
+        while the world state changes.
+        """
+        map_T_links, link_index = self.world.compute_all_fks_np()
+        self.frozen_fks = (map_T_links.copy(), link_index)
+
+    def unfreeze_fks(self):
+        self.frozen_fks = None
+
+    def _reset_outdated_collision_ids(self):
+        if self._collision_ids_version != self.world.model_version:
+            self._collision_ids_version = self.world.model_version
+            self.collision_link_names = ['']
+            self.collision_link_ids = {'': 0}
+            self.collision_pair_ids = {}
+
+    def get_link_id(self, link_name: my_string) -> int:
+        """
+        :return: row of link_name in Collisions.external_collision_data, ids are only valid until the model changes
+        """
+        self._reset_outdated_collision_ids()
+        if link_name not in self.collision_link_ids:
+            self.collision_link_ids[link_name] = len(self.collision_link_names)
+            self.collision_link_names.append(link_name)
+        return self.collision_link_ids[link_name]
+
+    def get_pair_id(self, link_a: my_string, link_b: my_string) -> int:
+        """
+        Make sure that link_a < link_b, like for Collisions.get_self_collisions.
+        :return: row of the link pair in Collisions.self_collision_data, ids are only valid until the model changes
+        """
+        self._reset_outdated_collision_ids()
+        if (link_a, link_b) not in self.collision_pair_ids:
+            self.collision_pair_ids[link_a, link_b] = len(self.collision_pair_ids)
+        return self.collision_pair_ids[link_a, link_b]
 
     def has_world_changed(self):
         if self.world_version != self.world.model_version:
@@ -309,10 +560,74 @@ class CollisionWorldSynchronizer:
 
     def reset_collision_blacklist(self):
         self.black_list = set()
+        self.black_list_reasons = {}
         self.update_collision_blacklist(white_list_combinations=self.white_list_pairs)
 
     def remove_black_list_entries(self, part_list: set):
         self.black_list = {x for x in self.black_list if x[0] not in part_list and x[1] not in part_list}
+        self.black_list_reasons = {x: reason for x, reason in self.black_list_reasons.items() if x in self.black_list}
+
+    def get_self_collision_matrix_cache(self) -> Optional[LRUFileCache]:
+        cache_size = self.god_map.get_data(identifier.self_collision_matrix_cache_size)
+        if cache_size <= 0:
+            return None
+        return LRUFileCache(os.path.join(self.god_map.get_data(identifier.tmp_folder), 'self_collision_matrix_cache'),
+                            cache_size)
+
+    def get_sweep_limits(self, joint_name: PrefixName) -> Tuple[float, float]:
+        if self.world.is_joint_continuous(joint_name):
+            return -np.pi, np.pi
+        return self.world.get_joint_position_limits(joint_name)
+
+    def self_collision_matrix_key(self, group: WorldBranch, *parameters) -> str:
+        """
+        :return: hash of everything the self collision matrix of group depends on, including parameters
+        """
+        data = [type(self).__name__]
+        for joint_name in sorted(group.joint_names):
+            joint = self.world.joints[joint_name]
+            data.extend([str(joint_name), type(joint).__name__, str(joint.parent_link_name), str(joint.child_link_name),
+                         joint.parent_T_child.s.serialize()])
+        for joint_name in sorted(group.controlled_joints):
+            if joint_name not in self.fixed_joints:
+                data.append(f'{joint_name}: {self.get_sweep_limits(joint_name)}')
+        for link_name in sorted(group.link_names_with_collisions):
+            data.append(str(link_name))
+            for geometry in self.world.links[link_name].collisions:
+                data.extend([type(geometry).__name__, geometry.link_T_geometry.s.serialize()])
+                if isinstance(geometry, MeshGeometry):
+                    file_name = resolve_ros_iris(geometry.file_name)
+                    data.extend([geometry.file_name, str(geometry.scale),
+                                 str(os.path.getmtime(file_name)), str(os.path.getsize(file_name))])
+                else:
+                    data.append(str(sorted((k, v) for k, v in vars(geometry).items()
+                                           if k not in ['color', 'link_T_geometry'])))
+        data.extend(str(sorted(str(x) for x in entries)) for entries in [self.fixed_joints,
+                                                                         self.links_to_ignore,
+                                                                         self.ignored_self_collion_pairs])
+        data.extend(str(parameter) for parameter in parameters)
+        return LRUFileCache.hash(*data)
+
+    def _get_black_list_reason(self, group: WorldBranch, link_a: PrefixName, link_b: PrefixName,
+                               non_controlled: bool) -> Optional[str]:
+        """
+        :return: reason for why the collision between link_a and link_b can be ignored or None, if it can't.
+                    Uses the reasons of SRDF files.
+        """
+        if link_a == link_b \
+                or link_a in self.links_to_ignore \
+                or link_b in self.links_to_ignore \
+                or link_a in self.ignored_self_collion_pairs \
+                or link_b in self.ignored_self_collion_pairs \
+                or (link_a, link_b) in self.ignored_self_collion_pairs \
+                or (link_b, link_a) in self.ignored_self_collion_pairs:
+            return 'User'
+        if self.world.are_linked(link_a, link_b, do_not_ignore_non_controlled_joints=non_controlled,
+                                 joints_to_be_assumed_fixed=self.fixed_joints):
+            return 'Adjacent'
+        if not group.is_link_controlled(link_a) and not group.is_link_controlled(link_b):
+            return 'Never'
+        return None
 
     def update_group_blacklist(self,
                                group_name: str,
@@ -325,7 +640,23 @@ class CollisionWorldSynchronizer:
         group: WorldBranch = self.world.groups[group_name]
         if link_combinations is None:
             link_combinations = set(combinations_with_replacement(group.link_names_with_collisions, 2))
+        cache = self.get_self_collision_matrix_cache()
+        if cache is not None:
+            known_combinations = [x for x in link_combinations
+                                  if x in self.black_list or self.world.sort_links(*x) in self.black_list]
+            key = self.self_collision_matrix_key(group, sorted(link_combinations), sorted(known_combinations),
+                                                 distance_threshold_zero, distance_threshold_rnd, non_controlled, steps)
+            entry_path = cache.get(key)
+            if entry_path is not None:
+                black_list = self.load_black_list(os.path.join(entry_path, 'black_list.srdf'))
+                self.black_list_reasons.update(black_list)
+                self.black_list.update(black_list)
+                logging.logdebug(f'Loaded self collision matrix of {group_name} from cache')
+                if white_list_combinations is not None:
+                    self.black_list.difference_update(white_list_combinations)
+                return
         # logging.loginfo('calculating self collision matrix')
+        black_list_before = set(self.black_list)
         joint_state_tmp = self.world.state
         t = time()
         # find meaningless collisions
@@ -334,17 +665,9 @@ class CollisionWorldSynchronizer:
             if link_combination in self.black_list:
                 continue
             try:
-                if link_a == link_b \
-                        or link_a in self.links_to_ignore \
-                        or link_b in self.links_to_ignore \
-                        or link_a in self.ignored_self_collion_pairs \
-                        or link_b in self.ignored_self_collion_pairs \
-                        or (link_a, link_b) in self.ignored_self_collion_pairs \
-                        or (link_b, link_a) in self.ignored_self_collion_pairs \
-                        or self.world.are_linked(link_a, link_b, do_not_ignore_non_controlled_joints=non_controlled,
-                                                 joints_to_be_assumed_fixed=self.fixed_joints) \
-                        or (not group.is_link_controlled(link_a) and not group.is_link_controlled(link_b)):
-                    self.add_black_list_entry(*link_combination)
+                reason = self._get_black_list_reason(group, link_a, link_b, non_controlled)
+                if reason is not None:
+                    self.add_black_list_entry(*link_combination, reason=reason)
             except Exception as e:
                 pass
 
@@ -352,22 +675,21 @@ class CollisionWorldSynchronizer:
         self.set_joint_state_to_zero()
         for link_a, link_b in self.check_collisions2(unknown, distance_threshold_zero):
             link_combination = self.world.sort_links(link_a, link_b)
-            self.add_black_list_entry(*link_combination)
+            self.add_black_list_entry(*link_combination, reason='Default')
         unknown = unknown.difference(self.black_list)
 
         # Remove combinations which can never touch
-        # by checking combinations which a single joint can influence
+        # by checking combinations which a single joint can influence.
+        # Each joint is moved through its range, while the previous joints remain at their last position.
         joints = [j for j in group.controlled_joints if j not in self.fixed_joints]
+        sweeps = []
+        joint_state = {}
         for joint_name in joints:
             parent_links = group.get_siblings_with_collisions(joint_name)
             if not parent_links:
                 continue
             child_links = self.world.get_directly_controlled_child_links_with_collisions(joint_name, self.fixed_joints)
-            if self.world.is_joint_continuous(joint_name):
-                min_position = -np.pi
-                max_position = np.pi
-            else:
-                min_position, max_position = self.world.get_joint_position_limits(joint_name)
+            min_position, max_position = self.get_sweep_limits(joint_name)
 
             # joint_name can make these links touch.
             current_combinations = set(product(parent_links, child_links))
@@ -377,32 +699,129 @@ class CollisionWorldSynchronizer:
                                  x in current_combinations or (x[1], x[0]) in current_combinations]
             if not subset_of_unknown:
                 continue
-            sometimes = set()
-            for position in np.linspace(min_position, max_position, steps):
-                self.world.state[joint_name].position = position
-                self.world.notify_state_change()
-                self.sync()
-                for link_a, link_b in subset_of_unknown:
-                    if self.in_collision(link_a, link_b, distance_threshold_rnd):
-                        sometimes.add(self.world.sort_links(link_a, link_b))
+            positions = np.empty((steps, len(joint_state) + 1))
+            positions[:, :-1] = list(joint_state.values())
+            positions[:, -1] = np.linspace(min_position, max_position, steps)
+            sweeps.append((list(joint_state) + [joint_name], positions, subset_of_unknown, distance_threshold_rnd))
+            joint_state[joint_name] = max_position
+
+        in_collision = self.map_over_collision_world_replicas(sweeps)
+        for (_, _, subset_of_unknown, _), sometimes in zip(sweeps, in_collision):
+            subset_of_unknown = [x for x in subset_of_unknown if x in unknown]
             never = set(subset_of_unknown).difference(sometimes)
             unknown = unknown.difference(never)
-            self.add_black_list_entries(never)
+            self.add_black_list_entries(never, reason='Never')
 
         logging.logdebug(f'Calculated self collision matrix in {time() - t:.3f}s')
         self.world.state = joint_state_tmp
         self.world.notify_state_change()
+        if cache is not None:
+            with cache.add(key) as entry_path:
+                self.save_black_list(os.path.join(entry_path, 'black_list.srdf'), group_name,
+                                     {x: self.black_list_reasons[x] for x in self.black_list
+                                      if x not in black_list_before},
+                                     short_names=False)
         # unknown.update(self.white_list_pairs)
         if white_list_combinations is not None:
             self.black_list.difference_update(white_list_combinations)
         # self.black_list[group_name] = unknown
         # return self.collision_matrices[group_name]
 
-    def add_black_list_entry(self, link_a, link_b):
+    def in_collision_at(self,
+                        joint_state: Dict[PrefixName, float],
+                        link_combinations: Sequence[Tuple[PrefixName, PrefixName]],
+                        distance: float) -> Set[Tuple[PrefixName, PrefixName]]:
+        """
+        Moves the joints to joint_state and returns all link_combinations that are closer than distance.
+        """
+        for joint_name, position in joint_state.items():
+            self.world.state[joint_name].position = position
+        self.world.notify_state_change()
+        self.sync()
+        return {self.world.sort_links(link_a, link_b) for link_a, link_b in link_combinations
+                if self.in_collision(link_a, link_b, distance)}
+
+    def in_collision_during(self,
+                            joint_names: Sequence[PrefixName],
+                            positions: np.ndarray,
+                            link_combinations: Sequence[Tuple[PrefixName, PrefixName]],
+                            distance: float) -> Set[Tuple[PrefixName, PrefixName]]:
+        """
+        Moves the joints through positions and returns all link_combinations that are closer than distance
+        in at least one of them.
+        :param positions: shape (number of configurations, len(joint_names))
+        """
+        return set().union(*(self.in_collision_at(dict(zip(joint_names, configuration)), link_combinations, distance)
+                             for configuration in positions))
+
+    def map_over_collision_world_replicas(self, sweeps: List[tuple]) -> List[Set[Tuple[PrefixName, PrefixName]]]:
+        """
+        Calls in_collision_during for each sweep. If self_collision_matrix_processes is not 1, the sweeps are
+        distributed over forked processes, which each work on a copy of this collision world.
+        The collision world can't be pickled, therefore spawned processes are no option. Forking while other threads
+        run can deadlock, that's why this has to be turned on explicitly.
+        """
+        number_of_processes = self.god_map.get_data(identifier.self_collision_matrix_processes)
+        if number_of_processes <= 0:
+            number_of_processes = os.cpu_count() or 1
+        number_of_processes = min(number_of_processes, len(sweeps))
+        if number_of_processes <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+            return [self.in_collision_during(*sweep) for sweep in sweeps]
+        global _collision_world_replica
+        _collision_world_replica = self
+        try:
+            with multiprocessing.get_context('fork').Pool(number_of_processes) as pool:
+                return pool.map(_in_collision_during, sweeps)
+        finally:
+            _collision_world_replica = None
+
+    def save_self_collision_matrix(self, group_name: str, file_name: str):
+        """
+        Saves the disabled collisions of group_name as srdf, which can be loaded with
+        Giskard.load_moveit_self_collision_matrix.
+        """
+        group: WorldBranch = self.world.groups[group_name]
+        entries = {(link_a, link_b): self.black_list_reasons.get((link_a, link_b), 'Never')
+                   for link_a, link_b in self.black_list
+                   if link_a != link_b
+                   and link_a in group.link_names_as_set and link_b in group.link_names_as_set}
+        self.save_black_list(file_name, group_name, entries, short_names=True)
+        logging.loginfo(f'Saved self collision matrix of {group_name} to {file_name}.')
+
+    @staticmethod
+    def save_black_list(file_name: str, robot_name: str,
+                        entries: Dict[Tuple[PrefixName, PrefixName], str], short_names: bool):
+        """
+        :param entries: maps link pairs to a srdf reason, e.g. 'Adjacent' or 'Never'
+        :param short_names: use link names without prefix, like they appear in the urdf
+        """
+        root = ET.Element('robot', name=str(robot_name))
+        for (link_a, link_b), reason in sorted(entries.items(), key=lambda x: (str(x[0][0]), str(x[0][1]))):
+            if short_names:
+                link_a, link_b = link_a.short_name, link_b.short_name
+            ET.SubElement(root, 'disable_collisions', link1=str(link_a), link2=str(link_b), reason=reason)
+        with open(file_name, 'w') as f:
+            f.write(minidom.parseString(ET.tostring(root)).toprettyxml(indent='    '))
+
+    @staticmethod
+    def load_black_list(file_name: str) -> Dict[Tuple[PrefixName, PrefixName], str]:
+        """
+        Loads a file written by save_black_list with short_names=False.
+        """
+        entries = {}
+        for child in ET.parse(file_name).getroot().iter('disable_collisions'):
+            link_a = PrefixName.from_string(child.attrib['link1'], set_none_if_no_slash=True)
+            link_b = PrefixName.from_string(child.attrib['link2'], set_none_if_no_slash=True)
+            entries[link_a, link_b] = child.attrib['reason']
+        return entries
+
+    def add_black_list_entry(self, link_a, link_b, reason: str = 'Never'):
         self.black_list.add((link_a, link_b))
+        self.black_list_reasons[link_a, link_b] = reason
 
-    def add_black_list_entries(self, entries):
+    def add_black_list_entries(self, entries, reason: str = 'Never'):
         self.black_list.update(entries)
+        self.black_list_reasons.update((entry, reason) for entry in entries)
 
     @profile
     def update_collision_blacklist(self,
@@ -475,6 +894,42 @@ class CollisionWorldSynchronizer:
                 js[joint_name].position = 0
         return js
 
+    @profile
+    def get_collision_pair_info(self, link_a: my_string, link_b: my_string) \
+            -> Tuple[bool, bool, my_string, my_string]:
+        """
+        :return: whether the collision is external, whether link_a and link_b have to be swapped and the links to
+                    which the collision is reduced. link_b of external collisions is not reduced.
+        """
+        if self._collision_pair_info_version != self.world.model_version:
+            self._collision_pair_info = {}
+            self._collision_pair_info_version = self.world.model_version
+        key = link_a, link_b
+        if key not in self._collision_pair_info:
+            self._collision_pair_info[key] = self._compute_collision_pair_info(link_a, link_b)
+        return self._collision_pair_info[key]
+
+    def _compute_collision_pair_info(self, link_a: my_string, link_b: my_string) \
+            -> Tuple[bool, bool, my_string, my_string]:
+        for robot in self.robots:
+            if link_a in robot.link_names_as_set and link_b in robot.link_names_as_set:
+                new_link_a, new_link_b = self.world.compute_chain_reduced_to_controlled_joints(link_a, link_b,
+                                                                                               self.fixed_joints)
+                if not self.world.link_order(new_link_a, new_link_b):
+                    return False, True, new_link_b, new_link_a
+                return False, False, new_link_a, new_link_b
+
+        def stopper(joint_name):
+            return self.world.is_joint_controlled(joint_name) and joint_name not in self.fixed_joints
+
+        joint = self.world.links[link_a].parent_joint_name
+        movable_joint = joint if stopper(joint) else None
+        try:
+            movable_joint = self.world.search_for_parent_joint(joint, stopper)
+        except KeyError:
+            pass
+        return True, False, self.world.joints[movable_joint].child_link_name, link_b
+
     def check_collisions2(self, link_combinations, distance):
         in_collision = set()
         self.sync()
@@ -483,6 +938,14 @@ class CollisionWorldSynchronizer:
                 in_collision.add((link_a_name, link_b_name))
         return in_collision
 
+    def prepare_collision_check(self, cut_off_distances: dict):
+        """
+        Reads everything the next check_collisions call needs from the world, except for the fks frozen with
+        freeze_fks. Afterwards, check_collisions can run on another thread, while the world state changes.
+        If it is not called, check_collisions reads the world itself.
+        """
+        pass
+
     def check_collisions(self, cut_off_distances: dict, collision_list_size: float = 15) -> Collisions:
         """
         :param cut_off_distances: (robot_link, body_b, link_b) -> cut off distance. Contacts between objects not in this
@@ -0,0 +1,403 @@
+import json
+import os
+from collections import defaultdict
+from typing import List, Tuple, Optional, Callable, Dict
+
+import numpy as np
+import trimesh
+
+from giskardpy import identifier
+from giskardpy.god_map import GodMap
+from giskardpy.model.capsules import geometry_to_capsules, capsules_to_spheres
+from giskardpy.model.collision_world_syncer import CollisionWorldSynchronizer, Collisions
+from giskardpy.model.links import LinkGeometry, BoxGeometry, SphereGeometry, CylinderGeometry, MeshGeometry
+from giskardpy.my_types import my_string, PrefixName
+from giskardpy.utils import logging
+from giskardpy.utils.file_cache import LRUFileCache
+from giskardpy.utils.mesh_cache import load_convex_part_vertices, mesh_cache_key
+
+# bump, if the content of cache entries changes
+distance_field_version = '1'
+# the resolution is reduced, if a distance field would have more voxels than this
+max_voxels = 2 ** 22
+# number of grid points that are evaluated at once
+chunk_size = 2 ** 16
+
+
+def get_distance_field_cache() -> LRUFileCache:
+    god_map = GodMap()
+    return LRUFileCache(os.path.join(god_map.get_data(identifier.tmp_folder), 'distance_field_cache'),
+                        god_map.get_data(identifier.collision_distance_field_cache_size))
+
+
+def _box_distance(points: np.ndarray, half_extents: np.ndarray) -> np.ndarray:
+    q = np.abs(points) - half_extents
+    return np.linalg.norm(np.maximum(q, 0), axis=-1) + np.minimum(np.max(q, axis=-1), 0)
+
+
+def _convex_hull_planes(vertices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :return: normals and offsets of the faces of the convex hull of vertices
+    """
+    hull = trimesh.convex.convex_hull(vertices)
+    normals = hull.face_normals
+    return normals, np.einsum('ij,ij->i', normals, hull.triangles[:, 0])
+
+
+def distance_function(geometry: LinkGeometry) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    :return: function that maps points of shape (n, 3) in the frame of geometry to their signed distance to geometry,
+                negative inside.
+                Meshes are treated as union of their convex parts, whose distance is the maximum over the distances
+                to their face planes. This is exact inside and in front of faces, but underestimates the distance
+                close to edges and corners.
+    """
+    if isinstance(geometry, SphereGeometry):
+        return lambda points: np.linalg.norm(points, axis=-1) - geometry.radius
+    if isinstance(geometry, BoxGeometry):
+        half_extents = np.array([geometry.depth, geometry.width, geometry.height]) / 2
+        return lambda points: _box_distance(points, half_extents)
+    if isinstance(geometry, CylinderGeometry):
+        def cylinder_distance(points: np.ndarray) -> np.ndarray:
+            q = np.stack([np.linalg.norm(points[:, :2], axis=-1) - geometry.radius,
+                          np.abs(points[:, 2]) - geometry.height / 2], axis=-1)
+            return np.linalg.norm(np.maximum(q, 0), axis=-1) + np.minimum(np.max(q, axis=-1), 0)
+
+        return cylinder_distance
+    if isinstance(geometry, MeshGeometry):
+        planes = [_convex_hull_planes(vertices * np.array(geometry.scale))
+                  for vertices in load_convex_part_vertices(geometry.file_name)]
+
+        def mesh_distance(points: np.ndarray) -> np.ndarray:
+            result = np.full(len(points), np.inf)
+            for normals, offsets in planes:
+                result = np.minimum(result, np.max(points.dot(normals.T) - offsets, axis=-1))
+            return result
+
+        return mesh_distance
+    raise NotImplementedError(f'{type(geometry)} geometry is not supported')
+
+
+def distance_field_key(geometries: List[Tuple[my_string, np.ndarray, LinkGeometry]],
+                       resolution: float, padding: float) -> str:
+    """
+    Hash of the shape of all geometries relative to the root of their group.
+    """
+    vertex_budget = GodMap().get_data(identifier.collision_mesh_vertex_budget)
+    data = [distance_field_version, str(resolution), str(padding)]
+    for link_name, root_T_geometry, geometry in geometries:
+        data.extend([str(link_name), type(geometry).__name__, np.array2string(root_T_geometry, precision=6)])
+        if isinstance(geometry, MeshGeometry):
+            data.extend([mesh_cache_key(geometry.file_name, vertex_budget), str(geometry.scale)])
+        else:
+            data.append(str(sorted((k, v) for k, v in vars(geometry).items()
+                                   if k not in ['color', 'link_T_geometry'])))
+    return LRUFileCache.hash(*data)
+
+
+class DistanceField:
+    """
+    Signed distance to the union of several geometries, sampled on a voxel grid.
+    For each voxel, the grid also stores the gradient of the distance and which link is closest.
+    """
+    distances_file_name = 'distances.npy'
+    gradients_file_name = 'gradients.npy'
+    labels_file_name = 'labels.npy'
+    meta_file_name = 'meta.json'
+
+    def __init__(self, origin: np.ndarray, resolution: float, distances: np.ndarray, gradients: np.ndarray,
+                 labels: np.ndarray, link_names: List[str]):
+        """
+        :param origin: position of voxel (0, 0, 0)
+        :param distances: shape (nx, ny, nz)
+        :param gradients: shape (nx, ny, nz, 3)
+        :param labels: index of the closest link in link_names for each voxel
+        """
+        self.origin = np.asarray(origin, dtype=float)
+        self.resolution = float(resolution)
+        self.distances = distances
+        self.gradients = gradients
+        self.labels = labels
+        self.link_names = link_names
+        self.shape = np.array(distances.shape)
+
+    @classmethod
+    @profile
+    def compute(cls, geometries: List[Tuple[my_string, np.ndarray, LinkGeometry]],
+                resolution: float, padding: float) -> 'DistanceField':
+        """
+        :param geometries: link name, root_T_geometry and geometry
+        :param padding: the grid extends this far beyond the bounding box of the geometries
+        """
+        link_names = sorted({str(link_name) for link_name, _, _ in geometries})
+        centers = np.array([root_T_geometry[:3, 3] for _, root_T_geometry, _ in geometries])
+        radii = np.array([geometry.radius_around_origin() for _, _, geometry in geometries])
+        aabb_min = np.min(centers - radii[:, None], axis=0) - padding
+        aabb_max = np.max(centers + radii[:, None], axis=0) + padding
+        shape = np.ceil((aabb_max - aabb_min) / resolution).astype(int) + 1
+        if np.prod(shape) > max_voxels:
+            new_resolution = resolution * (np.prod(shape) / max_voxels) ** (1 / 3)
+            logging.logwarn(f'Distance field would have {np.prod(shape)} voxels, '
+                            f'increasing resolution from {resolution} to {new_resolution:.4f}.')
+            resolution = new_resolution
+            shape = np.ceil((aabb_max - aabb_min) / resolution).astype(int) + 1
+        axes = [aabb_min[i] + np.arange(shape[i]) * resolution for i in range(3)]
+        grid_points = np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+        distances = np.full(len(grid_points), np.inf)
+        labels = np.zeros(len(grid_points), dtype=np.int16)
+        for link_name, root_T_geometry, geometry in geometries:
+            geometry_T_root = np.linalg.inv(root_T_geometry)
+            signed_distance = distance_function(geometry)
+            label = link_names.index(str(link_name))
+            for start in range(0, len(grid_points), chunk_size):
+                chunk = slice(start, start + chunk_size)
+                points = grid_points[chunk]
+                # skip points, which are closer to other geometries than to the bounding sphere of this one
+                lower_bound = np.linalg.norm(points - root_T_geometry[:3, 3], axis=-1) - geometry.radius_around_origin()
+                candidates = np.flatnonzero(lower_bound < distances[chunk])
+                if len(candidates) == 0:
+                    continue
+                local_points = points[candidates].dot(geometry_T_root[:3, :3].T) + geometry_T_root[:3, 3]
+                candidate_distances = signed_distance(local_points)
+                closer = candidate_distances < distances[chunk][candidates]
+                distances[start + candidates[closer]] = candidate_distances[closer]
+                labels[start + candidates[closer]] = label
+        distances = distances.reshape(shape).astype(np.float32)
+        gradients = np.stack(np.gradient(distances, resolution), axis=-1).astype(np.float32)
+        return cls(aabb_min, resolution, distances, gradients, labels.reshape(shape), link_names)
+
+    def save(self, folder: str):
+        np.save(os.path.join(folder, self.distances_file_name), self.distances)
+        np.save(os.path.join(folder, self.gradients_file_name), self.gradients)
+        np.save(os.path.join(folder, self.labels_file_name), self.labels)
+        with open(os.path.join(folder, self.meta_file_name), 'w') as f:
+            json.dump({'origin': self.origin.tolist(),
+                       'resolution': self.resolution,
+                       'link_names': self.link_names}, f)
+
+    @classmethod
+    def load(cls, folder: str) -> 'DistanceField':
+        """
+        The grids are memory mapped, only the voxels that are looked up are read from disk.
+        """
+        with open(os.path.join(folder, cls.meta_file_name), 'r') as f:
+            meta = json.load(f)
+        return cls(origin=np.array(meta['origin']),
+                   resolution=meta['resolution'],
+                   distances=np.load(os.path.join(folder, cls.distances_file_name), mmap_mode='r'),
+                   gradients=np.load(os.path.join(folder, cls.gradients_file_name), mmap_mode='r'),
+                   labels=np.load(os.path.join(folder, cls.labels_file_name), mmap_mode='r'),
+                   link_names=meta['link_names'])
+
+    @classmethod
+    def get(cls, geometries: List[Tuple[my_string, np.ndarray, LinkGeometry]],
+            resolution: float, padding: float, cache: Optional[LRUFileCache] = None) -> 'DistanceField':
+        """
+        Loads the distance field of geometries from the cache, computes it if it is not cached yet.
+        """
+        if cache is None:
+            cache = get_distance_field_cache()
+        key = distance_field_key(geometries, resolution, padding)
+        entry_path = cache.get(key)
+        if entry_path is None:
+            distance_field = cls.compute(geometries, resolution, padding)
+            with cache.add(key) as tmp_path:
+                distance_field.save(tmp_path)
+            logging.loginfo(f'Computed distance field with {distance_field.distances.size} voxels.')
+            entry_path = cache.get(key)
+            if entry_path is None:
+                # cache is too small to hold it
+                return distance_field
+        return cls.load(entry_path)
+
+    @profile
+    def query(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Trilinear interpolation of the distance and gradient at points.
+        Points outside of the grid are projected onto it and their distance is extrapolated from there.
+        :param points: shape (n, 3), in the frame of the distance field
+        :return: signed distances, normalized gradients and index of the closest link in link_names for each point
+        """
+        grid_points = (points - self.origin) / self.resolution
+        clamped = np.clip(grid_points, 0, self.shape - 1)
+        lower = np.minimum(np.floor(clamped).astype(int), np.maximum(self.shape - 2, 0))
+        fraction = clamped - lower
+        distances = np.zeros(len(points))
+        gradients = np.zeros((len(points), 3))
+        for corner in np.ndindex(2, 2, 2):
+            weight = np.prod(np.where(corner, fraction, 1 - fraction), axis=-1)
+            index = tuple((lower + corner).T)
+            distances += weight * self.distances[index]
+            gradients += weight[:, None] * self.gradients[index]
+        labels = np.asarray(self.labels[tuple(np.rint(clamped).astype(int).T)])
+        length = np.linalg.norm(gradients, axis=-1)
+        gradients = np.where(length[:, None] > 1e-9, gradients / np.maximum(length, 1e-9)[:, None], [0, 0, 1.])
+        outside = np.any(grid_points != clamped, axis=-1)
+        if np.any(outside):
+            # distance to the estimated closest surface point of the projected point
+            surface_points = clamped[outside] * self.resolution + self.origin \
+                             - gradients[outside] * distances[outside, None]
+            offsets = points[outside] - surface_points
+            distances[outside] = np.linalg.norm(offsets, axis=-1)
+            gradients[outside] = offsets / np.maximum(distances[outside], 1e-9)[:, None]
+        return distances, gradients, labels
+
+
+class DistanceFieldChecker:
+    """
+    Computes contacts between robot links and environment groups without movable joints, by looking up spheres, which
+    cover the robot links, in a precomputed signed distance field of each group.
+    A robot link is only checked against the distance field of a group, if all links of the group are in the
+    cut off distances, otherwise allowed collisions could hide closer links of the same group. All other link pairs
+    are left to the collision checker that owns this object.
+    """
+
+    # limits the number of capsules, along which spheres are placed, for one shape of a robot link
+    max_capsules_per_shape = 16
+
+    def __init__(self, collision_scene: CollisionWorldSynchronizer):
+        self.collision_scene = collision_scene
+        self.world = collision_scene.world
+        self.model_version = None
+        self.split_cache = None
+        self.queries = {}
+
+    def is_enabled(self) -> bool:
+        return self.collision_scene.god_map.get_data(identifier.collision_distance_field_resolution) > 0
+
+    @profile
+    def sync(self):
+        """
+        Loads or computes the distance fields of all static environment groups and the spheres of all robot links,
+        if the world model has changed.
+        """
+        if self.model_version == self.world.model_version:
+            return
+        self.model_version = self.world.model_version
+        self.split_cache = None
+        god_map = self.collision_scene.god_map
+        resolution = god_map.get_data(identifier.collision_distance_field_resolution)
+        padding = god_map.get_data(identifier.collision_distance_field_padding)
+        robot_link_names = sorted({link_name for robot in self.collision_scene.robots
+                                   for link_name in robot.link_names_with_collisions})
+        self.distance_fields: Dict[str, DistanceField] = {}
+        # links of each distance field in the order of their labels
+        self.field_link_names: Dict[str, List[PrefixName]] = {}
+        self.group_of_link: Dict[PrefixName, str] = {}
+        for group_name in sorted(self.world.minimal_group_names):
+            group = self.world.groups[group_name]
+            link_names = group.link_names_with_collisions
+            if group.actuated or group.movable_joint_names or not link_names \
+                    or not link_names.isdisjoint(robot_link_names):
+                continue
+            geometries = []
+            for link_name in sorted(link_names):
+                root_T_link = self.world.compute_fk_np(group.root_link_name, link_name)
+                for geometry in self.world.links[link_name].collisions:
+                    geometries.append((link_name, np.dot(root_T_link, geometry.link_T_geometry.evaluate()), geometry))
+            distance_field = DistanceField.get(geometries, resolution, padding)
+            self.distance_fields[group_name] = distance_field
+            str_to_link_name = {str(link_name): link_name for link_name in link_names}
+            self.field_link_names[group_name] = [str_to_link_name[x] for x in distance_field.link_names]
+            for link_name in link_names:
+                self.group_of_link[link_name] = group_name
+
+        spheres = []
+        sphere_link = []
+        for link_id, link_name in enumerate(robot_link_names):
+            for geometry in self.world.links[link_name].collisions:
+                geometry_spheres = capsules_to_spheres(
+                    geometry_to_capsules(geometry, self.max_capsules_per_shape))
+                link_T_geometry = geometry.link_T_geometry.evaluate()
+                geometry_spheres[:, :3] = geometry_spheres[:, :3].dot(link_T_geometry[:3, :3].T) \
+                                          + link_T_geometry[:3, 3]
+                spheres.append(geometry_spheres)
+                sphere_link.extend([link_id] * len(geometry_spheres))
+        self.sphere_link_names = robot_link_names
+        self.sphere_link_ids = {link_name: i for i, link_name in enumerate(robot_link_names)}
+        self.link_P_spheres = np.vstack(spheres)[:, :3] if spheres else np.zeros((0, 3))
+        self.sphere_radii = np.vstack(spheres)[:, 3] if spheres else np.zeros(0)
+        self.sphere_link = np.array(sphere_link, dtype=int)
+
+    @profile
+    def split_cut_off_distances(self, cut_off_distances: Dict[Tuple[my_string, my_string], float],
+                                buffer: float = 0.05) -> Dict[Tuple[my_string, my_string], float]:
+        """
+        Prepares the distance field queries for the link pairs in cut_off_distances.
+        :param buffer: added to the cut off distances, like in cut_off_distances_to_query of the collision checkers
+        :return: the entries of cut_off_distances, which are not handled with distance fields
+        """
+        self.sync()
+        if self.split_cache is not None \
+                and self.split_cache[0] is cut_off_distances \
+                and self.split_cache[1] == len(cut_off_distances):
+            return self.split_cache[2]
+        # (robot link, group name) -> link of group -> cut off distance
+        handled = defaultdict(dict)
+        for (link_a, link_b), distance in cut_off_distances.items():
+            if link_a in self.sphere_link_ids and link_b in self.group_of_link:
+                handled[link_a, self.group_of_link[link_b]][link_b] = distance
+            elif link_b in self.sphere_link_ids and link_a in self.group_of_link:
+                handled[link_b, self.group_of_link[link_a]][link_a] = distance
+        rest = dict(cut_off_distances)
+        robot_links_of_group = defaultdict(list)
+        for (robot_link, group_name), cut_offs in sorted(handled.items()):
+            if len(cut_offs) < len(self.field_link_names[group_name]):
+                continue
+            for link_b in cut_offs:
+                rest.pop((robot_link, link_b), None)
+                rest.pop((link_b, robot_link), None)
+            robot_links_of_group[group_name].append(robot_link)
+        self.queries = {}
+        for group_name, robot_links in robot_links_of_group.items():
+            field_link_names = self.field_link_names[group_name]
+            # cut off distance of each robot link with each link of the group
+            cut_offs = np.array([[handled[robot_link, group_name][link_b] for link_b in field_link_names]
+                                 for robot_link in robot_links]) + buffer
+            link_rows = np.full(len(self.sphere_link_names), -1)
+            link_rows[[self.sphere_link_ids[robot_link] for robot_link in robot_links]] = np.arange(len(robot_links))
+            spheres = np.flatnonzero(link_rows[self.sphere_link] >= 0)
+            self.queries[group_name] = (spheres, link_rows[self.sphere_link[spheres]], cut_offs)
+        self.split_cache = (cut_off_distances, len(cut_off_distances), rest)
+        return rest
+
+    @profile
+    def add_collisions(self, collisions: Collisions):
+        """
+        Adds the closest contact between each robot link and each link of a group, that was prepared by
+        split_cut_off_distances, to collisions.
+        """
+        map_T_links, link_index = self.collision_scene.compute_all_fks_np()
+        link_a, link_b, contact_distance, map_P_pa, map_P_pb, map_V_n = [], [], [], [], [], []
+        for group_name, (spheres, rows, cut_offs) in self.queries.items():
+            distance_field = self.distance_fields[group_name]
+            field_link_names = self.field_link_names[group_name]
+            map_T_root = map_T_links[link_index[self.world.groups[group_name].root_link_name]]
+            map_T_spheres = map_T_links[[link_index[self.sphere_link_names[i]] for i in self.sphere_link[spheres]]]
+            map_P_centers = np.einsum('nij,nj->ni', map_T_spheres[:, :3, :3], self.link_P_spheres[spheres]) \
+                            + map_T_spheres[:, :3, 3]
+            root_P_centers = (map_P_centers - map_T_root[:3, 3]).dot(map_T_root[:3, :3])
+            center_distances, root_V_n, labels = distance_field.query(root_P_centers)
+            map_V_n_centers = root_V_n.dot(map_T_root[:3, :3].T)
+            radii = self.sphere_radii[spheres]
+            distances = center_distances - radii
+            # closest sphere per pair of robot link and link of the group
+            pairs = rows * len(field_link_names) + labels
+            order = np.lexsort((distances, pairs))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = pairs[order][1:] != pairs[order][:-1]
+            closest = order[first]
+            closest = closest[distances[closest] <= cut_offs[rows[closest], labels[closest]]]
+            link_a.extend(self.sphere_link_names[i] for i in self.sphere_link[spheres[closest]])
+            link_b.extend(field_link_names[i] for i in labels[closest])
+            contact_distance.append(distances[closest])
+            map_P_pa.append(map_P_centers[closest] - map_V_n_centers[closest] * radii[closest, None])
+            map_P_pb.append(map_P_centers[closest] - map_V_n_centers[closest] * center_distances[closest, None])
+            map_V_n.append(map_V_n_centers[closest])
+        if link_a:
+            collisions.add_batch(link_a=link_a,
+                                 link_b=link_b,
+                                 contact_distance=np.concatenate(contact_distance),
+                                 map_P_pa=np.concatenate(map_P_pa),
+                                 map_P_pb=np.concatenate(map_P_pb),
+                                 map_V_n=np.concatenate(map_V_n))
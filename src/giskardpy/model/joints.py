@@ -163,6 +163,35 @@ class FixedJoint(Joint):
         self.parent_T_child = w.TransMatrix(parent_T_child)
 
 
+class ParameterizedFixedJoint(FixedJoint):
+    """
+    A fixed joint whose parent_T_child is not baked into the fk expressions, but read from the god map, when they are
+    evaluated. Changing parent_T_child is therefore a state change, which doesn't require to recompile the fks.
+    """
+    parent_T_child_np: np.ndarray
+
+    def __init__(self, name: PrefixName, parent_link_name: PrefixName, child_link_name: PrefixName,
+                 parent_T_child: Optional[w.TransMatrix] = None):
+        self.parent_T_child_np = np.eye(4)
+        god_map = GodMap()
+        parent_T_child_identifier = identifier.world + ['joints', name, 'parent_T_child_np']
+        self._parent_T_child = w.TransMatrix([[god_map.to_symbol(parent_T_child_identifier + [row, column])
+                                               for column in range(4)]
+                                              for row in range(3)] + [[0, 0, 0, 1]])
+        super().__init__(name=name,
+                         parent_link_name=parent_link_name,
+                         child_link_name=child_link_name,
+                         parent_T_child=parent_T_child)
+
+    @property
+    def parent_T_child(self) -> w.TransMatrix:
+        return self._parent_T_child
+
+    @parent_T_child.setter
+    def parent_T_child(self, new_parent_T_child: w.TransMatrix):
+        self.parent_T_child_np[:] = w.TransMatrix(new_parent_T_child).evaluate()
+
+
 class TFJoint(Joint):
     def __init__(self, name: PrefixName, parent_link_name: PrefixName, child_link_name: PrefixName):
         self.name = name
@@ -15,6 +15,7 @@ from giskardpy.exceptions import CorruptShapeException
 from giskardpy.model.utils import cube_volume, cube_surface, sphere_volume, cylinder_volume, cylinder_surface
 from giskardpy.my_types import PrefixName
 from giskardpy.my_types import my_string
+from giskardpy.utils.mesh_cache import get_bounding_primitives
 from giskardpy.utils.tfwrapper import np_to_pose
 from giskardpy.utils.utils import resolve_ros_iris, memoize
 import giskardpy.casadi_wrapper as w
@@ -107,6 +108,18 @@ class LinkGeometry:
     def is_big(self, volume_threshold: float = 1.001e-6, surface_threshold: float = 0.00061) -> bool:
         return False
 
+    def bounding_radius(self) -> float:
+        """
+        :return: radius of a sphere around the link frame that contains this geometry
+        """
+        return float(np.linalg.norm(self.link_T_geometry.evaluate()[:3, 3])) + self.radius_around_origin()
+
+    def radius_around_origin(self) -> float:
+        """
+        :return: radius of a sphere around the geometry frame that contains this geometry
+        """
+        raise NotImplementedError()
+
 
 class MeshGeometry(LinkGeometry):
     def __init__(self, link_T_geometry: np.ndarray, file_name: str, color: ColorRGBA, scale=None):
@@ -135,6 +148,11 @@ class MeshGeometry(LinkGeometry):
     def is_big(self, volume_threshold: float = 1.001e-6, surface_threshold:float = 0.00061) -> bool:
         return True
 
+    @memoize
+    def radius_around_origin(self) -> float:
+        bounding_primitives = get_bounding_primitives(self.file_name)
+        return bounding_primitives['radius_around_origin'] * float(np.max(np.abs(self.scale)))
+
 
 class BoxGeometry(LinkGeometry):
     def __init__(self, link_T_geometry, depth, width, height, color):
@@ -158,6 +176,9 @@ class BoxGeometry(LinkGeometry):
         return (cube_volume(self.depth, self.width, self.height) > volume_threshold or
                 cube_surface(self.depth, self.width, self.height) > surface_threshold)
 
+    def radius_around_origin(self) -> float:
+        return float(np.linalg.norm([self.depth, self.width, self.height])) / 2
+
 
 class CylinderGeometry(LinkGeometry):
     def __init__(self, link_T_geometry, height, radius, color):
@@ -180,6 +201,9 @@ class CylinderGeometry(LinkGeometry):
         return (cylinder_volume(self.radius, self.height) > volume_threshold or
                 cylinder_surface(self.radius, self.height) > surface_threshold)
 
+    def radius_around_origin(self) -> float:
+        return float(np.sqrt(self.radius ** 2 + (self.height / 2) ** 2))
+
 
 class SphereGeometry(LinkGeometry):
     def __init__(self, link_T_geometry, radius, color):
@@ -200,6 +224,9 @@ class SphereGeometry(LinkGeometry):
     def is_big(self, volume_threshold=1.001e-6, surface_threshold=0.00061):
         return sphere_volume(self.radius) > volume_threshold
 
+    def radius_around_origin(self) -> float:
+        return self.radius
+
 
 class Link:
     child_joint_names: List[PrefixName]
@@ -284,5 +311,11 @@ class Link:
                 return True
         return False
 
+    def bounding_radius(self) -> float:
+        """
+        :return: radius of a sphere around the link frame that contains all collision geometries
+        """
+        return max((collision.bounding_radius() for collision in self.collisions), default=0.)
+
     def __repr__(self):
         return str(self.name)
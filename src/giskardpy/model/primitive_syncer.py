@@ -0,0 +1,216 @@
+from collections import defaultdict
+from typing import Dict, List, Tuple, Sequence
+
+import numpy as np
+
+from giskardpy.model.capsules import geometry_to_capsules
+from giskardpy.model.collision_world_syncer import CollisionWorldSynchronizer, Collisions
+from giskardpy.model.distance_field import DistanceFieldChecker
+from giskardpy.my_types import PrefixName, my_string
+from giskardpy.utils import logging
+
+
+def closest_points_between_segments(p1: np.ndarray, q1: np.ndarray, p2: np.ndarray, q2: np.ndarray,
+                                    eps: float = 1e-12) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized version of the closest points between two segments from Ericson, Real-Time Collision Detection.
+    :param p1: start points of the first segments, shape (n, 3)
+    :param q1: end points of the first segments, shape (n, 3)
+    :param p2: start points of the second segments, shape (n, 3)
+    :param q2: end points of the second segments, shape (n, 3)
+    :return: closest points on the first and on the second segments, each of shape (n, 3)
+    """
+    d1 = q1 - p1
+    d2 = q2 - p2
+    r = p1 - p2
+    a = np.einsum('ij,ij->i', d1, d1)
+    e = np.einsum('ij,ij->i', d2, d2)
+    f = np.einsum('ij,ij->i', d2, r)
+    c = np.einsum('ij,ij->i', d1, r)
+    b = np.einsum('ij,ij->i', d1, d2)
+    a_is_point = a <= eps
+    e_is_point = e <= eps
+    safe_a = np.where(a_is_point, 1, a)
+    safe_e = np.where(e_is_point, 1, e)
+    denominator = a * e - b * b
+    safe_denominator = np.where(denominator <= eps, 1, denominator)
+    s = np.where(denominator <= eps, 0, np.clip((b * f - c * e) / safe_denominator, 0, 1))
+    t = (b * s + f) / safe_e
+    s = np.where(t < 0, np.clip(-c / safe_a, 0, 1), np.where(t > 1, np.clip((b - c) / safe_a, 0, 1), s))
+    t = np.clip(t, 0, 1)
+    # degenerate segments
+    s = np.where(a_is_point, 0, np.where(e_is_point, np.clip(-c / safe_a, 0, 1), s))
+    t = np.where(e_is_point, 0, np.where(a_is_point, np.clip(f / safe_e, 0, 1), t))
+    return p1 + d1 * s[:, None], p2 + d2 * t[:, None]
+
+
+class PrimitiveSyncer(CollisionWorldSynchronizer):
+    """
+    Approximates the collision geometry of each link with capsules and computes distances with numpy.
+    Needs no physics engine, but the distances are only as accurate as the approximation, which covers the
+    original geometry and therefore tends to underestimate distances.
+    """
+    # limits the number of capsules used for one box, cylinder or convex part of a mesh
+    max_capsules_per_shape = 16
+
+    def __init__(self, world):
+        self.query = None
+        self.is_prepared = False
+        super().__init__(world)
+        self.distance_fields = DistanceFieldChecker(self)
+
+    def reset_cache(self):
+        self.query = None
+        self.is_prepared = False
+
+    @profile
+    def sync(self):
+        if self.has_world_changed():
+            self.reset_cache()
+            logging.logdebug('hard sync')
+            capsules = []
+            capsule_object = []
+            self.object_capsules: Dict[my_string, List[np.ndarray]] = defaultdict(list)
+            self.object_link_names = []
+            for object_id, object_name in enumerate(self.world._fk_computer.collision_link_order):
+                link_name, collision_id = self.split_object_name(object_name)
+                link = self.world.links[link_name]
+                geometry_capsules = geometry_to_capsules(link.collisions[collision_id], self.max_capsules_per_shape)
+                start = sum(len(x) for x in capsules)
+                self.object_capsules[link_name].append(np.arange(start, start + len(geometry_capsules)))
+                capsules.append(geometry_capsules)
+                capsule_object.extend([object_id] * len(geometry_capsules))
+                self.object_link_names.append(link_name)
+            if capsules:
+                self.geometry_capsules = np.vstack(capsules)
+            else:
+                self.geometry_capsules = np.zeros((0, 7))
+            self.capsule_object = np.array(capsule_object, dtype=int)
+        if self.distance_fields.is_enabled():
+            self.distance_fields.sync()
+        self.update_capsules()
+
+    def split_object_name(self, object_name: str) -> Tuple[PrefixName, int]:
+        """
+        Inverse of Link.name_with_collision_id.
+        """
+        if object_name in self.world.links:
+            return object_name, 0
+        link_name, collision_id = str(object_name).rsplit('/\\', 1)
+        return PrefixName.from_string(link_name, set_none_if_no_slash=True), int(collision_id)
+
+    @profile
+    def update_capsules(self):
+        """
+        Transforms the capsules into the map frame.
+        """
+        map_T_geometry = np.asarray(self.world.compute_all_fks_matrix()).reshape(-1, 4, 4)[self.capsule_object]
+        self.map_P_start = np.einsum('nij,nj->ni', map_T_geometry[:, :3, :3], self.geometry_capsules[:, :3]) \
+                           + map_T_geometry[:, :3, 3]
+        self.map_P_end = np.einsum('nij,nj->ni', map_T_geometry[:, :3, :3], self.geometry_capsules[:, 3:6]) \
+                         + map_T_geometry[:, :3, 3]
+        self.radii = self.geometry_capsules[:, 6]
+
+    def capsule_pairs(self, link_a: my_string, link_b: my_string) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: indices of all combinations of capsules of link_a and link_b
+        """
+        capsules_a = np.concatenate(self.object_capsules[link_a] or [np.zeros(0, dtype=int)])
+        capsules_b = np.concatenate(self.object_capsules[link_b] or [np.zeros(0, dtype=int)])
+        return np.repeat(capsules_a, len(capsules_b)), np.tile(capsules_b, len(capsules_a))
+
+    @profile
+    def compute_distances(self, capsules_a: np.ndarray, capsules_b: np.ndarray) \
+            -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        :return: distance, closest point on a, closest point on b and normal pointing from b to a,
+                    for each pair of capsules
+        """
+        map_P_a, map_P_b = closest_points_between_segments(self.map_P_start[capsules_a], self.map_P_end[capsules_a],
+                                                           self.map_P_start[capsules_b], self.map_P_end[capsules_b])
+        map_V_ba = map_P_a - map_P_b
+        center_distance = np.linalg.norm(map_V_ba, axis=1)
+        map_V_n = np.where(center_distance[:, None] > 1e-9, map_V_ba / np.maximum(center_distance, 1e-9)[:, None],
+                           np.array([0, 0, 1.]))
+        radius_a = self.radii[capsules_a]
+        radius_b = self.radii[capsules_b]
+        distance = center_distance - radius_a - radius_b
+        return distance, map_P_a - map_V_n * radius_a[:, None], map_P_b + map_V_n * radius_b[:, None], map_V_n
+
+    @profile
+    def cut_off_distances_to_query(self, cut_off_distances: Dict[Tuple[my_string, my_string], float],
+                                   buffer: float = 0.05):
+        if self.query is None:
+            capsules_a, capsules_b, cut_offs, link_pairs = [], [], [], []
+            for (link_a, link_b), distance in cut_off_distances.items():
+                pair_capsules_a, pair_capsules_b = self.capsule_pairs(link_a, link_b)
+                capsules_a.append(pair_capsules_a)
+                capsules_b.append(pair_capsules_b)
+                cut_offs.append(np.full(len(pair_capsules_a), distance + buffer))
+                link_pairs.append(np.full(len(pair_capsules_a), len(link_pairs)))
+            if capsules_a:
+                self.query = (np.concatenate(capsules_a), np.concatenate(capsules_b), np.concatenate(cut_offs),
+                              np.concatenate(link_pairs))
+            else:
+                empty = np.zeros(0, dtype=int)
+                self.query = (empty, empty, np.zeros(0), empty)
+        return self.query
+
+    def prepare_collision_check(self, cut_off_distances):
+        if self.distance_fields.is_enabled():
+            cut_off_distances = self.distance_fields.split_cut_off_distances(cut_off_distances)
+        self.cut_off_distances_to_query(cut_off_distances)
+        self.is_prepared = True
+
+    @profile
+    def check_collisions(self, cut_off_distances, collision_list_size):
+        """
+        Like in the other collision checkers, each pair of collision objects contributes at most its closest contact.
+        """
+        if not self.is_prepared:
+            self.prepare_collision_check(cut_off_distances)
+        self.is_prepared = False
+        capsules_a, capsules_b, cut_offs, _ = self.query
+        distance, map_P_pa, map_P_pb, map_V_n = self.compute_distances(capsules_a, capsules_b)
+        # closest capsule pair per pair of collision objects
+        object_pairs = self.capsule_object[capsules_a] * len(self.object_link_names) + self.capsule_object[capsules_b]
+        order = np.lexsort((distance, object_pairs))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = object_pairs[order][1:] != object_pairs[order][:-1]
+        closest = order[first]
+        closest = closest[distance[closest] <= cut_offs[closest]]
+        collisions = Collisions(collision_list_size)
+        collisions.add_batch(link_a=[self.object_link_names[i] for i in self.capsule_object[capsules_a[closest]]],
+                             link_b=[self.object_link_names[i] for i in self.capsule_object[capsules_b[closest]]],
+                             contact_distance=distance[closest],
+                             map_P_pa=map_P_pa[closest],
+                             map_P_pb=map_P_pb[closest],
+                             map_V_n=map_V_n[closest])
+        if self.distance_fields.is_enabled():
+            self.distance_fields.add_collisions(collisions)
+        return collisions
+
+    def get_distances(self, link_combinations: Sequence[Tuple[my_string, my_string]]) -> np.ndarray:
+        """
+        :return: approximated distance of each link pair, inf if one of them has no collision geometry
+        """
+        capsules_a, capsules_b, link_pairs = [], [], []
+        for i, (link_a, link_b) in enumerate(link_combinations):
+            pair_capsules_a, pair_capsules_b = self.capsule_pairs(link_a, link_b)
+            capsules_a.append(pair_capsules_a)
+            capsules_b.append(pair_capsules_b)
+            link_pairs.append(np.full(len(pair_capsules_a), i))
+        result = np.full(len(link_combinations), np.inf)
+        if capsules_a:
+            distance = self.compute_distances(np.concatenate(capsules_a), np.concatenate(capsules_b))[0]
+            np.minimum.at(result, np.concatenate(link_pairs), distance)
+        return result
+
+    def check_collisions2(self, link_combinations, distance):
+        self.sync()
+        link_combinations = list(link_combinations)
+        in_collision = self.get_distances(link_combinations) < distance
+        return {link_combination for link_combination, x in zip(link_combinations, in_collision) if x}
+
+    def in_collision(self, link_a, link_b, distance):
+        return self.get_distances([(link_a, link_b)])[0] < distance
@@ -2,7 +2,7 @@ from geometry_msgs.msg import Pose, Point, PoseStamped, Quaternion
 
 import giskardpy.model.pybullet_wrapper as pbw
 from giskardpy.data_types import BiDict
-from giskardpy.model.collision_world_syncer import CollisionWorldSynchronizer, Collisions, Collision
+from giskardpy.model.collision_world_syncer import CollisionWorldSynchronizer, Collisions
 from giskardpy.model.pybullet_wrapper import ContactInfo
 from giskardpy.utils.utils import resolve_ros_iris
 
@@ -56,21 +56,27 @@ class PyBulletSyncer(CollisionWorldSynchronizer):
         :return: (robot_link, body_b, link_b) -> Collision
         :rtype: Collisions
         """
-        collisions = Collisions(collision_list_size)
+        link_a_list, link_b_list, contact_distance = [], [], []
+        map_P_pa, map_P_pb, map_V_n = [], [], []
         for (link_a, link_b), distance in cut_off_distances.items():
             link_b_id = self.object_name_to_bullet_id[link_b]
             robot_link_id = self.object_name_to_bullet_id[link_a]
             contacts = [ContactInfo(*x) for x in pbw.getClosestPoints(robot_link_id, link_b_id,
                                                                       distance * 1.1)]
-            if len(contacts) > 0:
-                for contact in contacts:  # type: ContactInfo
-                    collision = Collision(link_a=link_a,
-                                          link_b=link_b,
-                                          map_P_pa=contact.position_on_a,
-                                          map_P_pb=contact.position_on_b,
-                                          map_V_n=contact.contact_normal_on_b,
-                                          contact_distance=contact.contact_distance)
-                    collisions.add(collision)
+            for contact in contacts:  # type: ContactInfo
+                link_a_list.append(link_a)
+                link_b_list.append(link_b)
+                map_P_pa.append(contact.position_on_a)
+                map_P_pb.append(contact.position_on_b)
+                map_V_n.append(contact.contact_normal_on_b)
+                contact_distance.append(contact.contact_distance)
+        collisions = Collisions(collision_list_size)
+        collisions.add_batch(link_a=link_a_list,
+                             link_b=link_b_list,
+                             contact_distance=contact_distance,
+                             map_P_pa=map_P_pa,
+                             map_P_pb=map_P_pb,
+                             map_V_n=map_V_n)
         return collisions
 
     def in_collision(self, link_a, link_b, distance):
@@ -1,34 +1,165 @@
 from __future__ import annotations
-from collections import OrderedDict, defaultdict
-from typing import List, Union, Dict
 
+import struct
+import zipfile
+from typing import List, Union, Dict, Optional
+
+import numpy as np
 import rospy
 from trajectory_msgs.msg import JointTrajectory, JointTrajectoryPoint
 
 from giskardpy.data_types import JointStates
 from giskardpy.model.joints import Joint, OmniDrive, MovableJoint
-from giskardpy.my_types import PrefixName
+from giskardpy.my_types import PrefixName, Derivatives
+
+
+def _load_npz(file_name: str, mmap_mode: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    Like np.load, but also memory maps the arrays of uncompressed .npz files, if mmap_mode is not None.
+    """
+    if mmap_mode is None:
+        with np.load(file_name) as npz_file:
+            return {key: npz_file[key] for key in npz_file.files}
+    arrays = {}
+    with zipfile.ZipFile(file_name) as zip_file, open(file_name, 'rb') as f:
+        for info in zip_file.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f'Can\'t memory map compressed array {info.filename} in {file_name}.')
+            # the local file header has a fixed size of 30 bytes, followed by the file name and an extra field
+            f.seek(info.header_offset + 26)
+            file_name_length, extra_field_length = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + file_name_length + extra_field_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            arrays[info.filename[:-len('.npy')]] = np.memmap(file_name, dtype=dtype, mode=mmap_mode, offset=f.tell(),
+                                                             shape=shape, order='F' if fortran_order else 'C')
+    return arrays
 
 
 class Trajectory:
+    """
+    Stores the JointStates of all time steps in one (time, free variable, derivative) array.
+    Appending is amortized O(1). JointStates returned by get_exact are read-only snapshots of their time step,
+    they are created once per time step and not affected by later changes of the trajectory.
+    """
+    _times: np.ndarray
+    _data: np.ndarray
+    _valid: np.ndarray
+    _names: List[PrefixName]
+    _name_to_column: Dict[PrefixName, int]
+    _time_to_row: Dict[int, int]
     _points: Dict[int, JointStates]
 
     def __init__(self):
         self.clear()
 
     def clear(self):
-        self._points = OrderedDict()
+        self._times = np.zeros(16, dtype=int)
+        self._data = np.zeros((16, 0, len(Derivatives)))
+        # which free variables are part of the JointStates of each time step
+        self._valid = np.zeros((16, 0), dtype=bool)
+        self._length = 0
+        self._names = []
+        self._name_to_column = {}
+        self._time_to_row = {}
+        # JointStates created by get_exact, they are removed when their row is overwritten
+        self._points = {}
+        self._columns_cache = (None, None)
+
+    @property
+    def names(self) -> List[PrefixName]:
+        return self._names
+
+    @property
+    def data(self) -> np.ndarray:
+        """
+        (time, free variable, derivative) array, the free variables are in the same order as self.names
+        """
+        return self._data[:self._length]
+
+    @property
+    def valid(self) -> np.ndarray:
+        """
+        (time, free variable) array, which is True, if the free variable is part of that time step
+        """
+        return self._valid[:self._length]
+
+    def _grow(self):
+        capacity = max(16, len(self._times) * 2)
+        times = np.zeros(capacity, dtype=self._times.dtype)
+        times[:self._length] = self._times[:self._length]
+        data = np.zeros((capacity,) + self._data.shape[1:])
+        data[:self._length] = self._data[:self._length]
+        valid = np.zeros((capacity,) + self._valid.shape[1:], dtype=bool)
+        valid[:self._length] = self._valid[:self._length]
+        self._times, self._data, self._valid = times, data, valid
 
-    def get_exact(self, time):
-        return self._points[time]
+    def _add_columns(self, names: List[PrefixName]):
+        for name in names:
+            self._name_to_column[name] = len(self._names)
+            self._names.append(name)
+        number_of_new_columns = len(names)
+        self._data = np.concatenate([self._data,
+                                     np.zeros((self._data.shape[0], number_of_new_columns, len(Derivatives)))],
+                                    axis=1)
+        self._valid = np.concatenate([self._valid,
+                                      np.zeros((self._valid.shape[0], number_of_new_columns), dtype=bool)],
+                                     axis=1)
+
+    def _columns(self, point: JointStates) -> np.ndarray:
+        version, columns = self._columns_cache
+        if version == point.version:
+            return columns
+        new_names = [name for name in point.names if name not in self._name_to_column]
+        if new_names:
+            self._add_columns(new_names)
+        columns = np.array([self._name_to_column[name] for name in point.names], dtype=int)
+        self._columns_cache = (point.version, columns)
+        return columns
+
+    def _get_point(self, row: int) -> JointStates:
+        try:
+            return self._points[row]
+        except KeyError:
+            columns = np.flatnonzero(self._valid[row])
+            if len(columns) == len(self._names):
+                data = self._data[row].copy()
+            else:
+                data = self._data[row, columns]
+            data.flags.writeable = False
+            point = JointStates.from_array([self._names[column] for column in columns], data)
+            self._points[row] = point
+            return point
+
+    def get_exact(self, time) -> JointStates:
+        return self._get_point(self._time_to_row[time])
 
     def set(self, time: int, point: JointStates):
-        if len(self._points) > 0 and list(self._points.keys())[-1] > time:
+        """
+        Copies the values of point into the trajectory.
+        """
+        if self._length > 0 and self._times[self._length - 1] > time:
             raise KeyError('Cannot append a trajectory point that is before the current end time of the trajectory.')
-        self._points[time] = point
+        if self._length > 0 and self._times[self._length - 1] == time:
+            row = self._length - 1
+            self._points.pop(row, None)
+        else:
+            if self._length == len(self._times):
+                self._grow()
+            row = self._length
+            self._times[row] = time
+            self._time_to_row[time] = row
+            self._length += 1
+        columns = self._columns(point)
+        self._data[row, columns] = point.data
+        self._valid[row] = False
+        self._valid[row, columns] = True
 
     def __len__(self) -> int:
-        return len(self._points)
+        return self._length
 
     def get_joint_names(self):
         if len(self) == 0:
@@ -36,22 +167,73 @@ class Trajectory:
         return list(self.get_exact(0).keys())
 
     def delete(self, time):
-        del self._points[time]
+        row = self._time_to_row[time]
+        if row == self._length - 1:
+            self.delete_last()
+            return
+        self._times[row:self._length - 1] = self._times[row + 1:self._length]
+        self._data[row:self._length - 1] = self._data[row + 1:self._length]
+        self._valid[row:self._length - 1] = self._valid[row + 1:self._length]
+        self._length -= 1
+        del self._time_to_row[time]
+        self._time_to_row = {t: i for i, t in enumerate(self._time_to_row)}
+        self._points = {}
 
     def delete_last(self):
-        self.delete(list(self._points.keys())[-1])
+        if self._length == 0:
+            raise IndexError('Trajectory is empty.')
+        # times are appended in increasing order, so the last inserted time is the last time step
+        self._time_to_row.popitem()
+        self._length -= 1
+        self._points.pop(self._length, None)
 
-    def get_last(self):
-        return list(self._points.values())[-1]
+    def get_last(self) -> JointStates:
+        if self._length == 0:
+            raise IndexError('Trajectory is empty.')
+        return self._get_point(self._length - 1)
 
     def items(self):
-        return self._points.items()
+        return [(time, self._get_point(row)) for time, row in self._time_to_row.items()]
 
     def keys(self):
-        return self._points.keys()
+        return self._time_to_row.keys()
 
     def values(self):
-        return self._points.values()
+        return [self._get_point(row) for row in range(self._length)]
+
+    def to_np(self, names: List[PrefixName]) -> np.ndarray:
+        """
+        :return: (time, len(names), derivative) array
+        """
+        columns = [self._name_to_column[name] for name in names]
+        return self.data[:, columns]
+
+    def save(self, file_name: str):
+        """
+        Saves the trajectory as uncompressed .npz file, which can be memory mapped with load.
+        """
+        np.savez(file_name,
+                 times=np.array(list(self._time_to_row)),
+                 data=self.data,
+                 valid=self.valid,
+                 names=np.array([str(name) for name in self._names]))
+
+    @classmethod
+    def load(cls, file_name: str, mmap_mode: Optional[str] = None) -> Trajectory:
+        """
+        :param mmap_mode: see np.memmap, if not None, the data is memory mapped instead of being read into memory
+        """
+        arrays = _load_npz(file_name, mmap_mode)
+        self = cls()
+        times = np.array(arrays['times'])
+        self._length = len(times)
+        self._times = times
+        self._data = arrays['data']
+        self._valid = arrays['valid']
+        self._names = [PrefixName.from_string(str(name), set_none_if_no_slash=True) for name in arrays['names']]
+        self._name_to_column = {name: i for i, name in enumerate(self._names)}
+        self._time_to_row = {time: i for i, time in enumerate(times.tolist())}
+        return self
 
     def to_msg(self, sample_period: float, start_time: Union[rospy.Duration, float], joints: List[MovableJoint],
                fill_velocity_values: bool = True) -> JointTrajectory:
@@ -60,22 +242,27 @@ class Trajectory:
         trajectory_msg = JointTrajectory()
         trajectory_msg.header.stamp = start_time
         trajectory_msg.joint_names = []
-        for i, (time, traj_point) in enumerate(self.items()):
+        if len(self) == 0:
+            return trajectory_msg
+        free_variables = []
+        for joint in joints:
+            for free_variable in joint.get_position_variables():
+                if free_variable not in self._name_to_column \
+                        or not np.all(self.valid[:, self._name_to_column[free_variable]]):
+                    raise NotImplementedError('generated traj does not contain all joints')
+                free_variables.append(free_variable)
+                joint_name = free_variable
+                if isinstance(joint_name, PrefixName):
+                    joint_name = joint_name.short_name
+                trajectory_msg.joint_names.append(joint_name)
+        data = self.to_np(free_variables)
+        positions = data[:, :, Derivatives.position].tolist()
+        velocities = data[:, :, Derivatives.velocity].tolist()
+        for time, position, velocity in zip(self._time_to_row, positions, velocities):
             p = JointTrajectoryPoint()
             p.time_from_start = rospy.Duration(time * sample_period)
-            for joint in joints:
-                free_variables = joint.get_position_variables()
-                for free_variable in free_variables:
-                    if free_variable in traj_point:
-                        if i == 0:
-                            joint_name = free_variable
-                            if isinstance(joint_name, PrefixName):
-                                joint_name = joint_name.short_name
-                            trajectory_msg.joint_names.append(joint_name)
-                        p.positions.append(traj_point[free_variable].position)
-                        if fill_velocity_values:
-                            p.velocities.append(traj_point[free_variable].velocity)
-                    else:
-                        raise NotImplementedError('generated traj does not contain all joints')
+            p.positions = position
+            if fill_velocity_values:
+                p.velocities = velocity
             trajectory_msg.points.append(p)
         return trajectory_msg
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+import numpy as np
+
+from giskardpy.model.joints import FixedJoint
+from giskardpy.my_types import PrefixName
+
+if TYPE_CHECKING:
+    from giskardpy.model.world import WorldTree
+
+
+class TreeIndex:
+    """
+    Arrays over all links of a world tree, that answer chain queries without walking through the link and joint dicts.
+    Ancestor tests use the entry and exit times of an Euler tour, the lowest common ancestor is found with binary
+    lifting in O(log n).
+    Has to be rebuilt, when the model or the controlled joints change.
+    """
+
+    def __init__(self, world: WorldTree):
+        self.model_version = world.model_version
+        self.number_of_links = len(world.links)
+        self.number_of_joints = len(world.joints)
+        self.controlled_joints_version = world.controlled_joints_version
+        controlled_joints = set(world.controlled_joints)
+        self.root_link_name = world.root_link_name
+        self.link_names: List[PrefixName] = []
+        self.link_index: Dict[PrefixName, int] = {}
+        # name of the joint between each link and its parent, None for the root link
+        self.parent_joint_names: List[Optional[PrefixName]] = []
+        parents = []
+        depths = []
+        entry_times = []
+        exit_times = {}
+        time = 0
+        stack = [(self.root_link_name, -1, 0)]
+        while stack:
+            link_name, parent, depth = stack.pop()
+            if link_name is None:
+                # all descendants of the link at index parent have been visited
+                exit_times[parent] = time
+                continue
+            index = len(self.link_names)
+            self.link_names.append(link_name)
+            self.link_index[link_name] = index
+            parents.append(parent)
+            depths.append(depth)
+            entry_times.append(time)
+            time += 1
+            link = world.links[link_name]
+            self.parent_joint_names.append(link.parent_joint_name if parent >= 0 else None)
+            stack.append((None, index, depth))
+            for joint_name in reversed(link.child_joint_names):
+                stack.append((world.joints[joint_name].child_link_name, index, depth + 1))
+        number_of_links = len(self.link_names)
+        self.parent = np.array(parents, dtype=int)
+        self.depth = np.array(depths, dtype=int)
+        self.entry_time = np.array(entry_times, dtype=int)
+        self.exit_time = np.array([exit_times[i] for i in range(number_of_links)], dtype=int)
+
+        # ancestors[k, i] is the 2^k-th ancestor of link i, the root is its own ancestor
+        levels = max(1, int(np.max(self.depth, initial=0)).bit_length())
+        self.ancestors = np.zeros((levels, number_of_links), dtype=int)
+        self.ancestors[0] = np.where(self.parent >= 0, self.parent, 0)
+        for k in range(1, levels):
+            self.ancestors[k] = self.ancestors[k - 1][self.ancestors[k - 1]]
+
+        # properties of the parent joint of each link
+        self.is_fixed = np.zeros(number_of_links, dtype=bool)
+        self.is_controlled = np.zeros(number_of_links, dtype=bool)
+        for i, joint_name in enumerate(self.parent_joint_names):
+            if joint_name is not None:
+                self.is_fixed[i] = isinstance(world.joints[joint_name], FixedJoint)
+                self.is_controlled[i] = joint_name in controlled_joints
+        # number of movable and of movable controlled joints between the root and each link,
+        # links are sorted by their entry time, therefore parents come before their children
+        self.number_of_movable_joints = np.zeros(number_of_links, dtype=int)
+        self.number_of_controlled_movable_joints = np.zeros(number_of_links, dtype=int)
+        # closest movable and controlled joints at or above the parent joint of each link
+        self.movable_parent_joint: List[Optional[PrefixName]] = [None] * number_of_links
+        self.controlled_parent_joint: List[Optional[PrefixName]] = [None] * number_of_links
+        for i in range(1, number_of_links):
+            parent = self.parent[i]
+            movable = not self.is_fixed[i]
+            self.number_of_movable_joints[i] = self.number_of_movable_joints[parent] + movable
+            self.number_of_controlled_movable_joints[i] = self.number_of_controlled_movable_joints[parent] \
+                                                          + (movable and self.is_controlled[i])
+            joint_name = self.parent_joint_names[i]
+            self.movable_parent_joint[i] = joint_name if movable else self.movable_parent_joint[parent]
+            self.controlled_parent_joint[i] = joint_name if self.is_controlled[i] \
+                else self.controlled_parent_joint[parent]
+
+    def is_outdated(self, world: WorldTree) -> bool:
+        return self.model_version != world.model_version \
+            or self.number_of_links != len(world.links) \
+            or self.number_of_joints != len(world.joints) \
+            or self.controlled_joints_version != world.controlled_joints_version
+
+    def index(self, link_name: PrefixName) -> int:
+        try:
+            return self.link_index[link_name]
+        except KeyError:
+            raise ValueError(f'{link_name} is not connected to {self.root_link_name}')
+
+    def is_ancestor(self, ancestor: int, descendant: int) -> bool:
+        """
+        :return: True, if ancestor is above descendant or they are the same link
+        """
+        return self.entry_time[ancestor] <= self.entry_time[descendant] \
+            and self.exit_time[descendant] <= self.exit_time[ancestor]
+
+    def lowest_common_ancestor(self, a: int, b: int) -> int:
+        if self.is_ancestor(a, b):
+            return a
+        if self.is_ancestor(b, a):
+            return b
+        for k in range(len(self.ancestors) - 1, -1, -1):
+            ancestor = self.ancestors[k, a]
+            if not self.is_ancestor(ancestor, b):
+                a = ancestor
+        return self.parent[a]
+
+    def compute_chain(self,
+                      root: int,
+                      tip: int,
+                      add_joints: bool,
+                      add_links: bool,
+                      add_fixed_joints: bool,
+                      add_non_controlled_joints: bool) -> List[PrefixName]:
+        """
+        Same as WorldTree.compute_chain, but with link indices.
+        """
+        if not self.is_ancestor(root, tip):
+            raise ValueError(f'{self.link_names[root]} and {self.link_names[tip]} are not connected')
+        chain = []
+        if add_links:
+            chain.append(self.link_names[tip])
+        link = tip
+        while link != root:
+            if add_joints:
+                if (add_fixed_joints or not self.is_fixed[link]) and \
+                        (add_non_controlled_joints or self.is_controlled[link]):
+                    chain.append(self.parent_joint_names[link])
+            link = self.parent[link]
+            if add_links:
+                chain.append(self.link_names[link])
+        chain.reverse()
+        return chain
+
+    def number_of_movable_joints_between(self, a: int, b: int, only_controlled: bool) -> int:
+        counts = self.number_of_controlled_movable_joints if only_controlled else self.number_of_movable_joints
+        return counts[a] + counts[b] - 2 * counts[self.lowest_common_ancestor(a, b)]
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
 import abc
+import os
+from collections import OrderedDict
 from abc import ABC
 from functools import cached_property
 from itertools import combinations
@@ -20,17 +22,22 @@ from giskardpy.configs.data_types import RobotInterfaceConfig
 from giskardpy.data_types import JointStates, KeyDefaultDict
 from giskardpy.exceptions import DuplicateNameException, UnknownGroupException, UnknownLinkException, \
     PhysicsWorldException, GiskardException
-from giskardpy.god_map import GodMap
+from giskardpy.god_map import GodMap, ParameterPlan
 from giskardpy.model.joints import Joint, FixedJoint, PrismaticJoint, RevoluteJoint, OmniDrive, DiffDrive, \
-    urdf_to_joint, VirtualFreeVariables, MovableJoint
+    urdf_to_joint, VirtualFreeVariables, MovableJoint, ParameterizedFixedJoint
 from giskardpy.model.links import Link
+from giskardpy.model.tree_index import TreeIndex
 from giskardpy.model.utils import hacky_urdf_parser_fix
 from giskardpy.my_types import PrefixName, Derivatives, derivative_joint_map, derivative_map
 from giskardpy.my_types import my_string
 from giskardpy.qp.free_variable import FreeVariable
 from giskardpy.utils import logging
+from giskardpy.utils.file_cache import LRUFileCache
 from giskardpy.utils.tfwrapper import homo_matrix_to_pose, np_to_pose, msg_to_homogeneous_matrix, make_transform
-from giskardpy.utils.utils import suppress_stderr, memoize, copy_memoize, clear_memo
+from giskardpy.utils.utils import suppress_stderr, memoize, copy_memoize, clear_memo, get_c_code_cache
+
+# compiled fks of subtrees that are no longer part of the world are kept, until there are more than this many
+max_cached_fk_subtrees = 100
 
 
 class TravelCompanion:
@@ -131,6 +138,10 @@ class WorldTree(WorldTreeInterface):
         self.fast_all_fks = None
         self._state_version = 0
         self._model_version = 0
+        self._controlled_joints_version = 0
+        self._cmd_rows_cache = None
+        self._fk_subtree_cache: Dict[str, tuple] = OrderedDict()
+        self._tree_index: Optional[TreeIndex] = None
         self._clear()
 
     def get_joint_name(self, joint_name: my_string, group_name: Optional[str] = None) -> PrefixName:
@@ -233,7 +244,6 @@ class WorldTree(WorldTreeInterface):
         """
         clear_memo(self.compute_fk_pose)
         clear_memo(self.compute_fk_pose_with_collision_offset)
-        self._recompute_fks()
         self._state_version += 1
 
     def reset_cache(self):
@@ -241,14 +251,10 @@ class WorldTree(WorldTreeInterface):
         clear_memo(self.get_directly_controlled_child_links_with_collisions)
         clear_memo(self.get_directly_controlled_child_links_with_collisions)
         clear_memo(self.compute_chain_reduced_to_controlled_joints)
-        clear_memo(self.get_movable_parent_joint)
-        clear_memo(self.get_controlled_parent_joint_of_link)
-        clear_memo(self.get_controlled_parent_joint_of_joint)
-        clear_memo(self.compute_split_chain)
-        clear_memo(self.are_linked)
         clear_memo(self.compose_fk_expression)
-        clear_memo(self.compute_chain)
+        clear_memo(self._compile_fk_batch)
         clear_memo(self.is_link_controlled)
+        self._tree_index = None
 
     @profile
     def notify_model_change(self):
@@ -456,18 +462,35 @@ class WorldTree(WorldTreeInterface):
         self.virtual_free_variables[name] = free_variable
         return free_variable
 
+    def _get_cmd_rows(self, position_names: Tuple[str, ...]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: rows in self.state.data of the free variables in position_names and a mask which of the
+                    position_names belong to a free variable of this world
+        """
+        key = (position_names, self.state.version, self._model_version)
+        if self._cmd_rows_cache is None or self._cmd_rows_cache[0] != key:
+            position_name_to_name = {v.position_name: k for k, v in self.free_variables.items()}
+            mask = np.array([name in position_name_to_name for name in position_names], dtype=bool)
+            rows = np.array([self.state.index(position_name_to_name[name])
+                             for name in position_names if name in position_name_to_name], dtype=int)
+            # index() adds unknown free variables to the state, which changes its version
+            key = (position_names, self.state.version, self._model_version)
+            self._cmd_rows_cache = (key, rows, mask)
+        return self._cmd_rows_cache[1], self._cmd_rows_cache[2]
+
+    @profile
     def update_state(self, new_cmds: Dict[int, Dict[str, float]], dt: float):
-        for free_variable_name, free_variable in self.free_variables.items():
-            try:
-                vel = new_cmds[Derivatives.velocity][free_variable.position_name]
-            except KeyError as e:
-                # joint is currently not part of the optimization problem
-                continue
-            self.state[free_variable_name][Derivatives.position] += vel * dt
-            self.state[free_variable_name][Derivatives.velocity] = vel
-            for derivative, cmd in new_cmds.items():
-                cmd_ = cmd[free_variable.position_name]
-                self.state[free_variable_name][derivative] = cmd_
+        """
+        :param new_cmds: derivative -> position name of free variable -> command,
+                            all derivatives have to contain the same free variables in the same order
+        """
+        velocities = new_cmds[Derivatives.velocity]
+        # free variables that are currently not part of the optimization problem are not touched
+        rows, mask = self._get_cmd_rows(tuple(velocities))
+        data = self.state.data
+        for derivative, cmd in new_cmds.items():
+            data[rows, derivative] = np.fromiter(cmd.values(), dtype=float, count=len(cmd))[mask]
+        data[rows, Derivatives.position] += data[rows, Derivatives.velocity] * dt
         for joint in self.joints.values():
             if isinstance(joint, VirtualFreeVariables):
                 joint.update_state(dt)
@@ -545,10 +568,10 @@ class WorldTree(WorldTreeInterface):
         self._raise_if_link_does_not_exist(child_link.name)
         if joint_name is None:
             joint_name = PrefixName(f'{parent_link.name}_{child_link.name}_fixed_joint', None)
-        connecting_joint = FixedJoint(name=joint_name,
-                                      parent_link_name=parent_link.name,
-                                      child_link_name=child_link.name,
-                                      parent_T_child=transform)
+        connecting_joint = ParameterizedFixedJoint(name=joint_name,
+                                                   parent_link_name=parent_link.name,
+                                                   child_link_name=child_link.name,
+                                                   parent_T_child=transform)
         self._link_joint_to_links(connecting_joint)
 
     def _replace_joint(self, new_joint: Joint):
@@ -706,11 +729,10 @@ class WorldTree(WorldTreeInterface):
             raise KeyError(f'no controlled joint in chain between {link_a} and {link_b}')
         return new_link_a, new_link_b
 
-    @memoize
     def get_movable_parent_joint(self, link_name: PrefixName) -> PrefixName:
-        joint = self.links[link_name].parent_joint_name
-        while not self.is_joint_movable(joint):
-            joint = self.links[self.joints[joint].parent_link_name].parent_joint_name
+        joint = self.tree_index.movable_parent_joint[self.tree_index.index(link_name)]
+        if joint is None:
+            raise KeyError(f'\'{link_name}\' has no movable parent joint.')
         return joint
 
     def get_parent_group_name(self, group_name: str) -> str:
@@ -747,10 +769,10 @@ class WorldTree(WorldTreeInterface):
             link = Link.from_world_body(link_name=PrefixName(group_name, group_name), msg=msg,
                                         color=self.default_link_color)
             self._add_link(link)
-            joint = FixedJoint(name=PrefixName(group_name, self.connection_prefix),
-                               parent_link_name=parent_link_name,
-                               child_link_name=link.name,
-                               parent_T_child=w.TransMatrix(pose))
+            joint = ParameterizedFixedJoint(name=PrefixName(group_name, self.connection_prefix),
+                                            parent_link_name=parent_link_name,
+                                            child_link_name=link.name,
+                                            parent_T_child=w.TransMatrix(pose))
             self._link_joint_to_links(joint)
             self.register_group(group_name, link.name)
             self.notify_model_change()
@@ -841,12 +863,19 @@ class WorldTree(WorldTreeInterface):
                                     joint_name: PrefixName,
                                     new_parent_T_child: w.TransMatrix,
                                     notify: bool = True):
+        """
+        Changing a ParameterizedFixedJoint, e.g. the root joint of a group added with add_world_body, is only a state
+        change, other fixed joints change the model.
+        """
         joint = self.joints[joint_name]
         if not isinstance(joint, FixedJoint):
             raise NotImplementedError('Can only change fixed joints')
         joint.parent_T_child = new_parent_T_child
         if notify:
-            self.notify_model_change()
+            if isinstance(joint, ParameterizedFixedJoint):
+                self.notify_state_change()
+            else:
+                self.notify_model_change()
 
     def cleanup_unused_free_variable(self):
         used_variables = []
@@ -943,17 +972,27 @@ class WorldTree(WorldTreeInterface):
             raise UnknownGroupException(f'Trying to register unknown joints: \'{unknown_joints}\'')
         old_controlled_joints.update(new_controlled_joints)
         self.god_map.set_data(identifier.controlled_joints, list(sorted(old_controlled_joints)))
+        self._controlled_joints_version += 1
+
+    @property
+    def controlled_joints_version(self) -> int:
+        """
+        :return: number that increased every time controlled joints were registered
+        """
+        return self._controlled_joints_version
 
-    @memoize
     def get_controlled_parent_joint_of_link(self, link_name: PrefixName) -> PrefixName:
-        joint = self.links[link_name].parent_joint_name
-        if self.is_joint_controlled(joint):
-            return joint
-        return self.get_controlled_parent_joint_of_joint(joint)
+        joint = self.tree_index.controlled_parent_joint[self.tree_index.index(link_name)]
+        if joint is None:
+            raise KeyError(f'\'{link_name}\' has no controlled parent joint.')
+        return joint
 
-    @memoize
     def get_controlled_parent_joint_of_joint(self, joint_name: PrefixName) -> PrefixName:
-        return self.search_for_parent_joint(joint_name, self.is_joint_controlled)
+        parent_link_name = self.joints[joint_name].parent_link_name
+        joint = self.tree_index.controlled_parent_joint[self.tree_index.index(parent_link_name)]
+        if joint is None:
+            raise KeyError(f'\'{joint_name}\' has no fitting parent joint.')
+        return joint
 
     def search_for_parent_joint(self,
                                 joint_name: PrefixName,
@@ -966,8 +1005,16 @@ class WorldTree(WorldTreeInterface):
             raise KeyError(f'\'{joint_name}\' has no fitting parent joint.')
         return joint
 
+    @property
+    def tree_index(self) -> TreeIndex:
+        """
+        Rebuilt, when the model or the controlled joints have changed.
+        """
+        if self._tree_index is None or self._tree_index.is_outdated(self):
+            self._tree_index = TreeIndex(self)
+        return self._tree_index
+
     @profile
-    @memoize
     def compute_chain(self,
                       root_link_name: PrefixName,
                       tip_link_name: PrefixName,
@@ -986,26 +1033,11 @@ class WorldTree(WorldTreeInterface):
         :param add_non_controlled_joints: only used if add_joints == True
         :return:
         """
-        chain = []
-        if add_links:
-            chain.append(tip_link_name)
-        link = self.links[tip_link_name]
-        while link.name != root_link_name:
-            if link.parent_joint_name not in self.joints:
-                raise ValueError(f'{root_link_name} and {tip_link_name} are not connected')
-            parent_joint = self.joints[link.parent_joint_name]
-            parent_link = self.links[parent_joint.parent_link_name]
-            if add_joints:
-                if (add_fixed_joints or not isinstance(parent_joint, FixedJoint)) and \
-                        (add_non_controlled_joints or parent_joint.name in self.controlled_joints):
-                    chain.append(parent_joint.name)
-            if add_links:
-                chain.append(parent_link.name)
-            link = parent_link
-        chain.reverse()
-        return chain
+        tree_index = self.tree_index
+        return tree_index.compute_chain(tree_index.index(root_link_name), tree_index.index(tip_link_name),
+                                        add_joints, add_links, add_fixed_joints, add_non_controlled_joints)
 
-    @memoize
+    @profile
     def compute_split_chain(self,
                             root_link_name: PrefixName,
                             tip_link_name: PrefixName,
@@ -1030,24 +1062,20 @@ class WorldTree(WorldTreeInterface):
         """
         if root_link_name == tip_link_name:
             return [], [], []
-        root_chain = self.compute_chain(self.root_link_name, root_link_name, False, True, True, True)
-        tip_chain = self.compute_chain(self.root_link_name, tip_link_name, False, True, True, True)
-        for i in range(min(len(root_chain), len(tip_chain))):
-            if root_chain[i] != tip_chain[i]:
-                break
-        else:
-            i += 1
-        connection = tip_chain[i - 1]
-        root_chain = self.compute_chain(connection, root_link_name, add_joints, add_links, add_fixed_joints,
-                                        add_non_controlled_joints)
+        tree_index = self.tree_index
+        root = tree_index.index(root_link_name)
+        tip = tree_index.index(tip_link_name)
+        connection = tree_index.lowest_common_ancestor(root, tip)
+        root_chain = tree_index.compute_chain(connection, root, add_joints, add_links, add_fixed_joints,
+                                              add_non_controlled_joints)
         if add_links:
             root_chain = root_chain[1:]
         root_chain = root_chain[::-1]
-        tip_chain = self.compute_chain(connection, tip_link_name, add_joints, add_links, add_fixed_joints,
-                                       add_non_controlled_joints)
+        tip_chain = tree_index.compute_chain(connection, tip, add_joints, add_links, add_fixed_joints,
+                                             add_non_controlled_joints)
         if add_links:
             tip_chain = tip_chain[1:]
-        return root_chain, [connection] if add_links else [], tip_chain
+        return root_chain, [tree_index.link_names[connection]] if add_links else [], tip_chain
 
     @copy_memoize
     @profile
@@ -1116,9 +1144,10 @@ class WorldTree(WorldTreeInterface):
                     self.fk_idx[link.name] = i
                     i += 1
             fks = w.vstack(fks)
-            self.fast_all_fks = fks.compile(w.free_symbols(fks))
+            self.fast_all_fks = fks.compile(w.free_symbols(fks), c_code_cache=get_c_code_cache())
+            self.all_fks_parameter_plan = self.god_map.create_parameter_plan(self.fast_all_fks.str_params)
 
-        fks_evaluated = self.fast_all_fks.call2(self.god_map.unsafe_get_values(self.fast_all_fks.str_params))
+        fks_evaluated = self.fast_all_fks.call2(self.all_fks_parameter_plan.unsafe_get_values())
         result = {}
         for link in self.link_names_with_collisions:
             result[link] = fks_evaluated[self.fk_idx[link], :]
@@ -1147,52 +1176,232 @@ class WorldTree(WorldTreeInterface):
 
     @profile
     def compute_all_fks_matrix(self):
+        self._recompute_fks()
         return self._fk_computer.collision_fk_matrix
 
     @profile
-    def init_all_fks(self):
-        class ExpressionCompanion(TravelCompanion):
-            idx_start: Dict[PrefixName, int]
-            fast_collision_fks: CompiledFunction
-            fast_all_fks: CompiledFunction
+    def compute_all_fks_matrix_batch(self, free_variable_names: Sequence[PrefixName],
+                                     positions: np.ndarray) -> np.ndarray:
+        """
+        Like compute_all_fks_matrix, but for many configurations at once.
+        Free variables that are not in free_variable_names keep their current position.
+        :param positions: shape (number of configurations, len(free_variable_names))
+        :return: shape (number of configurations, *compute_all_fks_matrix().shape)
+        """
+        return self._fk_computer.compute_collision_fks_batch(free_variable_names, np.asarray(positions, dtype=float))
 
-            def __init__(self, world: WorldTree):
+    def _get_batch_parameters(self, fast_f: CompiledFunction, parameter_plan: ParameterPlan,
+                              free_variable_names: Sequence[PrefixName], positions: np.ndarray) -> np.ndarray:
+        """
+        :return: parameters of fast_f for each row of positions, shape (len(positions), len(fast_f.str_params)),
+                    parameters that don't belong to free_variable_names have their current value
+        """
+        parameters = np.tile(parameter_plan.unsafe_get_values(), (len(positions), 1))
+        parameter_index = {name: i for i, name in enumerate(fast_f.str_params)}
+        for column, free_variable_name in enumerate(free_variable_names):
+            free_variable = self.free_variables[free_variable_name]
+            symbol_name = str(free_variable.get_symbol(Derivatives.position))
+            if symbol_name in parameter_index:
+                parameters[:, parameter_index[symbol_name]] = positions[:, column]
+        return parameters
+
+    @memoize
+    def _compile_fk_batch(self, root: PrefixName, tips: Tuple[PrefixName, ...]) \
+            -> Tuple[CompiledFunction, ParameterPlan]:
+        fks = w.vstack([self.compose_fk_expression(root, tip) for tip in tips])
+        fast_fks = fks.compile(c_code_cache=get_c_code_cache())
+        return fast_fks, self.god_map.create_parameter_plan(fast_fks.str_params)
+
+    @profile
+    def compute_fk_batch(self,
+                         root: PrefixName,
+                         tips: Sequence[PrefixName],
+                         joint_configs: np.ndarray,
+                         free_variable_names: Optional[Sequence[PrefixName]] = None,
+                         number_of_threads: int = 0) -> np.ndarray:
+        """
+        Computes root_T_tip for many configurations with a single call of a compiled function.
+        Neither the state of the world nor its fks are changed.
+        :param joint_configs: shape (number of configurations, len(free_variable_names))
+        :param free_variable_names: free variables in the columns of joint_configs, default are all free variables
+                                    of the world in the order of self.free_variables.
+                                    Free variables that are not in free_variable_names keep their current position.
+        :param number_of_threads: the configurations are evaluated in parallel by this many threads,
+                                    <= 0 to use one per cpu
+        :return: shape (number of configurations, len(tips), 4, 4)
+        """
+        if free_variable_names is None:
+            free_variable_names = list(self.free_variables)
+        joint_configs = np.asarray(joint_configs, dtype=float).reshape(-1, len(free_variable_names))
+        if len(tips) == 0:
+            return np.zeros((len(joint_configs), 0, 4, 4))
+        if number_of_threads <= 0:
+            number_of_threads = os.cpu_count() or 1
+        fast_fks, parameter_plan = self._compile_fk_batch(root, tuple(tips))
+        parameters = self._get_batch_parameters(fast_fks, parameter_plan, free_variable_names, joint_configs)
+        result = fast_fks.call2_batch(parameters, number_of_threads=number_of_threads)
+        return result.reshape(len(joint_configs), len(tips), 4, 4)
+
+    @profile
+    def compute_all_fks_np(self) -> Tuple[np.ndarray, Dict[PrefixName, int]]:
+        """
+        :return: map_T_link of all links stacked into an array of shape (number of links, 4, 4)
+                    and the index of each link in that array
+        """
+        self._recompute_fks()
+        return self._fk_computer.fks.reshape(-1, 4, 4), self._fk_computer.link_index
+
+    @profile
+    def init_all_fks(self):
+        class SubtreeCompanion(TravelCompanion):
+            """
+            Creates the fk expressions of the links of a subtree relative to its root link.
+            The subtree ends at ParameterizedFixedJoints, their child links are the roots of other subtrees.
+            """
+            link_names: List[PrefixName]
+            collision_link_order: List[PrefixName]
+            fast_fks: CompiledFunction
+            fast_collision_fks: Optional[CompiledFunction]
+
+            def __init__(self, world: WorldTree, parent_joint_name: Optional[PrefixName], root_link_name: PrefixName):
                 self.world = world
-                self.god_map = GodMap()
-                self.fks = {self.world.root_link_name: w.TransMatrix()}
+                self.parent_joint_name = parent_joint_name
+                self.root_link_name = root_link_name
+                self.fks = {root_link_name: w.TransMatrix()}
+                self.child_joint_names = []
+                # inputs of the last evaluation, the subtree is only evaluated again if one of them changes
+                self.fks_parameters = None
+                self.map_T_root = None
 
             @profile
             def joint_call(self, joint_name: my_string) -> bool:
                 joint = self.world.joints[joint_name]
-                map_T_parent = self.fks[joint.parent_link_name]
-                self.fks[joint.child_link_name] = map_T_parent.dot(joint.parent_T_child)
+                if isinstance(joint, ParameterizedFixedJoint):
+                    self.child_joint_names.append(joint_name)
+                    return True
+                root_T_parent = self.fks[joint.parent_link_name]
+                self.fks[joint.child_link_name] = root_T_parent.dot(joint.parent_T_child)
                 return False
 
             @profile
-            def compile_fks(self):
-                all_fks = w.vstack([self.fks[link_name] for link_name in self.world.link_names_as_set])
+            def compile_fks(self, cache: Dict[str, tuple]):
+                """
+                Subtrees with the same fk expressions share their compiled functions through cache.
+                """
+                self.link_names = sorted(self.fks)
+                fks = w.vstack([self.fks[link_name] for link_name in self.link_names])
                 collision_fks = []
-                collision_ids = []
-                for link_name in self.world.link_names_with_collisions:
+                self.collision_link_order = []
+                for link_name in self.link_names:
                     if link_name == self.world.root_link_name:
                         continue
                     link = self.world.links[link_name]
                     for collision_id, geometry in enumerate(link.collisions):
-                        link_name_with_id = link.name_with_collision_id(collision_id)
                         collision_fks.append(self.fks[link_name].dot(geometry.link_T_geometry))
-                        collision_ids.append(link_name_with_id)
-                collision_fks = w.vstack(collision_fks)
-                self.collision_link_order = list(collision_ids)
-                self.fast_all_fks = all_fks.compile()
-                self.fast_collision_fks = collision_fks.compile()
-                self.idx_start = {link_name: i * 4 for i, link_name in enumerate(self.world.link_names_as_set)}
+                        self.collision_link_order.append(link.name_with_collision_id(collision_id))
+                collision_fks = w.vstack(collision_fks) if collision_fks else None
+                key = LRUFileCache.hash(fks.s.serialize(), collision_fks.s.serialize() if collision_fks else '')
+                if key not in cache:
+                    god_map = GodMap()
+                    c_code_cache = get_c_code_cache()
+                    fast_fks = fks.compile(c_code_cache=c_code_cache)
+                    fast_collision_fks = None
+                    collision_fks_parameter_plan = None
+                    if collision_fks is not None:
+                        fast_collision_fks = collision_fks.compile(c_code_cache=c_code_cache)
+                        collision_fks_parameter_plan = god_map.create_parameter_plan(fast_collision_fks.str_params)
+                    cache[key] = (fast_fks, god_map.create_parameter_plan(fast_fks.str_params),
+                                  fast_collision_fks, collision_fks_parameter_plan)
+                cache.move_to_end(key)
+                self.key = key
+                self.fast_fks, self.fks_parameter_plan, \
+                    self.fast_collision_fks, self.collision_fks_parameter_plan = cache[key]
+
+        class ExpressionCompanion:
+            """
+            Computes the fks of all links by composing the fks of subtrees, which are compiled separately.
+            """
+            idx_start: Dict[PrefixName, int]
+            link_index: Dict[PrefixName, int]
+            subtrees: List[SubtreeCompanion]
+
+            def __init__(self, world: WorldTree):
+                self.world = world
+                # state version of the world, when the fks were computed
+                self.state_version = None
+
+            @profile
+            def compile_fks(self, cache: Dict[str, tuple]):
+                self.subtrees = []
+                roots = [(None, self.world.root_link_name)]
+                while roots:
+                    parent_joint_name, root_link_name = roots.pop(0)
+                    subtree = SubtreeCompanion(self.world, parent_joint_name, root_link_name)
+                    self.world.travel_branch(root_link_name, subtree)
+                    subtree.compile_fks(cache)
+                    roots.extend((joint_name, self.world.joints[joint_name].child_link_name)
+                                 for joint_name in subtree.child_joint_names)
+                    self.subtrees.append(subtree)
+                used_keys = {subtree.key for subtree in self.subtrees}
+                for key in list(cache):
+                    if len(cache) <= max(max_cached_fk_subtrees, len(used_keys)):
+                        break
+                    if key not in used_keys:
+                        del cache[key]
+                link_names = [link_name for subtree in self.subtrees for link_name in subtree.link_names]
+                self.collision_link_order = [link_name for subtree in self.subtrees
+                                             for link_name in subtree.collision_link_order]
+                self.idx_start = {link_name: i * 4 for i, link_name in enumerate(link_names)}
+                self.link_index = {link_name: i for i, link_name in enumerate(link_names)}
+                # rows of each subtree in the fks of all links and the collision fks
+                self.link_slices = []
+                self.collision_slices = []
+                link_start = collision_start = 0
+                for subtree in self.subtrees:
+                    self.link_slices.append(slice(link_start, link_start + len(subtree.link_names)))
+                    self.collision_slices.append(slice(collision_start,
+                                                       collision_start + len(subtree.collision_link_order)))
+                    link_start += len(subtree.link_names)
+                    collision_start += len(subtree.collision_link_order)
+                self.map_T_links = np.zeros((len(link_names), 4, 4))
+                self.map_T_collisions = np.zeros((len(self.collision_link_order), 4, 4))
+                self.fks = self.map_T_links.reshape(-1, 4)
+
+            def map_T_root(self, subtree: SubtreeCompanion, map_T_links: np.ndarray) -> np.ndarray:
+                """
+                :param map_T_links: fks of all links, the ones of parent subtrees have to be computed already,
+                                    shape (..., number of links, 4, 4)
+                """
+                if subtree.parent_joint_name is None:
+                    return np.eye(4)
+                joint: ParameterizedFixedJoint = self.world.joints[subtree.parent_joint_name]
+                return map_T_links[..., self.link_index[joint.parent_link_name], :, :] @ joint.parent_T_child_np
 
             @profile
             def recompute(self):
+                """
+                Only evaluates subtrees whose parameters or root pose have changed since their last evaluation.
+                The collision fks of a subtree only depend on the parameters of its link fks.
+                """
                 self.compute_fk_np.memo.clear()
-                self.fks = self.fast_all_fks.call2(self.god_map.unsafe_get_values(self.fast_all_fks.str_params))
-                self.collision_fk_matrix = self.fast_collision_fks.call2(
-                    self.god_map.unsafe_get_values(self.fast_collision_fks.str_params))
+                for subtree, link_slice, collision_slice in zip(self.subtrees, self.link_slices,
+                                                                self.collision_slices):
+                    map_T_root = self.map_T_root(subtree, self.map_T_links)
+                    fks_parameters = subtree.fks_parameter_plan.unsafe_get_values()
+                    if subtree.fks_parameters is not None \
+                            and np.array_equal(fks_parameters, subtree.fks_parameters) \
+                            and np.array_equal(map_T_root, subtree.map_T_root):
+                        continue
+                    # the parameter buffer is shared by all subtrees with the same compiled functions
+                    subtree.fks_parameters = fks_parameters.copy()
+                    subtree.map_T_root = map_T_root
+                    root_T_links = subtree.fast_fks.call2(fks_parameters)
+                    self.map_T_links[link_slice] = map_T_root @ root_T_links.reshape(-1, 4, 4)
+                    if subtree.fast_collision_fks is not None:
+                        root_T_collisions = subtree.fast_collision_fks.call2(
+                            subtree.collision_fks_parameter_plan.unsafe_get_values())
+                        self.map_T_collisions[collision_slice] = map_T_root @ root_T_collisions.reshape(-1, 4, 4)
+                self.collision_fk_matrix = np.asfortranarray(self.map_T_collisions.reshape(-1, 4))
 
             @memoize
             @profile
@@ -1209,19 +1418,46 @@ class WorldTree(WorldTreeInterface):
                 root_T_tip = np.dot(root_T_map, map_T_tip)
                 return root_T_tip
 
+            @profile
+            def compute_collision_fks_batch(self, free_variable_names: Sequence[PrefixName],
+                                            positions: np.ndarray) -> np.ndarray:
+                map_T_links = np.zeros((len(positions),) + self.map_T_links.shape)
+                map_T_collisions = np.zeros((len(positions),) + self.map_T_collisions.shape)
+                for subtree, link_slice, collision_slice in zip(self.subtrees, self.link_slices,
+                                                                self.collision_slices):
+                    map_T_root = self.map_T_root(subtree, map_T_links)[..., None, :, :]
+                    parameters = self.world._get_batch_parameters(subtree.fast_fks, subtree.fks_parameter_plan,
+                                                                  free_variable_names, positions)
+                    root_T_links = subtree.fast_fks.call2_batch(parameters).reshape(len(positions), -1, 4, 4)
+                    map_T_links[:, link_slice] = map_T_root @ root_T_links
+                    if subtree.fast_collision_fks is not None:
+                        parameters = self.world._get_batch_parameters(subtree.fast_collision_fks,
+                                                                      subtree.collision_fks_parameter_plan,
+                                                                      free_variable_names, positions)
+                        root_T_collisions = subtree.fast_collision_fks.call2_batch(parameters)
+                        map_T_collisions[:, collision_slice] = map_T_root @ root_T_collisions.reshape(len(positions),
+                                                                                                       -1, 4, 4)
+                return map_T_collisions.reshape(len(positions), -1, 4)
+
         self._fk_computer = ExpressionCompanion(self)
-        self.travel_branch(self.root_link_name, self._fk_computer)
-        self._fk_computer.compile_fks()
+        self._fk_computer.compile_fks(self._fk_subtree_cache)
 
     @profile
     def _recompute_fks(self):
-        self._fk_computer.recompute()
+        """
+        The fks are computed lazily, when they are accessed for the first time after a state change.
+        This is not thread safe, the fks must only be accessed by the thread that changes the state.
+        Other threads have to work with copies, see CollisionWorldSynchronizer.freeze_fks.
+        """
+        if self._fk_computer.state_version != self._state_version:
+            self._fk_computer.recompute()
+            self._fk_computer.state_version = self._state_version
 
     @profile
     def compute_fk_np(self, root: PrefixName, tip: PrefixName) -> np.ndarray:
+        self._recompute_fks()
         return self._fk_computer.compute_fk_np(root, tip)
 
-    @memoize
     @profile
     def are_linked(self, link_a: PrefixName, link_b: PrefixName,
                    do_not_ignore_non_controlled_joints: bool = False,
@@ -1229,6 +1465,11 @@ class WorldTree(WorldTreeInterface):
         """
         Return True if all joints between link_a and link_b are fixed.
         """
+        if not joints_to_be_assumed_fixed:
+            tree_index = self.tree_index
+            return tree_index.number_of_movable_joints_between(
+                tree_index.index(link_a), tree_index.index(link_b),
+                only_controlled=not do_not_ignore_non_controlled_joints) == 0
         chain1, connection, chain2 = self.compute_split_chain(link_a, link_b, add_joints=True, add_links=False,
                                                               add_fixed_joints=False,
                                                               add_non_controlled_joints=do_not_ignore_non_controlled_joints)
@@ -12,6 +12,8 @@ class Constraint:
     lower_slack_limit = -1e4
     upper_slack_limit = 1e4
     linear_weight = 0
+    # name of the top level goal that created this constraint
+    goal_name: Optional[str] = None
 
     def __init__(self,
                  name: str,
@@ -50,7 +52,9 @@ class VelocityConstraint:
     lower_slack_limit = -1e3
     upper_slack_limit = 1e3
     linear_weight = 0
-    
+    # name of the top level goal that created this constraint
+    goal_name: Optional[str] = None
+
     def __init__(self,
                  name,
                  expression,
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import datetime
 import os
 from collections import OrderedDict, defaultdict
@@ -8,6 +10,7 @@ from typing import List, Dict, Tuple, Type, Union, Optional
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
+from scipy import sparse as sp
 
 from giskardpy import casadi_wrapper as w, identifier
 from giskardpy.configs.data_types import SupportedQPSolver
@@ -20,6 +23,7 @@ from giskardpy.qp.constraint import VelocityConstraint, Constraint
 from giskardpy.qp.free_variable import FreeVariable
 from giskardpy.qp.qp_solver import QPSolver
 from giskardpy.utils import logging
+from giskardpy.utils.file_cache import LRUFileCache
 from giskardpy.utils.utils import memoize, create_path, suppress_stdout, get_all_classes_in_package
 
 
@@ -171,6 +175,20 @@ class B(Parent):
     def get_upper_error_slack_limits(self):
         return {f'{c.name}/error': c.upper_slack_limit for c in self.constraints}
 
+    def get_goal_names(self) -> List[Optional[str]]:
+        """
+        Has to be called after __call__.
+        :return: for each entry of lb and ub, the name of the goal it belongs to, None for entries of free variables
+        """
+        slack_goal_names = {}
+        for t in range(self.prediction_horizon):
+            for c in self.velocity_constraints:
+                if t < c.control_horizon:
+                    slack_goal_names[f't{t:03}/{c.name}'] = c.goal_name
+        error_slack_goal_names = {f'{c.name}/error': c.goal_name for c in self.constraints}
+        goal_names = self._sorter(slack_goal_names, error_slack_goal_names)[0]
+        return [None] * (len(self.names) - len(goal_names)) + goal_names
+
     def __call__(self):
         lb = defaultdict(dict)
         ub = defaultdict(dict)
@@ -332,8 +350,166 @@ class BA(Parent):
         lbA, self.names = self._sorter(*lb_params)
         return lbA, self._sorter(*ub_params)[0]
 
+    def get_goal_names(self) -> List[Optional[str]]:
+        """
+        Has to be called after __call__.
+        :return: for each entry of lbA and ubA, the name of the goal it belongs to, None for entries of free variables
+        """
+        velocity_goal_names = {}
+        for t in range(self.prediction_horizon):
+            for c in self.velocity_constraints:
+                if t < c.control_horizon:
+                    velocity_goal_names[f't{t:03}/{c.name}'] = c.goal_name
+        error_goal_names = {f'{c.name}/e': c.goal_name for c in self.constraints}
+        goal_names = self._sorter(velocity_goal_names, error_goal_names)[0]
+        return [None] * (len(self.names) - len(goal_names)) + goal_names
+
+
+class MatrixTemplate:
+    """
+    Describes a matrix, whose entries are either constant or copies of entries of a vector, which is computed at
+    runtime: matrix[rows[i], columns[i]] = values[sources[i]]
+    """
+
+    def __init__(self, constant: np.ndarray, rows: np.ndarray, columns: np.ndarray, sources: np.ndarray):
+        self.constant = constant
+        self.rows = rows
+        self.columns = columns
+        self.sources = sources
+        self.data_indices = None
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.constant.shape
+
+    def create_dense(self) -> np.ndarray:
+        return self.constant.copy()
+
+    def create_sparse(self) -> sp.csc_matrix:
+        """
+        The sparsity pattern consists of the nonzeros of the constant part and all entries that are set in update.
+        """
+        height, width = self.shape
+        pattern = self.constant != 0
+        pattern[self.rows, self.columns] = True
+        # transposed, such that the nonzeros are ordered like in csc format
+        columns, rows = np.nonzero(pattern.T)
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(columns, minlength=width))])
+        keys = columns * height + rows
+        self.data_indices = np.searchsorted(keys, self.columns * height + self.rows)
+        return sp.csc_matrix((self.constant[rows, columns], rows.astype(np.int32), indptr.astype(np.int32)),
+                             shape=self.shape)
+
+    def update(self, matrix: Union[np.ndarray, sp.csc_matrix], values: np.ndarray):
+        """
+        Writes values into a matrix that was created with create_dense or create_sparse.
+        """
+        if sp.issparse(matrix):
+            matrix.data[self.data_indices] = values[self.sources]
+        else:
+            matrix[self.rows, self.columns] = values[self.sources]
+
+    def save(self, file_name: str):
+        np.savez_compressed(file_name, constant=self.constant, rows=self.rows, columns=self.columns,
+                            sources=self.sources)
+
+    @classmethod
+    def load(cls, file_name: str) -> MatrixTemplate:
+        with np.load(file_name) as data:
+            return cls(constant=data['constant'], rows=data['rows'], columns=data['columns'],
+                       sources=data['sources'])
+
+
+class JacobianBlockCache:
+    """
+    In memory LRU cache for the Jacobians of the constraint expressions of individual goals.
+    The key consists of the serialized expressions and the identity of their symbols,
+    a hit therefore returns an expression that is built from the exact same symbols.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._cache = OrderedDict()
+
+    def jacobian(self, expressions: w.Expression, columns: Dict[int, Tuple[int, int]]) \
+            -> Tuple[w.ca.SX, List[w.ca.SX]]:
+        """
+        :param expressions: stacked constraint expressions of one goal
+        :param columns: element hashes of the symbols that should be differentiated
+        :return: Jacobian w.r.t. those free symbols of expressions that are in columns, and these symbols
+        """
+        free_symbols = w.free_symbols(expressions)
+        symbols = [s for s in free_symbols if s.element_hash() in columns]
+        key = LRUFileCache.hash(expressions.s.serialize(),
+                                *[str(s.element_hash()) for s in free_symbols],
+                                '|',
+                                *[str(s.element_hash()) for s in symbols])
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        J = w.ca.jacobian(expressions.s, w.ca.vertcat(*symbols))
+        self._cache[key] = J, symbols
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return J, symbols
+
+
+class ControllerBlock:
+    """
+    The entries of big_ass_M that belong to one goal, or to the free variables, compiled into their own function.
+    """
+
+    def __init__(self, rows: np.ndarray, compiled_function: w.CompiledFunction):
+        """
+        :param rows: where the outputs of compiled_function go in big_ass_M
+        """
+        self.rows = rows
+        self.compiled_function = compiled_function
+        # where the parameters of compiled_function are in the parameters of the whole controller
+        self.parameter_indices = np.zeros(0, dtype=int)
+
+    def save(self, path: str):
+        self.compiled_function.save(path)
+        np.save(f'{path}_rows.npy', self.rows)
+
+    @classmethod
+    def load(cls, path: str, c_code_cache: Optional[LRUFileCache] = None) -> ControllerBlock:
+        return cls(rows=np.load(f'{path}_rows.npy'),
+                   compiled_function=w.CompiledFunction.load(path, c_code_cache=c_code_cache))
+
+
+class CompiledBlockCache:
+    """
+    In memory LRU cache for the compiled functions of controller blocks, keyed by their serialized expression.
+    Goals that are part of consecutive controllers, e.g. collision avoidance, are therefore only compiled once.
+    Only functions that are compiled to C code are cached, for casadi's virtual machine, compiling is cheaper than
+    serializing the expression for the key.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self.hits = 0
+
+    def compile(self, expression: w.Expression, c_code_cache: Optional[LRUFileCache] = None) -> w.CompiledFunction:
+        if c_code_cache is None:
+            return expression.compile(w.free_symbols(expression))
+        key = LRUFileCache.hash(expression.s.serialize())
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return self._cache[key]
+        compiled_function = expression.compile(w.free_symbols(expression), c_code_cache=c_code_cache)
+        self._cache[key] = compiled_function
+        if len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return compiled_function
+
 
 class A(Parent):
+    # shared between controllers, such that unchanged goals don't get differentiated again
+    jacobian_cache = JacobianBlockCache(max_size=1000)
+
     def __init__(self, free_variables, constraints, velocity_constraints, sample_period, prediction_horizon, order,
                  default_limits=False):
         super().__init__(sample_period, prediction_horizon, order)
@@ -392,7 +568,41 @@ class A(Parent):
         return self._sorter({v.position_name: v.get_symbol(order) for v in self.free_variables})[0]
 
     @profile
-    def construct_A(self):
+    def jacobians(self, constraints: List[Union[Constraint, VelocityConstraint]]) -> List[w.Expression]:
+        """
+        Computes the Jacobian of the constraint expressions w.r.t. the free variables of each derivative order in A.
+        The rows are sorted by constraint name, like all other constraint related entries.
+        The Jacobian is assembled from one block per goal, such that blocks of goals, which were already part of a
+        previous controller, e.g. collision avoidance, are taken from self.jacobian_cache.
+        """
+        constraints = sorted(constraints, key=lambda c: c.name)
+        columns = {}
+        # the highest derivative doesn't appear in A
+        for order in range(self.order - 1):
+            for column, symbol in enumerate(self.get_free_variable_symbols(order)):
+                columns[symbol.s.element_hash()] = (order, column)
+        Js = [w.ca.SX(len(constraints), len(self.free_variables)) for _ in range(self.order - 1)]
+        blocks = defaultdict(list)
+        for row, constraint in enumerate(constraints):
+            blocks[constraint.goal_name].append(row)
+        for rows in blocks.values():
+            expressions = w.Expression([constraints[row].expression for row in rows])
+            J_block, symbols = self.jacobian_cache.jacobian(expressions, columns)
+            for order in range(self.order - 1):
+                local_columns = [i for i, s in enumerate(symbols) if columns[s.element_hash()][0] == order]
+                if local_columns:
+                    global_columns = [columns[symbols[i].element_hash()][1] for i in local_columns]
+                    Js[order][rows, global_columns] = J_block[:, local_columns]
+        return [w.Expression(J) * self.sample_period for J in Js]
+
+    @profile
+    def construct_A(self) -> Tuple[w.Expression, MatrixTemplate, List[Optional[str]]]:
+        """
+        A consists of constant entries and copies of the entries of the Jacobians of the constraints.
+        Instead of building A symbolically, each Jacobian is computed once and only its nonzeros are returned
+        as one expression. The constant part of A and where the Jacobian entries go, are described by a template.
+        :return: nonzero entries of all Jacobians, template of A, goal name of the constraint of each entry
+        """
         #         |   t1   |   tn   |   t1   |   tn   |   t1   |   tn   |   t1   |   tn   |
         #         |v1 v2 vn|v1 v2 vn|a1 a2 an|a1 a2 an|j1 j2 jn|j1 j2 jn|s1 s2 sn|s1 s2 sn|
         #         |-----------------------------------------------------------------------|
@@ -444,47 +654,58 @@ class A(Parent):
         #         |      sp|      sp|      sp|      sp|
         #         |===================================|
         number_of_joints = self.number_of_joints
-        A_soft = w.zeros(
-            self.prediction_horizon * number_of_joints +  # joint position constraints
-            number_of_joints * self.prediction_horizon * (self.order - 2) +  # links
-            len(self.velocity_constraints) * (self.prediction_horizon) +  # velocity constraints
-            len(self.constraints),  # constraints
-            # (self.num_position_limits() if self.default_limits else 0) +  # weights for position limits
-            number_of_joints * self.prediction_horizon * (self.order - 1) +
-            len(self.velocity_constraints) * self.prediction_horizon + len(self.constraints)
-        )
+        num_vel_constraints = len(self.velocity_constraints)
+        num_constraints = len(self.constraints)
+        height = self.prediction_horizon * number_of_joints + \
+                 number_of_joints * self.prediction_horizon * (self.order - 2) + \
+                 num_vel_constraints * self.prediction_horizon + \
+                 num_constraints
+        width = number_of_joints * self.prediction_horizon * (self.order - 1) + \
+                num_vel_constraints * self.prediction_horizon + \
+                num_constraints
+        A_soft = np.zeros((height, width))
         t = time()
-        J_vel = []
-        J_err = []
-        for order in range(self.order):
-            J_vel.append(w.jacobian(expressions=w.Expression(self.get_velocity_constraint_expressions()),
-                                    symbols=self.get_free_variable_symbols(order),
-                                    order=1) * self.sample_period)
-            J_err.append(w.jacobian(expressions=w.Expression(self.get_constraint_expressions()),
-                                    symbols=self.get_free_variable_symbols(order),
-                                    order=1) * self.sample_period)
+        J_vel = self.jacobians(self.velocity_constraints)
+        J_err = self.jacobians(self.constraints)
         jac_time = time() - t
         logging.loginfo('computed Jacobian in {:.5f}s'.format(jac_time))
-        # Jd = w.jacobian(w.Matrix(soft_expressions), controlled_joints, order=2)
-        # logging.loginfo('computed Jacobian dot in {:.5f}s'.format(time() - t))
+        # Every Jacobian is computed once and only its nonzeros end up in the compiled function.
+        # Their copies for each time step of the prediction horizon are described by index maps.
+        jacobian_entries = []
+        goal_names = []
+        rows = []
+        columns = []
+        sources = []
+
+        def add_jacobian(J: w.Expression, constraints: List[Union[Constraint, VelocityConstraint]]) \
+                -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+            sparsity = J.s.sparsity()
+            offset = sum(entries.shape[0] for entries in jacobian_entries)
+            jacobian_entries.append(w.ca.vec(J.s.nz[:]))
+            # the rows of the Jacobians are sorted by constraint name
+            constraints = sorted(constraints, key=lambda c: c.name)
+            goal_names.extend(constraints[row].goal_name for row in sparsity.row())
+            return (np.array(sparsity.row(), dtype=int),
+                    np.array(sparsity.get_col(), dtype=int),
+                    np.arange(offset, offset + sparsity.nnz()))
 
         # position limits
         vertical_offset = number_of_joints * self.prediction_horizon
         for p in range(1, self.prediction_horizon + 1):
             matrix_size = number_of_joints * p
-            I = w.eye(matrix_size) * self.sample_period
+            I = np.eye(matrix_size) * self.sample_period
             start = vertical_offset - matrix_size
             A_soft[start:vertical_offset, :matrix_size] += I
 
         # derivative links
         block_size = number_of_joints * (self.order - 2) * self.prediction_horizon
-        I = w.eye(block_size)
+        I = np.eye(block_size)
         A_soft[vertical_offset:vertical_offset + block_size, :block_size] += I
         h_offset = number_of_joints * self.prediction_horizon
         A_soft[vertical_offset:vertical_offset + block_size, h_offset:h_offset + block_size] += -I * self.sample_period
 
         I_height = number_of_joints * (self.prediction_horizon - 1)
-        I = -w.eye(I_height)
+        I = -np.eye(I_height)
         offset_v = vertical_offset
         offset_h = 0
         for o in range(self.order - 2):
@@ -496,61 +717,50 @@ class A(Parent):
 
         # constraints
         # TODO i don't need vel checks for the last 2 entries because the have to be zero with current B's
-        # velocity limits
-        next_vertical_offset = vertical_offset
+        # velocity limits, J_vel is repeated on the diagonal for each time step
+        horizontal_offset = number_of_joints * self.prediction_horizon
         for order in range(self.order - 1):
-            J_vel_tmp = J_vel[order]
-            J_vel_limit_block = w.kron(w.eye(self.prediction_horizon), J_vel_tmp)
-            horizontal_offset = J_vel_limit_block.shape[1]
-            if order == 0:
-                next_vertical_offset = vertical_offset + J_vel_limit_block.shape[0]
-            A_soft[vertical_offset:next_vertical_offset,
-            horizontal_offset * order:horizontal_offset * (order + 1)] = J_vel_limit_block
+            J_rows, J_columns, J_sources = add_jacobian(J_vel[order], self.velocity_constraints)
+            for t in range(self.prediction_horizon):
+                rows.append(vertical_offset + t * num_vel_constraints + J_rows)
+                columns.append(horizontal_offset * order + t * number_of_joints + J_columns)
+                sources.append(J_sources)
+        next_vertical_offset = vertical_offset + num_vel_constraints * self.prediction_horizon
         # velocity constraint slack
-        I = w.eye(J_vel_limit_block.shape[0]) * self.sample_period
-        if J_err[0].shape[0] > 0:
-            A_soft[vertical_offset:next_vertical_offset, -I.shape[1] - J_err[0].shape[0]:-J_err[0].shape[0]] = I
-        else:
-            A_soft[vertical_offset:next_vertical_offset, -I.shape[1]:] = I
+        slack_offset = width - num_constraints - num_vel_constraints * self.prediction_horizon
+        for i in range(num_vel_constraints * self.prediction_horizon):
+            A_soft[vertical_offset + i, slack_offset + i] = self.sample_period
         # delete rows if control horizon of constraint shorter than prediction horizon
         rows_to_delete = []
         for t in range(self.prediction_horizon):
             for i, c in enumerate(self.velocity_constraints):
-                index = vertical_offset + i + (t * len(self.velocity_constraints))
+                index = vertical_offset + i + (t * num_vel_constraints)
                 if t + 1 > c.control_horizon:
                     rows_to_delete.append(index)
 
         # delete columns where control horizon is shorter than prediction horizon
         columns_to_delete = []
-        horizontal_offset = A_soft.shape[1] - I.shape[1] - J_err[0].shape[0]
         for t in range(self.prediction_horizon):
             for i, c in enumerate(self.velocity_constraints):
-                index = horizontal_offset + (t * len(self.velocity_constraints)) + i
+                index = slack_offset + (t * num_vel_constraints) + i
                 if t + 1 > c.control_horizon:
                     columns_to_delete.append(index)
 
-        # J stack for total error
-        if len(self.constraints) > 0:
+        # J stack for total error, J_err is repeated for each time step within the control horizon
+        if num_constraints > 0:
+            vertical_offset = next_vertical_offset
+            control_horizons = np.array([c.control_horizon for c in self.constraints])
             for order in range(self.order - 1):
-                J_hstack = w.hstack([J_err[order] for _ in range(self.prediction_horizon)])
-                if order == 0:
-                    vertical_offset = next_vertical_offset
-                    next_vertical_offset = vertical_offset + J_hstack.shape[0]
-                # set jacobian entry to 0 if control horizon shorter than prediction horizon
-                for i, c in enumerate(self.constraints):
-                    # offset = vertical_offset + i
-                    J_hstack[i, c.control_horizon * len(self.free_variables):] = 0
-                horizontal_offset = J_hstack.shape[1]
-                A_soft[vertical_offset:next_vertical_offset,
-                horizontal_offset * (order):horizontal_offset * (order + 1)] = J_hstack
-
-                # sum of vel slack for total error
-                # I = w.kron(w.Matrix([[1 for _ in range(self.prediction_horizon)]]),
-                #            w.eye(J_hstack.shape[0])) * self.sample_period
-                # A_soft[vertical_offset:next_vertical_offset, -I.shape[1]-len(self.constraints):-len(self.constraints)] = I
+                J_rows, J_columns, J_sources = add_jacobian(J_err[order], self.constraints)
+                for t in range(self.prediction_horizon):
+                    # set jacobian entry to 0 if control horizon shorter than prediction horizon
+                    in_control_horizon = t < control_horizons[J_rows]
+                    rows.append(vertical_offset + J_rows[in_control_horizon])
+                    columns.append(horizontal_offset * order + t * number_of_joints + J_columns[in_control_horizon])
+                    sources.append(J_sources[in_control_horizon])
             # extra slack variable for total error
-            I = w.eye(J_hstack.shape[0]) * self.sample_period * self.prediction_horizon
-            A_soft[vertical_offset:next_vertical_offset, -I.shape[1]:] = I
+            for i in range(num_constraints):
+                A_soft[vertical_offset + i, width - num_constraints + i] = self.sample_period * self.prediction_horizon
 
         # delete rows with position limits of continuous joints
         continuous_joint_indices = [i for i, v in enumerate(self.free_variables) if not v.has_position_limits()]
@@ -558,18 +768,29 @@ class A(Parent):
             for i in continuous_joint_indices:
                 rows_to_delete.append(i + len(self.free_variables) * (o))
 
-        A_soft.remove(rows_to_delete, [])
-        A_soft.remove([], columns_to_delete)
+        keep_rows = np.ones(height, dtype=bool)
+        keep_rows[rows_to_delete] = False
+        keep_columns = np.ones(width, dtype=bool)
+        keep_columns[columns_to_delete] = False
+        rows = np.concatenate([np.zeros(0, dtype=int)] + rows)
+        columns = np.concatenate([np.zeros(0, dtype=int)] + columns)
+        sources = np.concatenate([np.zeros(0, dtype=int)] + sources)
+        kept = keep_rows[rows] & keep_columns[columns]
+        new_row_index = np.cumsum(keep_rows) - 1
+        new_column_index = np.cumsum(keep_columns) - 1
+        A_template = MatrixTemplate(constant=A_soft[keep_rows][:, keep_columns],
+                                    rows=new_row_index[rows[kept]],
+                                    columns=new_column_index[columns[kept]],
+                                    sources=sources[kept])
+        jacobian_entries = w.Expression(w.ca.vertcat(w.ca.SX(0, 1), *jacobian_entries))
 
         # position constraints if limits are violated
         # if self.default_limits:
         #     A_soft[0:self.num_position_limits() * self.prediction_horizon,
         #     self.prediction_horizon:self.num_position_limits] = w.eye(self.num_position_limits())
-        # hack = blackboard_god_map().to_symbol(identifier.hack)
-        # A_soft = w.ca.substitute(A_soft, hack, 1)
-        return A_soft
+        return jacobian_entries, A_template, goal_names
 
-    def A(self):
+    def A(self) -> Tuple[w.Expression, MatrixTemplate, List[Optional[str]]]:
         return self.construct_A()
 
 
@@ -599,6 +820,9 @@ class QPController:
     debug_expressions: Dict[str, w.all_expressions]
     compiled_debug_expressions: Dict[str, w.CompiledFunction]
     evaluated_debug_expressions: Dict[str, np.ndarray]
+    blocks: List[ControllerBlock]
+    # shared between controllers, such that goals, which were part of a previous controller, don't get compiled again
+    block_cache = CompiledBlockCache(max_size=100)
 
     def __init__(self,
                  sample_period: float,
@@ -610,7 +834,14 @@ class QPController:
                  debug_expressions: Dict[str, Union[w.Symbol, float]] = None,
                  retries_with_relaxed_constraints: int = 0,
                  retry_added_slack: float = 100,
-                 retry_weight_factor: float = 100):
+                 retry_weight_factor: float = 100,
+                 mask_zero_weight_slacks: bool = False,
+                 controller_cache: Optional[LRUFileCache] = None,
+                 c_code_cache: Optional[LRUFileCache] = None):
+        """
+        :param controller_cache: if not None, compiled controllers are loaded from/saved to this cache
+        :param c_code_cache: if not None, the controller is compiled to C code, which is stored in this cache
+        """
         self.free_variables = []
         self.constraints = []
         self.velocity_constraints = []
@@ -620,6 +851,9 @@ class QPController:
         self.retries_with_relaxed_constraints = retries_with_relaxed_constraints
         self.retry_added_slack = retry_added_slack
         self.retry_weight_factor = retry_weight_factor
+        self.mask_zero_weight_slacks = mask_zero_weight_slacks
+        self.controller_cache = controller_cache
+        self.c_code_cache = c_code_cache
         self.evaluated_debug_expressions = {}
         self.xdot_full = None
         if free_variables is not None:
@@ -713,22 +947,113 @@ class QPController:
 
     @profile
     def compile(self):
-        self._construct_big_ass_M(default_limits=False)
-        self._compile_big_ass_M()
+        if self.controller_cache is not None:
+            self._compile_big_ass_M_with_cache()
+        else:
+            self._construct_big_ass_M(default_limits=False)
+            self._compile_big_ass_M()
         self._compile_debug_expressions()
 
-    def get_parameter_names(self):
-        return self.compiled_big_ass_M.str_params
+    def _controller_cache_key(self) -> str:
+        """
+        Hash over everything that goes into the construction of the controller.
+        The expressions for weights and bounds already contain the numbers that are baked into the controller,
+        A is fully defined by the constraint expressions, the free variable symbols and the horizon parameters.
+        """
+        expressions = w.vstack([self.weights_expr, self.lb_expr, self.ub_expr, self.lbA_expr, self.ubA_expr,
+                                w.Expression(self.A.get_constraint_expressions()),
+                                w.Expression(self.A.get_velocity_constraint_expressions())])
+        structure = [w.ca.__version__,
+                     str(self.qp_solver.solver_id),
+                     self.qp_solver.sparse,
+                     self.prediction_horizon,
+                     self.sample_period,
+                     self.order,
+                     [[str(s) for s in self.A.get_free_variable_symbols(o)] for o in range(self.order)],
+                     [v.has_position_limits() for v in self.free_variables],
+                     [(c.name, c.control_horizon) for c in self.constraints],
+                     [(c.name, c.control_horizon) for c in self.velocity_constraints]]
+        return self.controller_cache.hash(str(structure), expressions.s.serialize())
+
+    @profile
+    def _compile_big_ass_M_with_cache(self):
+        self._construct_qp_parts(default_limits=False)
+        t = time()
+        key = self._controller_cache_key()
+        path = self.controller_cache.get(key)
+        if path is not None:
+            try:
+                number_of_blocks = len([f for f in os.listdir(path) if f.endswith('_rows.npy')])
+                if number_of_blocks == 0:
+                    raise FileNotFoundError(f'No controller blocks in {path}.')
+                self.blocks = [ControllerBlock.load(os.path.join(path, f'block{i}'), c_code_cache=self.c_code_cache)
+                               for i in range(number_of_blocks)]
+                self._init_block_parameters()
+                self.A_template = MatrixTemplate.load(os.path.join(path, 'A_template.npz'))
+                self._init_np_A()
+                logging.loginfo(f'Loaded symbolic controller from cache in {time() - t:.5f}s')
+                return
+            except Exception as e:
+                logging.logwarn(f'Failed to load controller from cache: {e}')
+                self.controller_cache.delete(key)
+        self._assemble_big_ass_M()
+        self._compile_big_ass_M()
+        with self.controller_cache.add(key) as path:
+            for i, block in enumerate(self.blocks):
+                block.save(os.path.join(path, f'block{i}'))
+            self.A_template.save(os.path.join(path, 'A_template.npz'))
+
+    def get_parameter_names(self) -> List[str]:
+        """
+        :return: names of the symbols, whose values get_cmd expects in this order
+        """
+        return self.parameter_names
 
     @profile
     def _compile_big_ass_M(self):
+        """
+        Compiles the entries of big_ass_M of each goal into a separate function, the remaining entries, which only
+        depend on the free variables, are compiled into one more function.
+        Functions of goals, which were part of a previous controller, are taken from self.block_cache.
+        """
         t = time()
-        free_symbols = w.free_symbols(self.big_ass_M)
-        # free_symbols = set(free_symbols)
-        # free_symbols = list(free_symbols)
-        self.compiled_big_ass_M = self.big_ass_M.compile(free_symbols)
+        hits = self.block_cache.hits
+        rows_of_goals = defaultdict(list)
+        for row, goal_name in enumerate(self.big_ass_M_goal_names):
+            rows_of_goals[goal_name].append(row)
+        self.blocks = []
+        for rows in rows_of_goals.values():
+            expression = w.Expression(self.big_ass_M.s[rows])
+            compiled_function = self.block_cache.compile(expression, c_code_cache=self.c_code_cache)
+            self.blocks.append(ControllerBlock(rows=np.array(rows, dtype=int), compiled_function=compiled_function))
+        self._init_block_parameters()
         compilation_time = time() - t
-        logging.loginfo(f'Compiled symbolic controller in {compilation_time:.5f}s')
+        logging.loginfo(f'Compiled symbolic controller in {compilation_time:.5f}s, '
+                        f'reused {self.block_cache.hits - hits} of {len(self.blocks)} blocks')
+        self._init_np_A()
+
+    def _init_block_parameters(self):
+        """
+        The parameters of the controller are the union of the parameters of all blocks.
+        """
+        self.parameter_names = []
+        parameter_indices = {}
+        for block in self.blocks:
+            for parameter_name in block.compiled_function.str_params:
+                if parameter_name not in parameter_indices:
+                    parameter_indices[parameter_name] = len(self.parameter_names)
+                    self.parameter_names.append(parameter_name)
+            block.parameter_indices = np.array([parameter_indices[parameter_name]
+                                                for parameter_name in block.compiled_function.str_params], dtype=int)
+        self.np_big_ass_M = np.zeros(sum(len(block.rows) for block in self.blocks))
+
+    def _init_np_A(self):
+        if self.qp_solver.sparse:
+            self.np_A = self.A_template.create_sparse()
+            logging.loginfo(f'A has {self.np_A.nnz} nonzeros, '
+                            f'fill ratio {self.np_A.nnz / max(1, self.A.height * self.A.width):.3f}')
+        else:
+            self.np_A = self.A_template.create_dense()
 
     def _compile_debug_expressions(self):
         t = time()
@@ -739,6 +1064,8 @@ class QPController:
         free_symbols = list(free_symbols)
         for name, expr in self.debug_expressions.items():
             self.compiled_debug_expressions[name] = expr.compile(free_symbols)
+        # all debug expressions share the same parameters
+        self.debug_parameter_plan = self.god_map.create_parameter_plan([str(x) for x in free_symbols])
         compilation_time = time() - t
         logging.loginfo(f'Compiled debug expressions in {compilation_time:.5f}s')
 
@@ -792,11 +1119,12 @@ class QPController:
                        f'{self.p_lb[self.p_lb == np.inf].dropna()}')
         logging.logerr(f'The following ub entries contain inf:\n'
                        f'{self.p_ub[self.p_ub == np.inf].dropna()}')
-        if np.inf in self.np_A:
+        np_A = self.np_A.data if sp.issparse(self.np_A) else self.np_A
+        if np.inf in np_A:
             rows = self.p_A[self.p_A == np.inf].dropna(how='all').dropna(axis=1)
             logging.logerr(f'A contains inf in:\n'
                            f'{list(rows.index)}')
-        if np.any(np.isnan(self.np_A)):
+        if np.any(np.isnan(np_A)):
             rows = self.p_A.isna()[self.p_A.isna()].dropna(how='all').dropna(axis=1)
             logging.logerr(f'A constrains nan in: \n'
                            f'{list(rows.index)}')
@@ -816,31 +1144,21 @@ class QPController:
             with pd.option_context('display.max_rows', None, 'display.max_columns', None):
                 print(array)
 
-    def _init_big_ass_M(self):
-        self.big_ass_M = w.zeros(self.A.height + 3,
-                                 self.A.width + 2)
-        # self.debug_v = w.zeros(len(self.debug_expressions), 1)
-
-    def _set_A_soft(self, A_soft):
-        self.big_ass_M[:self.A.height, :self.A.width] = A_soft
-
-    def _set_weights(self, weights):
-        self.big_ass_M[self.A.height, :-2] = weights
-
-    def _set_lb(self, lb):
-        self.big_ass_M[self.A.height + 1, :-2] = lb
-
-    def _set_ub(self, ub):
-        self.big_ass_M[self.A.height + 2, :-2] = ub
-
-    def _set_lbA(self, lbA):
-        self.big_ass_M[:self.A.height, self.A.width] = lbA
-
-    def _set_ubA(self, ubA):
-        self.big_ass_M[:self.A.height, self.A.width + 1] = ubA
+    def _init_big_ass_M(self, jacobian_entries, weights, lb, ub, lbA, ubA, jacobian_goal_names):
+        """
+        big_ass_M contains the vectors: weights, lb, ub, lbA, ubA and the nonzero Jacobian entries of A
+        stacked on top of each other. A is filled with the Jacobian entries according to self.A_template.
+        """
+        self.big_ass_M = w.vstack([weights, lb, ub, lbA, ubA, jacobian_entries])
+        b_goal_names = self.b.get_goal_names()
+        bA_goal_names = self.bA.get_goal_names()
+        self.big_ass_M_goal_names = b_goal_names * 3 + bA_goal_names * 2 + jacobian_goal_names
 
     @profile
-    def _construct_big_ass_M(self, default_limits=False):
+    def _construct_qp_parts(self, default_limits=False):
+        """
+        Creates everything except for A, which is the expensive part because of the Jacobians.
+        """
         self.b = B(free_variables=self.free_variables,
                    constraints=self.constraints,
                    velocity_constraints=self.velocity_constraints,
@@ -872,25 +1190,42 @@ class QPController:
 
         logging.loginfo(f'Constructing new controller with {self.A.height} constraints '
                         f'and {self.A.width} free variables...')
-        self._init_big_ass_M()
-
-        self._set_weights(w.Expression(self.H.weights()))
-        self._set_A_soft(self.A.A())
+        self.weights_expr = w.Expression(self.H.weights())
         lbA, ubA = self.bA()
-        self._set_lbA(w.Expression(lbA))
-        self._set_ubA(w.Expression(ubA))
+        self.lbA_expr = w.Expression(lbA)
+        self.ubA_expr = w.Expression(ubA)
         lb, ub = self.b()
-        self._set_lb(w.Expression(lb))
-        self._set_ub(w.Expression(ub))
+        self.lb_expr = w.Expression(lb)
+        self.ub_expr = w.Expression(ub)
         self.np_g = np.zeros(self.H.width)
+        if self.mask_zero_weight_slacks:
+            self.zero_weight_mask = np.zeros(self.H.width, dtype=bool)
+            self.b_filter = np.ones(self.H.width, dtype=bool)
+            self.bA_filter = np.ones(self.A.height, dtype=bool)
+
+    @profile
+    def _construct_big_ass_M(self, default_limits=False):
+        self._construct_qp_parts(default_limits)
+        self._assemble_big_ass_M()
+
+    @profile
+    def _assemble_big_ass_M(self):
+        jacobian_entries, self.A_template, jacobian_goal_names = self.A.A()
+        self._init_big_ass_M(jacobian_entries=jacobian_entries,
+                             weights=self.weights_expr,
+                             lb=self.lb_expr,
+                             ub=self.ub_expr,
+                             lbA=self.lbA_expr,
+                             ubA=self.ubA_expr,
+                             jacobian_goal_names=jacobian_goal_names)
         # self.debug_names = list(sorted(self.debug_expressions.keys()))
         # self.debug_v = w.Expression([self.debug_expressions[name] for name in self.debug_names])
 
     @profile
     def eval_debug_exprs(self):
         self.evaluated_debug_expressions = {}
+        params = self.debug_parameter_plan.get_values()
         for name, f in self.compiled_debug_expressions.items():
-            params = self.god_map.get_values(f.str_params)
             self.evaluated_debug_expressions[name] = f.call2(params).copy()
         return self.evaluated_debug_expressions
 
@@ -911,16 +1246,45 @@ class QPController:
         self.b_filter = np.array(b_filter)
         self.bA_filter = np.array(bA_filter)
 
+    @profile
+    def update_masks(self):
+        """
+        Alternative to update_filters, which keeps the shape of the qp constant.
+        Slack variables with weight 0 are fixed to 0 and the rows of their constraints are relaxed,
+        instead of removing both from the qp. Everything is done in place on the evaluated data.
+        """
+        np.equal(self.np_weights, 0, out=self.zero_weight_mask)
+        self.zero_weight_mask[:self.H.number_of_free_variables_with_horizon()] = False
+        self.np_lb[self.zero_weight_mask] = 0
+        self.np_ub[self.zero_weight_mask] = 0
+        # the last rows of A are the constraints of the slack variables in the last columns
+        num_slack_constraints = self.H.number_of_constraint_vel_variables() + \
+                                self.H.number_of_contraint_error_variables()
+        slack_mask = self.zero_weight_mask[self.H.width - num_slack_constraints:]
+        self.np_lbA[self.A.height - num_slack_constraints:][slack_mask] = -self.b.no_limits
+        self.np_ubA[self.A.height - num_slack_constraints:][slack_mask] = self.b.no_limits
+
     def __swap_compiled_matrices(self):
-        if not hasattr(self, 'compiled_big_ass_M_with_default_limits'):
+        if not hasattr(self, 'blocks_with_default_limits'):
             with suppress_stdout():
-                self.compiled_big_ass_M_with_default_limits = self.compiled_big_ass_M
+                self.blocks_with_default_limits = self.blocks
+                self.parameter_names_with_default_limits = self.parameter_names
+                self.np_big_ass_M_with_default_limits = self.np_big_ass_M
+                self.A_template_with_default_limits = self.A_template
+                self.np_A_with_default_limits = self.np_A
                 self._construct_big_ass_M(default_limits=True)
                 self._compile_big_ass_M()
         else:
-            self.compiled_big_ass_M, \
-            self.compiled_big_ass_M_with_default_limits = self.compiled_big_ass_M_with_default_limits, \
-                                                          self.compiled_big_ass_M
+            self.blocks, \
+            self.blocks_with_default_limits = self.blocks_with_default_limits, self.blocks
+            self.parameter_names, \
+            self.parameter_names_with_default_limits = self.parameter_names_with_default_limits, self.parameter_names
+            self.np_big_ass_M, \
+            self.np_big_ass_M_with_default_limits = self.np_big_ass_M_with_default_limits, self.np_big_ass_M
+            self.A_template, \
+            self.A_template_with_default_limits = self.A_template_with_default_limits, self.A_template
+            self.np_A, \
+            self.np_A_with_default_limits = self.np_A_with_default_limits, self.np_A
 
     @property
     def traj_time_in_sec(self):
@@ -978,22 +1342,37 @@ class QPController:
     @profile
     def evaluate_and_create_np_data(self, substitutions):
         self.substitutions = substitutions
-        np_big_ass_M = self.compiled_big_ass_M.call2(substitutions)
-        self.np_weights = np_big_ass_M[self.A.height, :-2]
-        self.np_A = np_big_ass_M[:self.A.height, :self.A.width]
-        self.np_lb = np_big_ass_M[self.A.height + 1, :-2]
-        self.np_ub = np_big_ass_M[self.A.height + 2, :-2]
-        self.np_lbA = np_big_ass_M[:self.A.height, -2]
-        self.np_ubA = np_big_ass_M[:self.A.height, -1]
-
-        self.update_filters()
-        self.np_weights_filtered = self.np_weights[self.b_filter]
-        self.np_g_filtered = np.zeros(self.np_weights_filtered.shape[0])
-        self.np_A_filtered = self.np_A[self.bA_filter, :][:, self.b_filter]
-        self.np_lb_filtered = self.np_lb[self.b_filter]
-        self.np_ub_filtered = self.np_ub[self.b_filter]
-        self.np_lbA_filtered = self.np_lbA[self.bA_filter]
-        self.np_ubA_filtered = self.np_ubA[self.bA_filter]
+        substitutions = np.asarray(substitutions, dtype=float)
+        np_big_ass_M = self.np_big_ass_M
+        for block in self.blocks:
+            np_big_ass_M[block.rows] = block.compiled_function.call2(substitutions[block.parameter_indices])[:, 0]
+        width = self.A.width
+        height = self.A.height
+        self.np_weights = np_big_ass_M[:width]
+        self.np_lb = np_big_ass_M[width:width * 2]
+        self.np_ub = np_big_ass_M[width * 2:width * 3]
+        self.np_lbA = np_big_ass_M[width * 3:width * 3 + height]
+        self.np_ubA = np_big_ass_M[width * 3 + height:width * 3 + height * 2]
+        self.A_template.update(self.np_A, np_big_ass_M[width * 3 + height * 2:])
+
+        if self.mask_zero_weight_slacks:
+            self.update_masks()
+            self.np_weights_filtered = self.np_weights
+            self.np_g_filtered = self.np_g
+            self.np_A_filtered = self.np_A
+            self.np_lb_filtered = self.np_lb
+            self.np_ub_filtered = self.np_ub
+            self.np_lbA_filtered = self.np_lbA
+            self.np_ubA_filtered = self.np_ubA
+        else:
+            self.update_filters()
+            self.np_weights_filtered = self.np_weights[self.b_filter]
+            self.np_g_filtered = np.zeros(self.np_weights_filtered.shape[0])
+            self.np_A_filtered = self.np_A[self.bA_filter, :][:, self.b_filter]
+            self.np_lb_filtered = self.np_lb[self.b_filter]
+            self.np_ub_filtered = self.np_ub[self.b_filter]
+            self.np_lbA_filtered = self.np_lbA[self.bA_filter]
+            self.np_ubA_filtered = self.np_ubA[self.bA_filter]
 
     def _are_hard_limits_violated(self, error_message):
         num_non_slack = len(self.free_variables) * self.prediction_horizon * (self.order - 1)
@@ -1092,7 +1471,7 @@ class QPController:
     @profile
     def _create_debug_pandas(self):
         substitutions = self.substitutions
-        self.state = {k: v for k, v in zip(self.compiled_big_ass_M.str_params, substitutions)}
+        self.state = {k: v for k, v in zip(self.parameter_names, substitutions)}
         sample_period = self.sample_period
         b_names = self.b_names()
         bA_names = self.bA_names()
@@ -1127,7 +1506,11 @@ class QPController:
         self.p_lbA[-num_constr:] /= sample_period
         self.p_ubA[-num_constr:] /= sample_period
         self.p_weights = pd.DataFrame(self.np_weights, b_names, ['data'], dtype=float)
-        self.p_A = pd.DataFrame(self.np_A_filtered, filtered_bA_names, filtered_b_names, dtype=float)
+        if sp.issparse(self.np_A_filtered):
+            np_A_filtered = self.np_A_filtered.toarray()
+        else:
+            np_A_filtered = self.np_A_filtered
+        self.p_A = pd.DataFrame(np_A_filtered, filtered_bA_names, filtered_b_names, dtype=float)
         if self.xdot_full is not None:
             self.p_xdot = pd.DataFrame(self.xdot_full, filtered_b_names, ['data'], dtype=float)
             # Ax = np.dot(self.np_A, xdot_full)
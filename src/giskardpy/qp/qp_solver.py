@@ -3,6 +3,7 @@ from abc import ABC
 from typing import Tuple
 
 import numpy as np
+from scipy import sparse as sp
 
 from giskardpy.configs.data_types import SupportedQPSolver
 from giskardpy.exceptions import HardConstraintsViolatedException, InfeasibleException, QPSolverException
@@ -10,6 +11,8 @@ from giskardpy.exceptions import HardConstraintsViolatedException, InfeasibleExc
 
 class QPSolver(ABC):
     solver_id: SupportedQPSolver
+    # if True, solve receives A as scipy.sparse.csc_matrix with a fixed sparsity pattern instead of a dense array
+    sparse: bool = False
 
     def __init__(self,
                  num_non_slack: int,
@@ -36,6 +39,51 @@ class QPSolver(ABC):
         h = np.concatenate([-lb, ub, -lbA, ubA])
         return P, g, G, h
 
+    def did_sparsity_pattern_change(self, A: sp.csc_matrix) -> bool:
+        try:
+            return (A.shape != self._A_shape
+                    or not np.array_equal(A.indptr, self._A_indptr)
+                    or not np.array_equal(A.indices, self._A_indices))
+        except AttributeError:
+            return True
+
+    def stack_sparse_box_constraints(self, A: sp.csc_matrix) -> sp.csc_matrix:
+        """
+        Creates [I; A], such that box constraints and A can be passed to the solver as a single matrix.
+        Remembers the sparsity pattern of A and where its nonzeros end up in [I; A],
+        such that update_sparse_box_constraints can fill in new values without reallocating.
+        """
+        num_rows, num_columns = A.shape
+        self._A_shape = A.shape
+        self._A_indptr = A.indptr.copy()
+        self._A_indices = A.indices.copy()
+        indptr = A.indptr + np.arange(num_columns + 1)
+        # the identity entry comes first in every column, followed by the entries of that column of A
+        self._A_data_index = np.arange(A.nnz) + np.repeat(np.arange(num_columns), np.diff(A.indptr)) + 1
+        indices = np.empty(A.nnz + num_columns, dtype=A.indices.dtype)
+        indices[indptr[:-1]] = np.arange(num_columns)
+        indices[self._A_data_index] = A.indices + num_columns
+        self._box_A_data = np.ones(A.nnz + num_columns)
+        self._box_A_data[self._A_data_index] = A.data
+        return sp.csc_matrix((self._box_A_data, indices, indptr), shape=(num_rows + num_columns, num_columns))
+
+    def update_sparse_box_constraints(self, A: sp.csc_matrix) -> np.ndarray:
+        """
+        :return: nonzeros of [I; A] in csc order, A has to have the same sparsity pattern as during the last
+                    call of stack_sparse_box_constraints.
+        """
+        self._box_A_data[self._A_data_index] = A.data
+        return self._box_A_data
+
+    @staticmethod
+    def sparse_diag(weights: np.ndarray) -> sp.csc_matrix:
+        """
+        Like scipy.sparse.diags, but keeps zero weights as explicit entries, such that the pattern doesn't depend on them.
+        """
+        indices = np.arange(weights.shape[0])
+        return sp.csc_matrix((weights, indices, np.arange(weights.shape[0] + 1)),
+                                 shape=(weights.shape[0], weights.shape[0]))
+
     @abc.abstractmethod
     def solve(self, weights: np.ndarray, g: np.ndarray, A: np.ndarray, lb: np.ndarray, ub: np.ndarray, lbA: np.ndarray,
               ubA: np.ndarray) -> np.ndarray:
@@ -45,7 +93,8 @@ class QPSolver(ABC):
         and    lb <=  x  <= ub
         :param weights: 1d vector, len = (jc (joint constraints) + sc (soft constraints))
         :param g: 1d zero vector of len joint constraints + soft constraints
-        :param A: 2d jacobi matrix of hc (hard constraints) and sc, shape = (hc + sc) * (number of joints)
+        :param A: 2d jacobi matrix of hc (hard constraints) and sc, shape = (hc + sc) * (number of joints),
+                    scipy.sparse.csc_matrix if self.sparse is True
         :param lb: 1d vector containing lower bound of x, len = jc + sc
         :param ub: 1d vector containing upper bound of x, len = js + sc
         :param lbA: 1d vector containing lower bounds for the change of hc and sc, len = hc+sc
@@ -9,6 +9,7 @@ from giskardpy.utils.utils import record_time
 
 class QPSolverClarabel(QPSolver):
     solver_id = SupportedQPSolver.clarabel
+    sparse = True
     """
     min_x 0.5 x^T P x + q^T x
     s.t.  Ax = b
@@ -20,10 +21,10 @@ class QPSolverClarabel(QPSolver):
     @record_time
     def solve(self, weights: np.ndarray, g: np.ndarray, A: np.ndarray, lb: np.ndarray, ub: np.ndarray, lbA: np.ndarray,
               ubA: np.ndarray) -> np.ndarray:
-        A_b = np.eye(lb.shape[0])
-        G = sparse.csc_matrix(np.vstack([-A_b, A_b, -A, A]))
+        A_b = sparse.eye(lb.shape[0], format='csc')
+        G = sparse.vstack([-A_b, A_b, -A, A], format='csc')
         h = np.concatenate([-lb, ub, -lbA, ubA])
-        P = sparse.csc_matrix(np.diag(weights))
+        P = sparse.diags(weights, format='csc')
         q = g
 
         cones = [clarabel.NonnegativeConeT(h.shape[0])]
@@ -1,6 +1,6 @@
 
 import numpy as np
-from scipy import sparse
+from scipy import sparse as sp
 
 from giskardpy.configs.data_types import SupportedQPSolver
 from giskardpy.exceptions import QPSolverException, InfeasibleException, HardConstraintsViolatedException
@@ -17,6 +17,7 @@ class QPSolverOSQP(QPSolver):
     s.t.  l <= Ax = u
     """
     solver_id = SupportedQPSolver.osqp
+    sparse = True
     settings = {
         'verbose': False,
         'polish': True,
@@ -24,20 +25,44 @@ class QPSolverOSQP(QPSolver):
         'eps_rel': 1e-2,  # default 1e-3
         'polish_refine_iter': 4, # default 3
     }
+    solved_status_values = (osqp.constant('OSQP_SOLVED'), osqp.constant('OSQP_SOLVED_INACCURATE'))
 
+    def __init__(self, num_non_slack: int, retry_added_slack: float, retry_weight_factor: float,
+                 retries_with_relaxed_constraints: int):
+        super().__init__(num_non_slack, retry_added_slack, retry_weight_factor, retries_with_relaxed_constraints)
+        self.started = False
+
+    @profile
+    def init(self, weights: np.ndarray, g: np.ndarray, A: sp.csc_matrix, l: np.ndarray, u: np.ndarray):
+        self.qpProblem = osqp.OSQP()
+        P = self.sparse_diag(weights)
+        A = self.stack_sparse_box_constraints(A)
+        self.qpProblem.setup(P=P, q=g, A=A, l=l, u=u, **self.settings)
+        self.started = True
+
+    @profile
+    def update(self, weights: np.ndarray, g: np.ndarray, A: sp.csc_matrix, l: np.ndarray, u: np.ndarray):
+        """
+        Only updates the values, osqp warm starts from the previous primal and dual solution.
+        """
+        self.qpProblem.update(Px=weights, Ax=self.update_sparse_box_constraints(A), q=g, l=l, u=u)
 
     @profile
     @record_time
-    def solve(self, weights: np.ndarray, g: np.ndarray, A: np.ndarray, lb: np.ndarray, ub: np.ndarray, lbA: np.ndarray,
-              ubA: np.ndarray) -> np.ndarray:
-        m = osqp.OSQP()
-        A_b = np.eye(lb.shape[0])
-        A = sparse.csc_matrix(np.vstack([A_b, A]))
-        P = sparse.csc_matrix(np.diag(weights))
+    def solve(self, weights: np.ndarray, g: np.ndarray, A: sp.csc_matrix, lb: np.ndarray, ub: np.ndarray,
+              lbA: np.ndarray, ubA: np.ndarray) -> np.ndarray:
         l = np.concatenate([lb, lbA])
         u = np.concatenate([ub, ubA])
-        m.setup(P=P, q=g, A=A, l=l, u=u, **self.settings)
-        return m.solve().x
+        if not self.started or self.did_sparsity_pattern_change(A):
+            self.init(weights, g, A, l, u)
+        else:
+            self.update(weights, g, A, l, u)
+        result = self.qpProblem.solve()
+        if result.info.status_val not in self.solved_status_values:
+            # don't warm start the next qp with a failed solution
+            self.started = False
+            raise InfeasibleException(f'Failed to solve qp: {result.info.status}')
+        return result.x
 
     # @profile
     def solve_and_retry(self, weights, g, A, lb, ub, lbA, ubA):
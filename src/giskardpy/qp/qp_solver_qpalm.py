@@ -2,7 +2,7 @@ from enum import IntEnum
 
 import numpy as np
 import qpalm
-from scipy import sparse
+from scipy import sparse as sp
 
 from giskardpy.configs.data_types import SupportedQPSolver
 from giskardpy.exceptions import QPSolverException, InfeasibleException, HardConstraintsViolatedException
@@ -25,6 +25,7 @@ class QPALMInfo(IntEnum):
 
 class QPSolverQPalm(QPSolver):
     solver_id = SupportedQPSolver.qpalm
+    sparse = True
     """
     min_x 0.5 x^T Q x + q^T x
     s.t.  lb <= Ax <= ub
@@ -38,31 +39,56 @@ class QPSolverQPalm(QPSolver):
     settings.nonconvex = False
     # settings.max_iter = 100
 
+    def __init__(self, num_non_slack: int, retry_added_slack: float, retry_weight_factor: float,
+                 retries_with_relaxed_constraints: int):
+        super().__init__(num_non_slack, retry_added_slack, retry_weight_factor, retries_with_relaxed_constraints)
+        self.started = False
+
     @profile
-    @record_time
-    def solve(self, weights: np.ndarray, g: np.ndarray, A: np.ndarray, lb: np.ndarray, ub: np.ndarray, lbA: np.ndarray,
-              ubA: np.ndarray) -> np.ndarray:
-        A_b = np.eye(lb.shape[0])
-        Q = sparse.csc_matrix(np.diag(weights))
-        q = g
-        A = sparse.csc_matrix(np.vstack([A_b, A]))
-        lb = np.concatenate([lb, lbA])
-        ub = np.concatenate([ub, ubA])
+    def init(self, weights: np.ndarray, g: np.ndarray, A: sp.csc_matrix, lb: np.ndarray, ub: np.ndarray):
+        Q = self.sparse_diag(weights)
+        A = self.stack_sparse_box_constraints(A)
 
         data = qpalm.Data(A.shape[1], A.shape[0])
 
         data.Q = Q
         data.A = A
-        data.q = q
+        data.q = g
         data.bmax = ub
         data.bmin = lb
 
-        solver = qpalm.Solver(data, self.settings)
-        solver.solve()
+        self.solver = qpalm.Solver(data, self.settings)
+        self.started = True
+
+    @profile
+    def update(self, weights: np.ndarray, g: np.ndarray, A: sp.csc_matrix, lb: np.ndarray, ub: np.ndarray):
+        """
+        Only updates the values and warm starts with the previous solution.
+        """
+        x = self.solver.solution.x.copy()
+        y = self.solver.solution.y.copy()
+        self.solver.update_Q_A(weights, self.update_sparse_box_constraints(A))
+        self.solver.update_q(g)
+        self.solver.update_bounds(bmin=lb, bmax=ub)
+        self.solver.warm_start(x, y)
+
+    @profile
+    @record_time
+    def solve(self, weights: np.ndarray, g: np.ndarray, A: sp.csc_matrix, lb: np.ndarray, ub: np.ndarray,
+              lbA: np.ndarray, ubA: np.ndarray) -> np.ndarray:
+        lb = np.concatenate([lb, lbA])
+        ub = np.concatenate([ub, ubA])
+        if not self.started or self.did_sparsity_pattern_change(A):
+            self.init(weights, g, A, lb, ub)
+        else:
+            self.update(weights, g, A, lb, ub)
+        self.solver.solve()
         # print(f'{solver.info.iter} {solver.info.iter_out}')
-        if solver.info.status_val != QPALMInfo.SOLVED:
-            raise InfeasibleException(f'Failed to solve qp: {str(QPALMInfo(solver.info.status_val))}')
-        return solver.solution.x
+        if self.solver.info.status_val != QPALMInfo.SOLVED:
+            self.started = False
+            raise InfeasibleException(f'Failed to solve qp: {str(QPALMInfo(self.solver.info.status_val))}')
+        # the solution is a view on the solver's memory, which is reused in the next solve
+        return self.solver.solution.x.copy()
 
     # @profile
     def solve_and_retry(self, weights, g, A, lb, ub, lbA, ubA):
@@ -13,10 +13,6 @@ class SetZeroVelocity(GiskardBehavior):
 
     @profile
     def update(self):
-        for free_variable, state in self.world.state.items():
-            for derivative in Derivatives:
-                if derivative == Derivatives.position:
-                    continue
-                self.world.state[free_variable].set_derivative(derivative, 0)
+        self.world.state.data[:, Derivatives.velocity:] = 0
         self.world.notify_state_change()
         return Status.SUCCESS
@@ -1,4 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor, Future
 from multiprocessing import Lock
+from typing import Optional
 
 from py_trees import Status
 
@@ -10,12 +12,24 @@ from giskardpy.utils.utils import raise_to_blackboard, catch_and_raise_to_blackb
 
 
 class CollisionChecker(GiskardBehavior):
+    """
+    In pipelined mode, the collision check of the state at tick t runs on a worker thread, while the rest of the
+    control loop of tick t runs. The result is published at tick t + 1, therefore the controller works with collision
+    data that is at most one tick old. Only the first tick of a goal waits for a fresh result.
+    The worker thread only lives while a goal runs, it is started in initialise and stopped in terminate.
+    """
+    executor: Optional[ThreadPoolExecutor]
+    future: Optional[Future]
+
     @profile
     def __init__(self, name):
         super().__init__(name)
         self.lock = Lock()
         self.object_js_subs = {}  # JointState subscribers for articulated world objects
         self.object_joint_states = {}  # JointStates messages for articulated world objects
+        self.pipelined = self.god_map.get_data(identifier.CollisionChecker_pipelined)
+        self.executor = None
+        self.future = None
 
     def add_added_checks(self, collision_matrix):
         try:
@@ -39,26 +53,63 @@ class CollisionChecker(GiskardBehavior):
             self.collision_matrix = self.add_added_checks(self.collision_matrix)
             self.collision_list_size = sum([config.cal_max_param('number_of_repeller')
                                             for config in self.collision_avoidance_configs.values()])
+            self.stop_worker()
+            if self.pipelined:
+                self.executor = ThreadPoolExecutor(max_workers=1)
             self.collision_scene.sync()
             super().initialise()
         except Exception as e:
             raise_to_blackboard(e)
 
+    def terminate(self, new_status):
+        self.stop_worker()
+        super().terminate(new_status)
+
+    def stop_worker(self):
+        """
+        Waits for the running collision check and shuts down the worker thread.
+        """
+        self.wait_for_worker()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def wait_for_worker(self):
+        """
+        Makes sure that no collision check is running in the background.
+        """
+        if self.future is not None:
+            try:
+                self.future.result()
+            except Exception:
+                # has already been raised in update or belongs to an aborted goal
+                pass
+            self.future = None
+        self.collision_scene.unfreeze_fks()
+
+    def check_collisions(self) -> Collisions:
+        return self.collision_scene.check_collisions(self.collision_matrix, self.collision_list_size)
+
+    def submit_collision_check(self):
+        """
+        Starts the collision check of the current state on the worker thread.
+        Everything the check needs from the world is read here, because the world state changes while it runs.
+        """
+        self.collision_scene.sync()
+        self.collision_scene.freeze_fks()
+        self.collision_scene.prepare_collision_check(self.collision_matrix)
+        self.future = self.executor.submit(self.check_collisions)
+
     def are_self_collisions_violated(self, collsions: Collisions):
-        for key, self_collisions in collsions.self_collisions.items():
-            for self_collision in self_collisions[:-1]: # the last collision is always some default crap
-                # link_a = self_collision.original_link_a
-                # link_b = self_collision.original_link_b
-                if self_collision.link_b_hash == 0:
-                    continue # Fixme figure out why there are sometimes two default collision entries
-                distance = self_collision.contact_distance
-                # threshold_a = self.collision_avoidance_config._self_collision_avoidance[link_a].hard_threshold
-                # threshold_b = self.collision_avoidance_config._self_collision_avoidance[link_b].hard_threshold
-                # threshold = min(threshold_a, threshold_b)
-                if distance < 0.0:
-                    raise SelfCollisionViolatedException(f'{self_collision.original_link_a} and '
-                                                         f'{self_collision.original_link_b} violate distance threshold:'
-                                                         f'{self_collision.contact_distance} < {0}')
+        contacts = collsions.contacts
+        violated = contacts[~contacts['is_external']
+                            & (contacts['link_b_hash'] != 0)
+                            & (contacts['contact_distance'] < 0.0)]
+        if len(violated) > 0:
+            self_collision = collsions.to_collision(violated[0])
+            raise SelfCollisionViolatedException(f'{self_collision.original_link_a} and '
+                                                 f'{self_collision.original_link_b} violate distance threshold:'
+                                                 f'{self_collision.contact_distance} < {0}')
 
     @catch_and_raise_to_blackboard
     @profile
@@ -66,8 +117,15 @@ class CollisionChecker(GiskardBehavior):
         """
         Computes closest point info for all robot links and safes it to the god map.
         """
-        self.collision_scene.sync()
-        collisions = self.collision_scene.check_collisions(self.collision_matrix, self.collision_list_size)
+        if self.pipelined:
+            if self.future is None:
+                self.submit_collision_check()
+            # blocks only in the first tick, otherwise the check of the previous tick overlapped with its control step
+            collisions = self.future.result()
+            self.submit_collision_check()
+        else:
+            self.collision_scene.sync()
+            collisions = self.check_collisions()
         self.are_self_collisions_violated(collisions)
         self.god_map.set_data(identifier.closest_point, collisions)
         return Status.RUNNING
@@ -35,7 +35,7 @@ class CollisionMarker(GiskardBehavior):
         Computes closest point info for all robot links and safes it to the god map.
         """
         collisions = self.get_god_map().get_data(identifier.closest_point)
-        if len(collisions.all_collisions) > 0:
+        if len(collisions.contacts) > 0:
             self.publish_cpi_markers(collisions)
         return Status.RUNNING
 
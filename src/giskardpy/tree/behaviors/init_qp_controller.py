@@ -1,5 +1,6 @@
+import os
 from itertools import chain
-from typing import Dict
+from typing import Dict, Optional
 
 from py_trees import Status
 
@@ -9,10 +10,20 @@ from giskardpy.exceptions import EmptyProblemException, ConstraintInitalizationE
 from giskardpy.goals.goal import Goal
 from giskardpy.qp.qp_controller import QPController
 from giskardpy.tree.behaviors.plugin import GiskardBehavior
-from giskardpy.utils.utils import catch_and_raise_to_blackboard
+from giskardpy.utils.file_cache import LRUFileCache
+from giskardpy.utils.utils import catch_and_raise_to_blackboard, get_c_code_cache
 
 
 class InitQPController(GiskardBehavior):
+    controller_cache: Optional[LRUFileCache] = None
+
+    def setup(self, timeout):
+        cache_size = self.god_map.get_data(identifier.controller_cache_size)
+        if cache_size > 0:
+            cache_folder = os.path.join(self.god_map.get_data(identifier.tmp_folder), 'controller_cache')
+            self.controller_cache = LRUFileCache(cache_folder, cache_size)
+        return super().setup(timeout)
+
     @catch_and_raise_to_blackboard
     @profile
     def update(self):
@@ -31,6 +42,9 @@ class InitQPController(GiskardBehavior):
                 identifier.retries_with_relaxed_constraints),
             retry_added_slack=self.get_god_map().unsafe_get_data(identifier.retry_added_slack),
             retry_weight_factor=self.get_god_map().unsafe_get_data(identifier.retry_weight_factor),
+            mask_zero_weight_slacks=self.get_god_map().unsafe_get_data(identifier.mask_zero_weight_slacks),
+            controller_cache=self.controller_cache,
+            c_code_cache=get_c_code_cache(),
         )
         qp_controller.compile()
         self.god_map.set_data(identifier.qp_controller, qp_controller)
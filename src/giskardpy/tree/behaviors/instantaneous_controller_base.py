@@ -1,6 +1,7 @@
 from py_trees import Status
 
 import giskardpy.identifier as identifier
+from giskardpy.god_map import ParameterPlan
 from giskardpy.qp.qp_controller import QPController
 from giskardpy.tree.behaviors.plugin import GiskardBehavior
 from giskardpy.utils.utils import catch_and_raise_to_blackboard
@@ -8,17 +9,18 @@ from giskardpy.utils.utils import catch_and_raise_to_blackboard
 
 class ControllerPluginBase(GiskardBehavior):
     controller: QPController = None
+    parameter_plan: ParameterPlan = None
 
     @catch_and_raise_to_blackboard
     @profile
     def initialise(self):
         self.controller = self.god_map.get_data(identifier.qp_controller)
+        self.parameter_plan = self.god_map.create_parameter_plan(self.controller.get_parameter_names())
 
     @catch_and_raise_to_blackboard
     @profile
     def update(self):
-        parameters = self.controller.get_parameter_names()
-        substitutions = self.god_map.get_values(parameters)
+        substitutions = self.parameter_plan.get_values()
 
         next_cmds = self.controller.get_cmd(substitutions)
         self.get_god_map().set_data(identifier.qp_solver_solution, next_cmds)
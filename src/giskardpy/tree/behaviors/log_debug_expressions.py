@@ -27,14 +27,16 @@ class LogDebugExpressionsPlugin(GiskardBehavior):
                 last_mjs = self.trajectory.get_exact(time-1)
             js = JointStates()
             for name, value in debug_data.items():
-                if last_mjs is not None:
-                    velocity = value - last_mjs[name].position
+                value = np.asarray(value)
+                if value.size == 1:
+                    entries = [(name, value.item())]
                 else:
-                    if isinstance(value, np.ndarray):
-                        velocity = np.zeros(value.shape)
-                    else:
-                        velocity = 0
-                js[name].position = value
-                js[name].velocity = velocity/self.sample_period
+                    # JointStates only store floats, matrices are split into one entry per element
+                    entries = [(f'{name}|{"_".join(str(i) for i in index)}', value[index])
+                               for index in np.ndindex(value.shape)]
+                for entry_name, entry_value in entries:
+                    js[entry_name].position = entry_value
+                    if last_mjs is not None:
+                        js[entry_name].velocity = (entry_value - last_mjs[entry_name].position) / self.sample_period
             self.trajectory.set(time, js)
         return Status.RUNNING
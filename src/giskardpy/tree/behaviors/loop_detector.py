@@ -1,9 +1,11 @@
 from collections import defaultdict
 
+import numpy as np
 from py_trees import Status
 
 import giskardpy.identifier as identifier
 from giskardpy.data_types import JointStates
+from giskardpy.my_types import Derivatives
 from giskardpy.tree.behaviors.plugin import GiskardBehavior
 from giskardpy.utils import logging
 
@@ -23,6 +25,7 @@ class LoopDetector(GiskardBehavior):
         self.past_joint_states = set()
         self.velocity_limits = defaultdict(lambda: 1)
         self.velocity_limits.update(self.world.get_all_free_variable_velocity_limits())
+        self.velocity_limits_version = None
 
     @profile
     def update(self):
@@ -40,4 +43,8 @@ class LoopDetector(GiskardBehavior):
         return Status.RUNNING
 
     def round_js(self, js: JointStates) -> tuple:
-        return tuple(round(state.position / self.velocity_limits[name], self.precision) for name, state in js.items())
+        if self.velocity_limits_version != js.version:
+            self.velocity_limits_array = np.array([self.velocity_limits[name] for name in js.names])
+            self.velocity_limits_version = js.version
+        positions = js.data[:, Derivatives.position] / self.velocity_limits_array
+        return tuple(np.round(positions, self.precision))
@@ -1,5 +1,3 @@
-from copy import deepcopy
-
 from py_trees import Status
 
 from giskardpy import identifier
@@ -10,7 +8,7 @@ from giskardpy.tree.behaviors.plugin import GiskardBehavior
 class NewTrajectory(GiskardBehavior):
     @profile
     def initialise(self):
-        current_js = deepcopy(self.god_map.get_data(identifier.joint_states))
+        current_js = self.god_map.get_data(identifier.joint_states)
         trajectory = Trajectory()
         trajectory.set(0, current_js)
         self.god_map.set_data(identifier.trajectory, trajectory)
@@ -155,10 +155,18 @@ class RosMsgToGoal(GetGoal):
 
     @profile
     def add_external_collision_avoidance_constraints(self, soft_threshold_override=None):
+        """
+        Adds one ExternalCollisionAvoidance goal per robot.
+        :param soft_threshold_override: maps (robot link, link_b) to the soft threshold of their collision,
+                                        defaults to the soft thresholds of the collision avoidance configs
+        """
         configs = self.collision_avoidance_configs
         fixed_joints = self.collision_scene.fixed_joints
         joints = [j for j in self.world.controlled_joints if j not in fixed_joints]
-        num_constrains = 0
+        link_names = defaultdict(list)
+        hard_thresholds = {}
+        number_of_repellers = {}
+        default_soft_thresholds = {}
         for joint_name in joints:
             try:
                 robot_name = self.world.get_group_of_joint(joint_name).name
@@ -167,30 +175,38 @@ class RosMsgToGoal(GetGoal):
                 robot_name = self.world._get_group_name_containing_link(child_link)
             child_links = self.world.get_directly_controlled_child_links_with_collisions(joint_name, fixed_joints)
             if child_links:
-                number_of_repeller = configs[robot_name].external_collision_avoidance[joint_name].number_of_repeller
-                for i in range(number_of_repeller):
-                    child_link = self.world.joints[joint_name].child_link_name
-                    hard_threshold = configs[robot_name].external_collision_avoidance[joint_name].hard_threshold
-                    if soft_threshold_override is not None:
-                        soft_threshold = soft_threshold_override
-                    else:
-                        soft_threshold = configs[robot_name].external_collision_avoidance[joint_name].soft_threshold
-                    constraint = ExternalCollisionAvoidance(robot_name=robot_name,
-                                                            link_name=child_link,
-                                                            hard_threshold=hard_threshold,
-                                                            soft_thresholds=soft_threshold,
-                                                            idx=i,
-                                                            num_repeller=number_of_repeller)
-                    constraint._save_self_on_god_map()
-                    num_constrains += 1
+                config = configs[robot_name].external_collision_avoidance[joint_name]
+                child_link = self.world.joints[joint_name].child_link_name
+                link_names[robot_name].append(child_link)
+                hard_thresholds[child_link] = config.hard_threshold
+                number_of_repellers[child_link] = config.number_of_repeller
+                for link_name in child_links:
+                    for link_b in self.world.link_names_with_collisions:
+                        default_soft_thresholds[link_name, link_b] = config.soft_threshold
+        if soft_threshold_override is not None:
+            soft_thresholds = dict(soft_threshold_override)
+        else:
+            soft_thresholds = default_soft_thresholds
+        # the collision checker looks up the soft threshold of each contact
+        self.god_map.set_data(identifier.external_collision_soft_thresholds, soft_thresholds)
+        num_constrains = 0
+        for robot_name, robot_link_names in link_names.items():
+            constraint = ExternalCollisionAvoidance(robot_name=robot_name,
+                                                    link_names=robot_link_names,
+                                                    hard_thresholds=hard_thresholds,
+                                                    number_of_repellers=number_of_repellers)
+            constraint._save_self_on_god_map()
+            num_constrains += sum(number_of_repellers[link_name] for link_name in robot_link_names)
         loginfo(f'Adding {num_constrains} external collision avoidance constraints.')
 
     @profile
     def add_self_collision_avoidance_constraints(self):
+        """
+        Adds one SelfCollisionAvoidance goal per robot.
+        """
         counter = defaultdict(int)
         fixed_joints = self.collision_scene.fixed_joints
         configs = self.collision_avoidance_configs
-        num_constr = 0
         for robot_name in self.robot_names:
             for link_a_o, link_b_o in self.world.groups[robot_name].possible_collision_combinations():
                 link_a_o, link_b_o = self.world.sort_links(link_a_o, link_b_o)
@@ -204,47 +220,54 @@ class RosMsgToGoal(GetGoal):
                     # no controlled joint between both links
                     pass
 
+        link_pairs = defaultdict(list)
+        hard_thresholds = {}
+        soft_thresholds = {}
+        number_of_repellers = {}
         for link_a, link_b in counter:
             group_names = self.world.get_group_names_containing_link(link_a)
             if len(group_names) != 1:
                 group_name = self.world.get_parent_group_name(group_names.pop())
             else:
                 group_name = group_names.pop()
-            num_of_constraints = min(1, counter[link_a, link_b])
-            for i in range(num_of_constraints):
-                key = f'{link_a}, {link_b}'
-                key_r = f'{link_b}, {link_a}'
-                config = configs[group_name].self_collision_avoidance
-                if key in config:
-                    hard_threshold = config[key].hard_threshold
-                    soft_threshold = config[key].soft_threshold
-                    number_of_repeller = config[key].number_of_repeller
-                elif key_r in config:
-                    hard_threshold = config[key_r].hard_threshold
-                    soft_threshold = config[key_r].soft_threshold
-                    number_of_repeller = config[key_r].number_of_repeller
-                else:
-                    # TODO minimum is not the best if i reduce to the links next to the controlled chains
-                    #   should probably add symbols that retrieve the values for the current pair
-                    hard_threshold = min(config[link_a].hard_threshold,
-                                         config[link_b].hard_threshold)
-                    soft_threshold = min(config[link_a].soft_threshold,
-                                         config[link_b].soft_threshold)
-                    number_of_repeller = min(config[link_a].number_of_repeller,
-                                             config[link_b].number_of_repeller)
-                groups_a = self.world._get_group_name_containing_link(link_a)
-                groups_b = self.world._get_group_name_containing_link(link_b)
-                if groups_b == groups_a:
-                    robot_name = groups_a
-                else:
-                    raise Exception(f'Could not find group containing the link {link_a} and {link_b}.')
-                constraint = SelfCollisionAvoidance(link_a=link_a,
-                                                    link_b=link_b,
-                                                    robot_name=robot_name,
-                                                    hard_threshold=hard_threshold,
-                                                    soft_threshold=soft_threshold,
-                                                    idx=i,
-                                                    num_repeller=number_of_repeller)
-                constraint._save_self_on_god_map()
-                num_constr += 1
+            key = f'{link_a}, {link_b}'
+            key_r = f'{link_b}, {link_a}'
+            config = configs[group_name].self_collision_avoidance
+            if key in config:
+                hard_threshold = config[key].hard_threshold
+                soft_threshold = config[key].soft_threshold
+                number_of_repeller = config[key].number_of_repeller
+            elif key_r in config:
+                hard_threshold = config[key_r].hard_threshold
+                soft_threshold = config[key_r].soft_threshold
+                number_of_repeller = config[key_r].number_of_repeller
+            else:
+                # TODO minimum is not the best if i reduce to the links next to the controlled chains
+                #   should probably add symbols that retrieve the values for the current pair
+                hard_threshold = min(config[link_a].hard_threshold,
+                                     config[link_b].hard_threshold)
+                soft_threshold = min(config[link_a].soft_threshold,
+                                     config[link_b].soft_threshold)
+                number_of_repeller = min(config[link_a].number_of_repeller,
+                                         config[link_b].number_of_repeller)
+            groups_a = self.world._get_group_name_containing_link(link_a)
+            groups_b = self.world._get_group_name_containing_link(link_b)
+            if groups_b == groups_a:
+                robot_name = groups_a
+            else:
+                raise Exception(f'Could not find group containing the link {link_a} and {link_b}.')
+            link_pairs[robot_name].append((link_a, link_b))
+            hard_thresholds[link_a, link_b] = hard_threshold
+            soft_thresholds[link_a, link_b] = soft_threshold
+            number_of_repellers[link_a, link_b] = number_of_repeller
+
+        num_constr = 0
+        for robot_name, robot_link_pairs in link_pairs.items():
+            constraint = SelfCollisionAvoidance(robot_name=robot_name,
+                                                link_pairs=robot_link_pairs,
+                                                hard_thresholds=hard_thresholds,
+                                                soft_thresholds=soft_thresholds,
+                                                number_of_repellers=number_of_repellers)
+            constraint._save_self_on_god_map()
+            num_constr += len(robot_link_pairs)
         loginfo(f'Adding {num_constr} self collision avoidance constraints.')
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Optional, Union
+
+from giskardpy.utils import logging
+
+
+class LRUFileCache:
+    """
+    Content addressed cache on disk. Every entry is a folder named after its key, which can contain arbitrary files.
+    The modification time of an entry folder is used as its last access time.
+    If the total size exceeds max_size_mb, the least recently used entries are deleted.
+    """
+
+    def __init__(self, folder: str, max_size_mb: float):
+        self.folder = folder
+        self.max_size = max_size_mb * 1024 ** 2
+        os.makedirs(self.folder, exist_ok=True)
+
+    @staticmethod
+    def hash(*data: Union[str, bytes]) -> str:
+        h = hashlib.sha256()
+        for d in data:
+            if isinstance(d, str):
+                d = d.encode()
+            h.update(d)
+            # separator, such that ('ab', 'c') and ('a', 'bc') don't collide
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.folder, key)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        :return: path to the folder of the entry or None, if there is no entry for key
+        """
+        path = self.entry_path(key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # got evicted by someone else in the meantime
+            return None
+        return path
+
+    @contextmanager
+    def add(self, key: str):
+        """
+        Yields a temporary folder, which is moved into the cache once the with block is left without exception.
+        This way, readers never see partially written entries.
+        """
+        tmp_path = tempfile.mkdtemp(dir=self.folder, prefix='.tmp_')
+        try:
+            yield tmp_path
+            try:
+                os.rename(tmp_path, self.entry_path(key))
+            except OSError:
+                # another process has added the same entry in the meantime
+                pass
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self.evict()
+
+    def delete(self, key: str):
+        shutil.rmtree(self.entry_path(key), ignore_errors=True)
+
+    def entry_size(self, key: str) -> int:
+        size = 0
+        for dir_path, _, file_names in os.walk(self.entry_path(key)):
+            for file_name in file_names:
+                try:
+                    size += os.path.getsize(os.path.join(dir_path, file_name))
+                except OSError:
+                    pass
+        return size
+
+    def evict(self):
+        entries = []
+        for key in os.listdir(self.folder):
+            if key.startswith('.tmp_'):
+                continue
+            try:
+                entries.append((os.path.getmtime(self.entry_path(key)), key))
+            except OSError:
+                pass
+        sizes = {key: self.entry_size(key) for _, key in entries}
+        total_size = sum(sizes.values())
+        for _, key in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            logging.logdebug(f'Evicting {key} from cache in {self.folder}.')
+            self.delete(key)
+            total_size -= sizes[key]
@@ -0,0 +1,253 @@
+import json
+import multiprocessing
+import os
+import tempfile
+from typing import List, Dict, Iterable, Tuple
+
+import numpy as np
+import trimesh
+
+from giskardpy import identifier
+from giskardpy.god_map import GodMap
+from giskardpy.utils import logging
+from giskardpy.utils.file_cache import LRUFileCache
+from giskardpy.utils.utils import resolve_ros_iris
+
+# bump, if the content of cache entries changes
+mesh_cache_version = '1'
+convex_parts_file_name = 'convex_parts.obj'
+bounding_primitives_file_name = 'bounding_primitives.json'
+# (file path, modification time, size, vertex budget) -> key in the mesh cache
+_mesh_cache_keys: Dict[Tuple[str, int, int, int], str] = {}
+# key in the mesh cache -> folder of entries that didn't fit into the mesh cache
+_uncached_entries: Dict[str, str] = {}
+
+
+def get_mesh_cache() -> LRUFileCache:
+    god_map = GodMap()
+    return LRUFileCache(os.path.join(god_map.get_data(identifier.tmp_folder), 'mesh_cache'),
+                        god_map.get_data(identifier.mesh_cache_size))
+
+
+def to_file_path(file_name: str) -> str:
+    file_name = resolve_ros_iris(file_name)
+    if file_name.startswith('file://'):
+        file_name = file_name[len('file://'):]
+    return file_name
+
+
+def is_preprocessed(file_name: str) -> bool:
+    """
+    :return: True, if file_name points to convex parts inside of a mesh cache
+    """
+    return os.path.basename(to_file_path(file_name)) == convex_parts_file_name
+
+
+def mesh_cache_key(file_name: str, vertex_budget: int) -> str:
+    """
+    The key only depends on the content of the file, not its name or path.
+    The scale is not part of the key, because it is applied when the convex parts are loaded.
+    Keys are remembered per path, modification time and size of the file, such that a file is only hashed again,
+    if it changed.
+    """
+    file_path = to_file_path(file_name)
+    file_stat = os.stat(file_path)
+    memo_key = (file_path, file_stat.st_mtime_ns, file_stat.st_size, vertex_budget)
+    if memo_key not in _mesh_cache_keys:
+        with open(file_path, 'rb') as f:
+            content = f.read()
+        _mesh_cache_keys[memo_key] = LRUFileCache.hash(mesh_cache_version, os.path.splitext(file_name)[1].lower(),
+                                                       content, str(vertex_budget))
+    return _mesh_cache_keys[memo_key]
+
+
+def decompose(mesh: trimesh.Trimesh) -> List[trimesh.Trimesh]:
+    """
+    Splits mesh into convex parts. Uses V-HACD if it is available, otherwise non-convex meshes are replaced
+    by their convex hull.
+    """
+    if mesh.is_convex:
+        return [mesh]
+    try:
+        parts = trimesh.decomposition.convex_decomposition(mesh)
+    except Exception as e:
+        logging.logdebug(f'Convex decomposition failed ({e}), using convex hull instead.')
+        return [mesh.convex_hull]
+    if isinstance(parts, dict):
+        parts = [parts]
+    return [trimesh.Trimesh(**part) if isinstance(part, dict) else part for part in parts]
+
+
+def simplify_hull(vertices: np.ndarray, vertex_budget: int) -> trimesh.Trimesh:
+    """
+    :return: convex hull of at most vertex_budget of the vertices, picked with farthest point sampling
+    """
+    hull_vertices = trimesh.convex.convex_hull(vertices).vertices
+    if 0 < vertex_budget < len(hull_vertices):
+        chosen = [int(np.argmax(np.linalg.norm(hull_vertices - hull_vertices.mean(axis=0), axis=1)))]
+        distances = np.linalg.norm(hull_vertices - hull_vertices[chosen[0]], axis=1)
+        for _ in range(vertex_budget - 1):
+            chosen.append(int(np.argmax(distances)))
+            distances = np.minimum(distances, np.linalg.norm(hull_vertices - hull_vertices[chosen[-1]], axis=1))
+        hull_vertices = hull_vertices[chosen]
+    return trimesh.convex.convex_hull(hull_vertices)
+
+
+def save_convex_parts(file_name: str, parts: List[trimesh.Trimesh]):
+    """
+    Writes each part as a separate object into one obj file.
+    """
+    lines = []
+    offset = 1
+    for i, part in enumerate(parts):
+        lines.append(f'o convex_{i}')
+        lines.extend(f'v {x:.9g} {y:.9g} {z:.9g}' for x, y, z in part.vertices)
+        lines.extend(f'f {a + offset} {b + offset} {c + offset}' for a, b, c in part.faces)
+        offset += len(part.vertices)
+    with open(file_name, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def compute_bounding_primitives(parts: List[trimesh.Trimesh]) -> dict:
+    """
+    Bounding primitives of the unscaled mesh.
+    """
+    vertices = np.concatenate([part.vertices for part in parts])
+    aabb_min, aabb_max = vertices.min(axis=0), vertices.max(axis=0)
+    center = (aabb_min + aabb_max) / 2
+    return {'aabb_min': aabb_min.tolist(),
+            'aabb_max': aabb_max.tolist(),
+            'sphere_center': center.tolist(),
+            'sphere_radius': float(np.max(np.linalg.norm(vertices - center, axis=1))),
+            'radius_around_origin': float(np.max(np.linalg.norm(vertices, axis=1))),
+            'number_of_parts': len(parts),
+            'number_of_vertices': len(vertices)}
+
+
+def load_convex_parts(file_name: str) -> List[trimesh.Trimesh]:
+    """
+    Obj files with multiple objects are assumed to be decomposed already, each object is used as one convex part.
+    Everything else is loaded as one mesh and decomposed.
+    """
+    file_path = to_file_path(file_name)
+    if file_path.lower().endswith('.obj'):
+        scene = trimesh.load(file_path, split_object=True, group_material=False)
+        if isinstance(scene, trimesh.Scene) and len(scene.geometry) > 1:
+            return scene.dump()
+    return decompose(trimesh.load(file_path, force='mesh'))
+
+
+def save_entry(entry_path: str, parts: List[trimesh.Trimesh]):
+    save_convex_parts(os.path.join(entry_path, convex_parts_file_name), parts)
+    with open(os.path.join(entry_path, bounding_primitives_file_name), 'w') as f:
+        json.dump(compute_bounding_primitives(parts), f)
+
+
+def compute_cache_entry(cache: LRUFileCache, key: str, file_name: str, vertex_budget: int):
+    parts = [simplify_hull(part.vertices, vertex_budget) for part in load_convex_parts(file_name)]
+    with cache.add(key) as entry_path:
+        save_entry(entry_path, parts)
+    logging.loginfo(f'Preprocessed {file_name} into {len(parts)} convex parts.')
+
+
+def is_uncached(key: str) -> bool:
+    """
+    :return: True, if the entry of key didn't fit into the mesh cache and was computed outside of it
+    """
+    return key in _uncached_entries and os.path.isdir(_uncached_entries[key])
+
+
+def compute_uncached_entry(key: str, file_name: str, vertex_budget: int) -> str:
+    """
+    Preprocesses file_name into a folder outside of the mesh cache, for meshes that the cache can't hold.
+    :return: path to the folder
+    """
+    if not is_uncached(key):
+        logging.logwarn(f'Mesh cache is too small for {file_name}, preprocessing it without caching it.')
+        parts = [simplify_hull(part.vertices, vertex_budget) for part in load_convex_parts(file_name)]
+        folder = os.path.join(GodMap().get_data(identifier.tmp_folder), 'uncached_meshes')
+        os.makedirs(folder, exist_ok=True)
+        entry_path = tempfile.mkdtemp(dir=folder)
+        save_entry(entry_path, parts)
+        _uncached_entries[key] = entry_path
+    return _uncached_entries[key]
+
+
+def _compute_cache_entry(args: Tuple[LRUFileCache, str, str, int]):
+    compute_cache_entry(*args)
+
+
+def preprocess_meshes(file_names: Iterable[str]) -> Dict[str, str]:
+    """
+    Makes sure that all meshes are in the mesh cache. Meshes that are not cached yet are preprocessed in parallel,
+    if mesh_preprocessing_processes allows it. The worker processes are spawned, because forking a process with
+    running threads can deadlock.
+    :return: maps file names to the folder of their cache entry
+    """
+    god_map = GodMap()
+    vertex_budget = god_map.get_data(identifier.collision_mesh_vertex_budget)
+    cache = get_mesh_cache()
+    keys = {file_name: mesh_cache_key(file_name, vertex_budget) for file_name in set(file_names)
+            if not is_preprocessed(file_name)}
+    missing = {}
+    for file_name, key in keys.items():
+        if cache.get(key) is None and key not in missing and not is_uncached(key):
+            missing[key] = file_name
+    if missing:
+        # resolve ros iris here, the spawned processes don't know the ros package path
+        jobs = [(cache, key, to_file_path(file_name), vertex_budget) for key, file_name in missing.items()]
+        number_of_processes = god_map.get_data(identifier.mesh_preprocessing_processes)
+        if number_of_processes <= 0:
+            number_of_processes = os.cpu_count() or 1
+        number_of_processes = min(number_of_processes, len(jobs))
+        if number_of_processes <= 1:
+            for job in jobs:
+                _compute_cache_entry(job)
+        else:
+            with multiprocessing.get_context('spawn').Pool(number_of_processes) as pool:
+                pool.map(_compute_cache_entry, jobs)
+    entry_paths = {}
+    for file_name, key in keys.items():
+        entry_path = cache.get(key)
+        if entry_path is None:
+            # the cache is too small or another process evicted the entry in the meantime
+            entry_path = compute_uncached_entry(key, file_name, vertex_budget)
+        entry_paths[file_name] = entry_path
+    return entry_paths
+
+
+def get_convex_parts(file_name: str) -> str:
+    """
+    :return: path to an obj file with the convex parts of file_name, computes them if they are not cached yet
+    """
+    if is_preprocessed(file_name):
+        return to_file_path(file_name)
+    entry_path = preprocess_meshes([file_name])[file_name]
+    return os.path.join(entry_path, convex_parts_file_name)
+
+
+def get_bounding_primitives(file_name: str) -> dict:
+    """
+    :return: bounding primitives of the unscaled mesh, see compute_bounding_primitives
+    """
+    if is_preprocessed(file_name):
+        entry_path = os.path.dirname(to_file_path(file_name))
+    else:
+        entry_path = preprocess_meshes([file_name])[file_name]
+    with open(os.path.join(entry_path, bounding_primitives_file_name), 'r') as f:
+        return json.load(f)
+
+
+def load_convex_part_vertices(file_name: str) -> List[np.ndarray]:
+    """
+    Reads the vertices of each convex part of file_name from the mesh cache without trimesh.
+    :return: one array of shape (number of vertices, 3) per convex part, unscaled
+    """
+    parts = []
+    with open(get_convex_parts(file_name), 'r') as f:
+        for line in f:
+            if line.startswith('o '):
+                parts.append([])
+            elif line.startswith('v '):
+                parts[-1].append([float(x) for x in line.split()[1:4]])
+    return [np.array(vertices) for vertices in parts]
@@ -9,6 +9,8 @@ from giskardpy.god_map import GodMap
 
 class TimeCollector:
     qp_solver_times: Dict[Tuple[str, int, int], List[float]] = defaultdict(list)
+    # number of syncs of the collision scene and the transforms of collision objects that were pushed during them
+    pushed_collision_transforms: Dict[str, int] = defaultdict(int)
     separator = ';'
 
     def __init__(self):
@@ -17,6 +19,17 @@ class TimeCollector:
     def add_qp_solve_time(self, class_name, number_variables, number_constraints, time):
         self.qp_solver_times[class_name, number_variables, number_constraints].append(time)
 
+    def add_pushed_collision_transforms(self, number_of_transforms):
+        self.pushed_collision_transforms['transforms'] += number_of_transforms
+        self.pushed_collision_transforms['syncs'] += 1
+
+    def print_pushed_collision_transforms(self):
+        print('pushed collision transforms, syncs, avg per sync')
+        syncs = self.pushed_collision_transforms['syncs']
+        if syncs > 0:
+            transforms = self.pushed_collision_transforms['transforms']
+            print(self.separator.join([str(transforms), str(syncs), str(transforms / syncs)]))
+
     def print_qp_solver_times(self):
         print('solver, variables, constraints, avg, std, samples')
         for dims, times in sorted(self.qp_solver_times.items()):
@@ -31,3 +44,5 @@ class TimeCollector:
         print('-------------------------------------------------')
         self.print_qp_solver_times()
         print('-------------------------------------------------')
+        self.print_pushed_collision_transforms()
+        print('-------------------------------------------------')
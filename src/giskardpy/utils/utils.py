@@ -26,7 +26,6 @@ import pylab as plt
 import roslaunch
 import rospkg
 import rospy
-import trimesh
 from genpy import Message
 from geometry_msgs.msg import PointStamped, Point, Vector3Stamped, Vector3, Pose, PoseStamped, QuaternionStamped, \
     Quaternion
@@ -40,8 +39,9 @@ from visualization_msgs.msg import Marker, MarkerArray
 from giskardpy import identifier
 from giskardpy.exceptions import DontPrintStackTrace
 from giskardpy.god_map import GodMap
-from giskardpy.my_types import PrefixName
+from giskardpy.my_types import PrefixName, Derivatives
 from giskardpy.utils import logging
+from giskardpy.utils.file_cache import LRUFileCache
 from giskardpy.utils.time_collector import TimeCollector
 
 
@@ -263,7 +263,7 @@ def plot_trajectory(tj, controlled_joints, path_to_data_folder, sample_period, o
             return np.floor((float)(val - base) / stride) * stride + base
 
         order = max(order, 2)
-        if len(tj._points) <= 0:
+        if len(tj) <= 0:
             return
         colors = list(mcolors.TABLEAU_COLORS.keys())
         colors.append('k')
@@ -272,25 +272,15 @@ def plot_trajectory(tj, controlled_joints, path_to_data_folder, sample_period, o
         line_styles = ['-', '--', '-.', ':']
         fmts = list(product(line_styles, colors))
         data = [[] for i in range(order)]
-        times = []
-        names = list(sorted([i for i in tj._points[0.0].keys() if i in controlled_joints]))
+        names = list(sorted([i for i in tj.get_exact(0).keys() if i in controlled_joints]))
         if diff_after > 3:
             tj.delete_last()
-        for time, point in tj.items():
-            for i in range(order):
-                if i == 0:
-                    data[0].append([point[joint_name].position for joint_name in names])
-                elif i == 1:
-                    data[1].append([point[joint_name].velocity for joint_name in names])
-                elif i < diff_after and i == 2:
-                    data[2].append([point[joint_name].acceleration for joint_name in names])
-                elif i < diff_after and i == 3:
-                    data[3].append([point[joint_name].jerk for joint_name in names])
-            times.append(time)
+        tj_data = tj.to_np(names)
+        times = list(tj.keys())
 
         for i in range(0, order):
             if i < diff_after:
-                data[i] = np.array(data[i])
+                data[i] = tj_data[:, :, i]
             else:
                 data[i] = np.diff(data[i - 1], axis=0, prepend=0) / sample_period
         if (normalize_position):
@@ -442,21 +432,15 @@ def fix_obj(file_name):
             f.write(fixed_obj)
 
 
-def convert_to_decomposed_obj_and_save_in_tmp(file_name: str, log_path='/tmp/giskardpy/vhacd.log'):
-    first_group_name = list(GodMap().get_data(identifier.world).groups.keys())[0]
-    resolved_old_path = resolve_ros_iris(file_name)
-    short_file_name = file_name.split('/')[-1][:-3]
-    decomposed_obj_file_name = f'{first_group_name}/{short_file_name}obj'
-    new_path = to_tmp_path(decomposed_obj_file_name)
-    if not os.path.exists(new_path):
-        mesh = trimesh.load(resolved_old_path, force='mesh')
-        obj_str = trimesh.exchange.obj.export_obj(mesh)
-        write_to_tmp(decomposed_obj_file_name, obj_str)
-        logging.loginfo(f'converting {file_name} to obj and saved in {new_path}')
-        # if not trimesh.convex.is_convex(mesh):
-        #     pybullet.vhacd(new_path, new_path, log_path)
-
-    return new_path
+def get_c_code_cache() -> Optional[LRUFileCache]:
+    """
+    :return: the cache for compiled C code or None, if expressions should be evaluated with casadi's virtual machine
+    """
+    god_map = GodMap()
+    cache_size = god_map.get_data(identifier.c_code_cache_size)
+    if cache_size <= 0:
+        return None
+    return LRUFileCache(os.path.join(god_map.get_data(identifier.tmp_folder), 'c_code_cache'), cache_size)
 
 
 def memoize(function):
@@ -607,17 +591,11 @@ def trajectory_to_np(tj, joint_names):
     :type tj: Trajectory
     :return:
     """
-    names = list(sorted([i for i in tj._points[0.0].keys() if i in joint_names]))
-    position = []
-    velocity = []
-    times = []
-    for time, point in tj.items():
-        position.append([point[joint_name].position for joint_name in names])
-        velocity.append([point[joint_name].velocity for joint_name in names])
-        times.append(time)
-    position = np.array(position)
-    velocity = np.array(velocity)
-    times = np.array(times)
+    names = list(sorted([i for i in tj.get_exact(0).keys() if i in joint_names]))
+    data = tj.to_np(names)
+    position = data[:, :, Derivatives.position]
+    velocity = data[:, :, Derivatives.velocity]
+    times = np.array(list(tj.keys()))
     return names, position, velocity, times
 
 
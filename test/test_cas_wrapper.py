@@ -1,5 +1,8 @@
 import math
+import os
+import tempfile
 import unittest
+from unittest import mock
 
 import PyKDL
 import hypothesis.strategies as st
@@ -12,6 +15,7 @@ from tf.transformations import quaternion_matrix, quaternion_about_axis, quatern
     quaternion_slerp, rotation_from_matrix, euler_from_matrix
 
 from giskardpy import casadi_wrapper as w
+from giskardpy.utils.file_cache import LRUFileCache
 from giskardpy.utils.math import compare_orientations, axis_angle_from_quaternion, rotation_matrix_from_quaternion
 from utils_for_tests import float_no_nan_no_inf, unit_vector, quaternion, vector, \
     pykdl_frame_to_numpy, lists_of_same_length, random_angle, compare_axis_angle, angle_positive, sq_matrix
@@ -558,6 +562,87 @@ class TestCASWrapper(unittest.TestCase):
         np.testing.assert_array_almost_equal(f(), expected)
         np.testing.assert_array_almost_equal(f.call2([]), expected)
 
+    def test_call2_batch(self):
+        a, b = w.var('a b')
+        e = w.Expression([[a, b], [a * b, w.sin(a)], [1, b ** 2]])
+        f = e.compile()
+        parameters = np.random.rand(7, 2)
+        expected = np.array([f.call2(p).copy() for p in parameters])
+        np.testing.assert_array_almost_equal(f.call2_batch(parameters), expected)
+        # more threads than evaluations
+        for number_of_threads in [3, 10]:
+            np.testing.assert_array_almost_equal(f.call2_batch(parameters, number_of_threads=number_of_threads),
+                                                 expected)
+        np.testing.assert_array_almost_equal(f.call2_batch(parameters[:1]), expected[:1])
+
+    def test_call2_batch_without_parameters(self):
+        expected = np.array([[1, 2, 3], [4, 5, 6]])
+        f = w.Expression(expected).compile()
+        result = f.call2_batch(np.zeros((4, 0)))
+        assert result.shape == (4, 2, 3)
+        for r in result:
+            np.testing.assert_array_almost_equal(r, expected)
+
+    def test_compile_to_c(self):
+        if w.find_c_compiler() is None:
+            self.skipTest('no C compiler')
+        a, b = w.var('a b')
+        e = w.TransMatrix.from_xyz_rpy(x=a, yaw=b)
+        expected = e.compile()
+        with tempfile.TemporaryDirectory() as folder:
+            cache = LRUFileCache(folder, 10)
+            f = e.compile(c_code_cache=cache)
+            assert f.fast_f is not f.casadi_f
+            assert len(os.listdir(folder)) == 1
+            for p in np.random.rand(5, 2):
+                np.testing.assert_array_almost_equal(f.call2(p), expected.call2(p))
+            # the second compilation loads the shared library from the cache
+            with mock.patch('subprocess.run') as run:
+                f2 = e.compile(c_code_cache=cache)
+                run.assert_not_called()
+            np.testing.assert_array_almost_equal(f2.call2([1, 2]), expected.call2([1, 2]))
+
+    def test_compile_to_c_fallback(self):
+        a, b = w.var('a b')
+        e = w.Expression([a + b, a * b])
+        with tempfile.TemporaryDirectory() as folder:
+            cache = LRUFileCache(folder, 10)
+            with mock.patch.object(w, 'find_c_compiler', return_value=None):
+                f = e.compile(c_code_cache=cache)
+                assert f.fast_f is f.casadi_f
+            if w.find_c_compiler() is not None:
+                # compilation fails
+                with mock.patch.object(w, 'c_compiler_flags', ['--no-such-flag']):
+                    f = e.compile(c_code_cache=cache)
+                    assert f.fast_f is f.casadi_f
+                # the shared library doesn't fit into the cache
+                f = e.compile(c_code_cache=LRUFileCache(folder, 0))
+                assert f.fast_f is f.casadi_f
+            assert not os.listdir(folder)
+            np.testing.assert_array_almost_equal(f.call2([2, 3]), [[5], [6]])
+
+    def test_compile_to_c_broken_library(self):
+        if w.find_c_compiler() is None:
+            self.skipTest('no C compiler')
+        a, b = w.var('a b')
+        e = w.Expression([a + b, a * b])
+        with tempfile.TemporaryDirectory() as folder:
+            cache = LRUFileCache(folder, 10)
+            e.compile(c_code_cache=cache)
+            entry, = os.listdir(folder)
+            with open(os.path.join(folder, entry, 'f.so'), 'w') as f:
+                f.write('truncated')
+            f = e.compile(c_code_cache=cache)
+            assert f.fast_f is f.casadi_f
+            # the broken entry is removed, such that it is compiled again
+            assert not os.listdir(folder)
+            np.testing.assert_array_almost_equal(f.call2([2, 3]), [[5], [6]])
+            # code generation fails
+            with mock.patch.object(w.ca, 'CodeGenerator', side_effect=RuntimeError('muh')):
+                f = e.compile(c_code_cache=cache)
+                assert f.fast_f is f.casadi_f
+            assert not os.listdir(folder)
+
     def test_add(self):
         s2 = 'muh'
         f = 1.0
@@ -1565,3 +1650,68 @@ class TestCASWrapper(unittest.TestCase):
         e = w.if_eq(a, 0, a, b)
         assert w.to_str(e) == '(((a==0)?a:0)+((!(a==0))?b:0))'
         assert w.to_str(e) == e.pretty_str()
+
+
+class TestLRUFileCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def add_entry(self, cache: LRUFileCache, key: str, size: int, last_access: float):
+        with cache.add(key) as path:
+            with open(os.path.join(path, 'data'), 'wb') as f:
+                f.write(b'0' * size)
+        os.utime(cache.entry_path(key), (last_access, last_access))
+
+    def test_add_and_get(self):
+        cache = LRUFileCache(self.folder.name, 1)
+        key = cache.hash('muh', b'kuh')
+        assert key != cache.hash('muhk', b'uh')
+        assert cache.get(key) is None
+        self.add_entry(cache, key, 10, 0)
+        path = cache.get(key)
+        assert path == cache.entry_path(key)
+        with open(os.path.join(path, 'data'), 'rb') as f:
+            assert f.read() == b'0' * 10
+        # get marks the entry as recently used
+        assert os.path.getmtime(path) > 0
+        assert os.listdir(self.folder.name) == [key]
+
+    def test_add_failed(self):
+        cache = LRUFileCache(self.folder.name, 1)
+        with self.assertRaises(ValueError):
+            with cache.add('muh') as path:
+                with open(os.path.join(path, 'data'), 'w') as f:
+                    f.write('half written')
+                raise ValueError()
+        assert cache.get('muh') is None
+        assert not os.listdir(self.folder.name)
+
+    def test_add_twice(self):
+        # e.g. another process has added the same entry in the meantime
+        cache = LRUFileCache(self.folder.name, 1)
+        self.add_entry(cache, 'muh', 10, 0)
+        with cache.add('muh') as path:
+            with open(os.path.join(path, 'data2'), 'w') as f:
+                f.write('muh')
+        assert os.listdir(self.folder.name) == ['muh']
+        assert os.listdir(cache.get('muh')) == ['data']
+
+    def test_evict(self):
+        cache = LRUFileCache(self.folder.name, 2500 / 1024 ** 2)
+        for i in range(3):
+            self.add_entry(cache, f'entry{i}', 1000, i)
+        # entry0 was used least recently
+        assert cache.get('entry0') is None
+        assert cache.get('entry1') is not None
+        # now entry2 was used least recently
+        self.add_entry(cache, 'entry3', 1000, 3)
+        assert cache.get('entry2') is None
+        assert sorted(os.listdir(self.folder.name)) == ['entry1', 'entry3']
+
+    def test_get_evicted_in_the_meantime(self):
+        cache = LRUFileCache(self.folder.name, 1)
+        self.add_entry(cache, 'muh', 10, 0)
+        # another process deletes the entry between the check and the access time update
+        with mock.patch('os.utime', side_effect=FileNotFoundError()):
+            assert cache.get('muh') is None
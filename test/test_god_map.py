@@ -5,12 +5,16 @@ import giskardpy
 giskardpy.WORLD_IMPLEMENTATION = None
 import unittest
 from collections import namedtuple
+from copy import deepcopy
 
 from geometry_msgs.msg import PoseStamped
 from hypothesis import given, assume
 import hypothesis.strategies as st
 from giskardpy import casadi_wrapper as w
+from giskardpy.data_types import JointStates, _JointState
+from giskardpy.exceptions import GiskardException
 from giskardpy.god_map import GodMap
+from giskardpy.my_types import Derivatives
 from utils_for_tests import variable_name, keys_values, lists_of_same_length
 
 
@@ -368,3 +372,123 @@ class TestGodMap(unittest.TestCase):
         assert gm.evaluate_expr(expr)[0][0] == data[0]
         assert gm.evaluate_expr(expr)[1][0] == data[1]
         assert gm.evaluate_expr(expr)[2][0] == data[2]
+
+    def _create_joint_states_god_map(self, number_of_joints):
+        class World:
+            pass
+
+        gm = GodMap()
+        gm.clear()
+        world = World()
+        world.state = JointStates()
+        for i in range(number_of_joints):
+            world.state[f'joint{i}'].position = i
+            world.state[f'joint{i}'].velocity = -i
+        gm.set_data(['world'], world)
+        gm.set_data(['fk'], np.arange(16, dtype=float).reshape((4, 4)))
+        gm.set_data(['weight'], 0.5)
+        symbols = [str(gm.to_symbol(['world', 'state', f'joint{i}', derivative]))
+                   for i in reversed(range(number_of_joints))
+                   for derivative in [Derivatives.position, Derivatives.velocity]]
+        symbols.append(str(gm.to_symbol(['weight'])))
+        symbols.extend(str(gm.to_symbol(['fk', i, 3])) for i in range(3))
+        return gm, world, symbols
+
+    def assert_plan_matches_get_values(self, gm, plan, symbols):
+        np.testing.assert_array_equal(plan.get_values(), np.array(gm.get_values(symbols), dtype=float))
+
+    def test_parameter_plan(self):
+        gm, world, symbols = self._create_joint_states_god_map(5)
+        plan = gm.create_parameter_plan(symbols)
+        self.assert_plan_matches_get_values(gm, plan, symbols)
+        world.state['joint3'].position = 23
+        gm.set_data(['weight'], 2)
+        gm.get_data(['fk'])[1, 3] = 42
+        self.assert_plan_matches_get_values(gm, plan, symbols)
+        self.assertEqual(plan.get_values()[symbols.index(str(gm.to_symbol(['world', 'state', 'joint3',
+                                                                           Derivatives.position])))], 23)
+
+    def test_parameter_plan_state_growth(self):
+        gm, world, symbols = self._create_joint_states_god_map(5)
+        plan = gm.create_parameter_plan(symbols)
+        self.assert_plan_matches_get_values(gm, plan, symbols)
+        # enough new joints to reallocate JointStates.data
+        for i in range(5, 50):
+            world.state[f'joint{i}'].position = i
+        world.state['joint2'].velocity = 7
+        self.assert_plan_matches_get_values(gm, plan, symbols)
+
+    def test_parameter_plan_version_bump(self):
+        gm, world, symbols = self._create_joint_states_god_map(5)
+        plan = gm.create_parameter_plan(symbols)
+        self.assert_plan_matches_get_values(gm, plan, symbols)
+        version = world.state.version
+        # deleting a row moves all following rows
+        world.state['extra'].position = 1
+        del world.state['extra']
+        del world.state['joint0']
+        world.state['joint0'].position = 13
+        self.assertNotEqual(version, world.state.version)
+        self.assertEqual(world.state.index('joint0'), 4)
+        self.assert_plan_matches_get_values(gm, plan, symbols)
+
+    def test_parameter_plan_rebinding(self):
+        gm, world, symbols = self._create_joint_states_god_map(5)
+        plan = gm.create_parameter_plan(symbols)
+        self.assert_plan_matches_get_values(gm, plan, symbols)
+        # new JointStates with the same names in a different order
+        new_state = JointStates()
+        for i in reversed(range(5)):
+            new_state[f'joint{i}'] = _JointState(position=i * 10, velocity=i * 100)
+        world.state = new_state
+        self.assert_plan_matches_get_values(gm, plan, symbols)
+        # copy with the same version, but different values
+        world.state = deepcopy(new_state)
+        world.state['joint1'].position = -1
+        self.assert_plan_matches_get_values(gm, plan, symbols)
+        gm.set_data(['fk'], np.eye(4))
+        self.assert_plan_matches_get_values(gm, plan, symbols)
+
+    def test_parameter_plan_errors(self):
+        gm, world, symbols = self._create_joint_states_god_map(5)
+        plan = gm.create_parameter_plan(symbols)
+        gm.set_data(['fk'], np.eye(2))
+        with self.assertRaises(IndexError) as context:
+            plan.get_values()
+        self.assertIn('path', str(context.exception))
+        self.assertIsInstance(context.exception.__cause__, IndexError)
+        gm.set_data(['fk'], np.eye(4))
+        gm.set_data(['weight'], 'muh')
+        with self.assertRaises(GiskardException) as context:
+            plan.get_values()
+        self.assertIsInstance(context.exception.__cause__, ValueError)
+
+    def test_joint_states_views(self):
+        joint_states = JointStates()
+        joint_state = _JointState(position=1)
+        joint_states['a'] = joint_state
+        view = joint_states['b']
+        for i in range(20):
+            joint_states[f'c{i}'].position = i
+        joint_state.velocity = 2
+        view.position = 3
+        # assigned states are copied
+        self.assertEqual(joint_states['a'].velocity, 0)
+        joint_states['b'] = joint_state
+        joint_state.position = 6
+        self.assertEqual(joint_states['b'].position, 1)
+        self.assertEqual(joint_states['b'].velocity, 2)
+        joint_states['b'].position = 3
+        self.assertEqual(view.position, 3)
+        self.assertEqual(joint_state.position, 6)
+        self.assertEqual(joint_states.data[joint_states.index('b'), Derivatives.position], 3)
+        del joint_states['a']
+        joint_state.position = 5
+        self.assertEqual(joint_state.position, 5)
+        self.assertNotIn('a', joint_states)
+        self.assertEqual(joint_states['c5'].position, 5)
+        self.assertEqual(joint_states.index('c5'), 6)
+        copied = deepcopy(joint_states)
+        copied['b'].position = 4
+        self.assertEqual(joint_states['b'].position, 3)
+        np.testing.assert_array_equal(copied.data[1:], joint_states.data[1:])
@@ -1,5 +1,6 @@
 from __future__ import division
 
+from collections import defaultdict
 from itertools import combinations
 
 import urdf_parser_py.urdf as up
@@ -19,6 +20,8 @@ import giskardpy.utils.tfwrapper as tf
 from giskard_msgs.msg import MoveResult, WorldBody, MoveGoal
 from giskard_msgs.srv import UpdateWorldResponse, UpdateWorldRequest
 from giskardpy import identifier
+from giskardpy.model.collision_world_syncer import Collision, Collisions
+from giskardpy.model.joints import FixedJoint
 from giskardpy.model.utils import make_world_body_box, hacky_urdf_parser_fix
 from giskardpy.model.world import WorldTree
 from giskardpy.my_types import PrefixName, Derivatives
@@ -2756,9 +2759,187 @@ class TestSelfCollisionAvoidance:
         zero_pose.send_goal()
         zero_pose.send_goal(expected_error_codes=[MoveResult.SELF_COLLISION_VIOLATED])
 
+    def test_in_collision_batch(self, zero_pose: PR2TestWrapper):
+        collision_scene = zero_pose.collision_scene
+        world = zero_pose.world
+        joint_names = [world.search_for_joint_name(joint_name) for joint_name in ['r_shoulder_pan_joint',
+                                                                                  'r_shoulder_lift_joint',
+                                                                                  'r_upper_arm_roll_joint',
+                                                                                  'r_elbow_flex_joint',
+                                                                                  'l_shoulder_pan_joint',
+                                                                                  'l_elbow_flex_joint',
+                                                                                  'torso_lift_joint']]
+        link_names = world.groups[zero_pose.robot_names[0]].link_names_with_collisions
+        link_combinations = [world.sort_links(link_a, link_b) for link_a, link_b in combinations(link_names, 2)
+                             if not world.are_linked(link_a, link_b)]
+        distance = 0.05
+        np.random.seed(23)
+        lower = np.array([-1.5, -0.5, -2, -2, -1.5, -2, 0])
+        upper = np.array([1.5, 1.2, 2, 0, 1.5, 0, 0.3])
+        positions = lower + np.random.rand(20, len(joint_names)) * (upper - lower)
+        current_state = {joint_name: world.state[joint_name].position for joint_name in joint_names}
+
+        in_collision = collision_scene.in_collision_batch(joint_names, positions, link_combinations, distance)
+
+        collision_scene.sync()
+        map_T_objects = world.compute_all_fks_matrix().reshape(-1, 4, 4)
+        for collision_object, map_T_object in zip(collision_scene.objects_in_order, map_T_objects):
+            origin = collision_object.transform.origin
+            np.testing.assert_almost_equal([origin.x, origin.y, origin.z], map_T_object[:3, 3])
+        for configuration, expected in zip(positions, in_collision):
+            actual = collision_scene.in_collision_at(dict(zip(joint_names, configuration)), link_combinations,
+                                                     distance)
+            assert actual == {link_combination for link_combination, x in zip(link_combinations, expected) if x}
+        for joint_name, position in current_state.items():
+            assert world.state[joint_name].position == position
+
+
+def collision_object_semantics(collision_scene, contacts, collision_list_size):
+    """
+    Reference for Collisions, which reduces each contact with its own Collision object.
+    :return: self collisions and external collisions sorted by distance and cut after collision_list_size,
+                and the closest external collision for each pair of original links
+    """
+    world = collision_scene.world
+    fixed_joints = collision_scene.fixed_joints
+    self_collisions = defaultdict(list)
+    external_collisions = defaultdict(list)
+    external_collisions_long_key = {}
+    for link_a, link_b, contact_distance, map_P_pa, map_P_pb, map_V_n in contacts:
+        collision = Collision(link_a, link_b, contact_distance, map_P_pa=map_P_pa, map_P_pb=map_P_pb, map_V_n=map_V_n)
+        is_self_collision = any(link_a in robot.link_names_as_set and link_b in robot.link_names_as_set
+                                for robot in collision_scene.robots)
+        if is_self_collision:
+            new_link_a, new_link_b = world.compute_chain_reduced_to_controlled_joints(link_a, link_b, fixed_joints)
+            if not world.link_order(new_link_a, new_link_b):
+                collision = collision.reverse()
+                new_link_a, new_link_b = new_link_b, new_link_a
+            collision.link_a = new_link_a
+            collision.link_b = new_link_b
+            new_b_T_map = world.compute_fk_np(new_link_b, world.root_link_name)
+            new_a_T_map = world.compute_fk_np(new_link_a, world.root_link_name)
+            collision.new_b_V_n = np.dot(new_b_T_map, collision.map_V_n)
+            collision.new_a_P_pa = np.dot(new_a_T_map, collision.map_P_pa)
+            collision.new_b_P_pb = np.dot(new_b_T_map, collision.map_P_pb)
+            self_collisions[new_link_a, new_link_b].append(collision)
+        else:
+            def stopper(joint_name):
+                return world.is_joint_controlled(joint_name) and joint_name not in fixed_joints
+
+            movable_joint = world.search_for_parent_joint(world.links[link_a].parent_joint_name, stopper)
+            collision.link_a = world.joints[movable_joint].child_link_name
+            new_a_T_map = world.compute_fk_np(collision.link_a, world.root_link_name)
+            collision.new_a_P_pa = np.dot(new_a_T_map, collision.map_P_pa)
+            external_collisions[collision.link_a].append(collision)
+            key_long = (link_a, None, link_b)
+            if key_long not in external_collisions_long_key \
+                    or collision.contact_distance < external_collisions_long_key[key_long].contact_distance:
+                external_collisions_long_key[key_long] = collision
+    for collisions in list(self_collisions.values()) + list(external_collisions.values()):
+        collisions.sort(key=lambda c: c.contact_distance)
+        del collisions[collision_list_size:]
+    return self_collisions, external_collisions, external_collisions_long_key
+
 
 class TestCollisionAvoidanceGoals:
 
+    def test_collisions_table(self, box_setup: PR2TestWrapper):
+        collision_scene = box_setup.collision_scene
+        world = box_setup.world
+        box_link = world.search_for_link_name('box')
+        links = [world.search_for_link_name(link_name) for link_name in ['r_gripper_l_finger_tip_link',
+                                                                         'r_gripper_palm_link',
+                                                                         'r_forearm_link',
+                                                                         'l_gripper_palm_link',
+                                                                         'l_forearm_link',
+                                                                         'base_link']]
+        collision_list_size = 3
+        np.random.seed(11)
+        contacts = []
+        # several contacts per pair, in both orders, such that some are reversed and only the closest are kept
+        for link_a, link_b in [(links[0], links[3]), (links[3], links[0]), (links[1], links[4]),
+                               (links[4], links[2]), (links[5], links[1]),
+                               (links[0], box_link), (links[1], box_link), (links[4], box_link)]:
+            for _ in range(np.random.randint(1, 6)):
+                map_V_n = np.random.rand(3) - 0.5
+                contacts.append((link_a, link_b, np.random.rand() * 0.2,
+                                 np.random.rand(3), np.random.rand(3), map_V_n / np.linalg.norm(map_V_n)))
+        expected_self, expected_external, expected_long_key = collision_object_semantics(collision_scene, contacts,
+                                                                                          collision_list_size)
+
+        collisions = Collisions(collision_list_size)
+        link_a, link_b, contact_distance, map_P_pa, map_P_pb, map_V_n = zip(*contacts)
+        collisions.add_batch(link_a, link_b, contact_distance, map_P_pa, map_P_pb, map_V_n)
+        pair_ids = {key: collision_scene.get_pair_id(*key) for key in expected_self}
+        external_collision_data = collisions.external_collision_data
+        self_collision_data = collisions.self_collision_data
+        external_columns = Collisions.external_data_columns
+        self_columns = Collisions.self_data_columns
+
+        assert set(collisions.self_collisions) == set(expected_self)
+        for key, expected in expected_self.items():
+            actual = collisions.get_self_collisions(*key)
+            assert collisions.get_number_of_self_collisions(*key) == len(expected)
+            data = self_collision_data[pair_ids[key]]
+            for i in range(collision_list_size):
+                if i < len(expected):
+                    collision = expected[i]
+                    assert collisions.link_names[actual[i]['original_link_a']] == collision.original_link_a
+                    assert collisions.link_names[actual[i]['original_link_b']] == collision.original_link_b
+                    assert collisions.link_names[actual[i]['link_a']] == key[0]
+                    assert collisions.link_names[actual[i]['link_b']] == key[1]
+                    contact_distance = collision.contact_distance
+                    new_a_P_pa, new_b_P_pb, new_b_V_n = collision.new_a_P_pa, collision.new_b_P_pb, collision.new_b_V_n
+                    np.testing.assert_almost_equal(actual[i]['map_V_n'], collision.map_V_n)
+                else:
+                    default = collisions.default_result[i]
+                    contact_distance = 100
+                    new_a_P_pa, new_b_P_pb, new_b_V_n = default['new_a_P_pa'], default['new_b_P_pb'], default['new_b_V_n']
+                assert actual[i]['contact_distance'] == contact_distance
+                assert data[i, self_columns['contact_distance']] == contact_distance
+                assert data[i, self_columns['number_of_contacts']] == len(expected)
+                np.testing.assert_almost_equal(actual[i]['new_a_P_pa'], new_a_P_pa)
+                np.testing.assert_almost_equal(actual[i]['new_b_P_pb'], new_b_P_pb)
+                np.testing.assert_almost_equal(actual[i]['new_b_V_n'], new_b_V_n)
+                column = self_columns['new_a_P_pa']
+                np.testing.assert_almost_equal(data[i, column:column + 3], new_a_P_pa[:3])
+                column = self_columns['new_b_P_pb']
+                np.testing.assert_almost_equal(data[i, column:column + 3], new_b_P_pb[:3])
+                column = self_columns['new_b_V_n']
+                np.testing.assert_almost_equal(data[i, column:column + 3], new_b_V_n[:3])
+
+        assert set(collisions.external_collision) == set(expected_external)
+        for link_name in collisions.link_names:
+            expected = expected_external.get(link_name, [])
+            actual = collisions.get_external_collisions(link_name)
+            assert collisions.get_number_of_external_collisions(link_name) == len(expected)
+            data = external_collision_data[collisions.get_link_id(link_name)]
+            for i in range(collision_list_size):
+                if i < len(expected):
+                    collision = expected[i]
+                    assert collisions.link_names[actual[i]['original_link_a']] == collision.original_link_a
+                    assert collisions.link_names[actual[i]['original_link_b']] == collision.original_link_b
+                    assert collisions.link_names[actual[i]['link_a']] == link_name
+                    contact_distance, map_V_n, new_a_P_pa = \
+                        collision.contact_distance, collision.map_V_n, collision.new_a_P_pa
+                else:
+                    default = collisions.default_result[i]
+                    contact_distance, map_V_n, new_a_P_pa = 100, default['map_V_n'], default['new_a_P_pa']
+                assert actual[i]['contact_distance'] == contact_distance
+                assert data[i, external_columns['contact_distance']] == contact_distance
+                assert data[i, external_columns['number_of_contacts']] == len(expected)
+                np.testing.assert_almost_equal(actual[i]['map_V_n'], map_V_n)
+                np.testing.assert_almost_equal(actual[i]['new_a_P_pa'], new_a_P_pa)
+                column = external_columns['map_V_n']
+                np.testing.assert_almost_equal(data[i, column:column + 3], map_V_n[:3])
+                column = external_columns['new_a_P_pa']
+                np.testing.assert_almost_equal(data[i, column:column + 3], new_a_P_pa[:3])
+
+        for key_long, collision in expected_long_key.items():
+            assert collisions.get_external_collisions_long_key(*key_long)['contact_distance'] \
+                   == collision.contact_distance
+        assert collisions.get_external_collisions_long_key(links[5], None, box_link)['contact_distance'] == 100
+
     def test_handover(self, kitchen_setup: PR2TestWrapper):
         js = {
             'l_shoulder_pan_joint': 1.0252138037286773,
@@ -3801,7 +3982,126 @@ class TestInfoServices:
         assert set(result.controlled_joints) == expected
 
 
+def parent_walk_compute_chain(world: WorldTree, root_link_name, tip_link_name, add_joints, add_links,
+                              add_fixed_joints, add_non_controlled_joints):
+    """
+    Reference for WorldTree.compute_chain, which walks from the tip to the root along the parent pointers.
+    """
+    chain = []
+    if add_links:
+        chain.append(tip_link_name)
+    link = world.links[tip_link_name]
+    while link.name != root_link_name:
+        if link.parent_joint_name not in world.joints:
+            raise ValueError(f'{root_link_name} and {tip_link_name} are not connected')
+        parent_joint = world.joints[link.parent_joint_name]
+        parent_link = world.links[parent_joint.parent_link_name]
+        if add_joints:
+            if (add_fixed_joints or not isinstance(parent_joint, FixedJoint)) and \
+                    (add_non_controlled_joints or parent_joint.name in world.controlled_joints):
+                chain.append(parent_joint.name)
+        if add_links:
+            chain.append(parent_link.name)
+        link = parent_link
+    chain.reverse()
+    return chain
+
+
+def parent_walk_compute_split_chain(world: WorldTree, root_link_name, tip_link_name, add_joints, add_links,
+                                    add_fixed_joints, add_non_controlled_joints):
+    if root_link_name == tip_link_name:
+        return [], [], []
+    root_chain = parent_walk_compute_chain(world, world.root_link_name, root_link_name, False, True, True, True)
+    tip_chain = parent_walk_compute_chain(world, world.root_link_name, tip_link_name, False, True, True, True)
+    for i in range(min(len(root_chain), len(tip_chain))):
+        if root_chain[i] != tip_chain[i]:
+            break
+    else:
+        i += 1
+    connection = tip_chain[i - 1]
+    root_chain = parent_walk_compute_chain(world, connection, root_link_name, add_joints, add_links,
+                                           add_fixed_joints, add_non_controlled_joints)
+    if add_links:
+        root_chain = root_chain[1:]
+    root_chain = root_chain[::-1]
+    tip_chain = parent_walk_compute_chain(world, connection, tip_link_name, add_joints, add_links,
+                                          add_fixed_joints, add_non_controlled_joints)
+    if add_links:
+        tip_chain = tip_chain[1:]
+    return root_chain, [connection] if add_links else [], tip_chain
+
+
+def parent_walk_parent_joint(world: WorldTree, link_name, stop_when):
+    joint = world.links[link_name].parent_joint_name
+    while joint is not None and not stop_when(joint):
+        joint = world.links[world.joints[joint].parent_link_name].parent_joint_name
+    return joint
+
+
+def assert_tree_index_matches_parent_walk(world: WorldTree):
+    link_names = list(world.link_names_as_set)
+    flags = [(True, True, True, True),
+             (True, False, False, True),
+             (True, False, False, False),
+             (False, True, True, True)]
+    for link_name in link_names:
+        try:
+            movable_parent_joint = world.get_movable_parent_joint(link_name)
+        except KeyError:
+            movable_parent_joint = None
+        assert movable_parent_joint == parent_walk_parent_joint(world, link_name, world.is_joint_movable)
+        try:
+            controlled_parent_joint = world.get_controlled_parent_joint_of_link(link_name)
+        except KeyError:
+            controlled_parent_joint = None
+        assert controlled_parent_joint == parent_walk_parent_joint(world, link_name, world.is_joint_controlled)
+    for link_a in link_names:
+        for link_b in link_names:
+            for add_flags in flags:
+                try:
+                    expected = parent_walk_compute_chain(world, link_a, link_b, *add_flags)
+                except ValueError:
+                    with pytest.raises(ValueError):
+                        world.compute_chain(link_a, link_b, *add_flags)
+                else:
+                    assert world.compute_chain(link_a, link_b, *add_flags) == expected
+                assert world.compute_split_chain(link_a, link_b, *add_flags) \
+                       == parent_walk_compute_split_chain(world, link_a, link_b, *add_flags)
+            for do_not_ignore_non_controlled_joints in [True, False]:
+                chain1, connection, chain2 = parent_walk_compute_split_chain(
+                    world, link_a, link_b, True, False, False, do_not_ignore_non_controlled_joints)
+                assert world.are_linked(link_a, link_b, do_not_ignore_non_controlled_joints) \
+                       == (not chain1 and not connection and not chain2)
+
+
 class TestWorld:
+    def test_tree_index(self, world_setup: WorldTree):
+        assert_tree_index_matches_parent_walk(world_setup)
+
+    def test_tree_index_rebuild(self, world_setup: WorldTree):
+        tree_index = world_setup.tree_index
+        box_name = 'box'
+        pose = Pose()
+        pose.orientation.w = 1
+        world_setup.add_world_body(group_name=box_name,
+                                   msg=make_world_body_box(),
+                                   pose=pose,
+                                   parent_link_name=world_setup.search_for_link_name('r_gripper_tool_frame'))
+        assert world_setup.tree_index is not tree_index
+        assert_tree_index_matches_parent_walk(world_setup)
+
+        box_link_name = world_setup.search_for_link_name(box_name)
+        box_joint_name = world_setup.links[box_link_name].parent_joint_name
+        controlled_joints = world_setup.controlled_joints
+        tree_index = world_setup.tree_index
+        try:
+            world_setup.register_controlled_joints([box_joint_name])
+            assert world_setup.tree_index is not tree_index
+            assert world_setup.get_controlled_parent_joint_of_link(box_link_name) == box_joint_name
+            assert_tree_index_matches_parent_walk(world_setup)
+        finally:
+            world_setup.god_map.set_data(identifier.controlled_joints, controlled_joints)
+
     def test_compute_chain_reduced_to_controlled_joints(self, world_setup: WorldTree):
         r_gripper_tool_frame = world_setup.search_for_link_name('r_gripper_tool_frame')
         l_gripper_tool_frame = world_setup.search_for_link_name('l_gripper_tool_frame')
@@ -0,0 +1,146 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from trajectory_msgs.msg import JointTrajectory, JointTrajectoryPoint
+import rospy
+
+from giskardpy.data_types import JointStates
+from giskardpy.model.trajectory import Trajectory
+from giskardpy.my_types import PrefixName, Derivatives
+
+
+class FakeJoint:
+    def __init__(self, *free_variables):
+        self.free_variables = list(free_variables)
+
+    def get_position_variables(self):
+        return self.free_variables
+
+
+def make_joint_states(names, offset):
+    joint_states = JointStates()
+    for i, name in enumerate(names):
+        for derivative in Derivatives:
+            joint_states[name][derivative] = offset + i + 0.1 * derivative
+    return joint_states
+
+
+def per_point_to_msg(trajectory, sample_period, start_time, joints, fill_velocity_values=True):
+    """
+    Reference implementation that builds the message point by point.
+    """
+    trajectory_msg = JointTrajectory()
+    trajectory_msg.header.stamp = rospy.Duration(start_time)
+    trajectory_msg.joint_names = []
+    for i, (time, traj_point) in enumerate(trajectory.items()):
+        p = JointTrajectoryPoint()
+        p.time_from_start = rospy.Duration(time * sample_period)
+        for joint in joints:
+            for free_variable in joint.get_position_variables():
+                if i == 0:
+                    trajectory_msg.joint_names.append(free_variable.short_name)
+                p.positions.append(traj_point[free_variable].position)
+                if fill_velocity_values:
+                    p.velocities.append(traj_point[free_variable].velocity)
+        trajectory_msg.points.append(p)
+    return trajectory_msg
+
+
+class TestTrajectory(unittest.TestCase):
+    names = [PrefixName('joint1', 'robot'), PrefixName('joint2', 'robot'), PrefixName('joint3', 'robot')]
+
+    def make_trajectory(self, length):
+        trajectory = Trajectory()
+        for time in range(length):
+            trajectory.set(time, make_joint_states(self.names, time))
+        return trajectory
+
+    def assert_point_equal(self, actual, expected):
+        self.assertEqual(list(actual.keys()), list(expected.keys()))
+        np.testing.assert_array_equal(actual.data, expected.data)
+
+    def test_set_overwrite_delete(self):
+        trajectory = self.make_trajectory(20)
+        self.assertEqual(len(trajectory), 20)
+        trajectory.set(19, make_joint_states(self.names, 100))
+        self.assertEqual(len(trajectory), 20)
+        self.assert_point_equal(trajectory.get_exact(19), make_joint_states(self.names, 100))
+
+        trajectory.delete(5)
+        trajectory.delete(19)
+        expected_times = [time for time in range(19) if time != 5]
+        self.assertEqual(list(trajectory.keys()), expected_times)
+        self.assertEqual(len(trajectory), len(expected_times))
+        for (time, point), expected_time in zip(trajectory.items(), expected_times):
+            self.assertEqual(time, expected_time)
+            self.assert_point_equal(point, make_joint_states(self.names, time))
+            self.assert_point_equal(trajectory.get_exact(time), make_joint_states(self.names, time))
+        self.assertRaises(KeyError, trajectory.get_exact, 5)
+        self.assertRaises(KeyError, trajectory.get_exact, 19)
+        self.assert_point_equal(trajectory.get_last(), make_joint_states(self.names, 18))
+
+        # a partial point after a point with more free variables
+        trajectory.set(19, make_joint_states(self.names[:1], 200))
+        self.assert_point_equal(trajectory.get_exact(19), make_joint_states(self.names[:1], 200))
+
+    def test_snapshots(self):
+        trajectory = Trajectory()
+        trajectory.set(0, make_joint_states(self.names[:2], 0))
+        first = trajectory.get_exact(0)
+        first_data = first.data.copy()
+        trajectory.set(0, make_joint_states(self.names[:2], 10))
+        # grows the data array and adds a column
+        for time in range(1, 40):
+            trajectory.set(time, make_joint_states(self.names, time))
+        last = trajectory.get_last()
+        last_data = last.data.copy()
+        trajectory.set(39, make_joint_states(self.names, 100))
+        np.testing.assert_array_equal(first.data, first_data)
+        np.testing.assert_array_equal(last.data, last_data)
+        self.assertFalse(first.data.flags.writeable)
+        self.assert_point_equal(trajectory.get_exact(0), make_joint_states(self.names[:2], 10))
+        self.assert_point_equal(trajectory.get_exact(39), make_joint_states(self.names, 100))
+
+    def test_save_load(self):
+        trajectory = self.make_trajectory(20)
+        trajectory.set(20, make_joint_states(self.names[1:], 20))
+        trajectory.delete(3)
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'trajectory.npz')
+            trajectory.save(file_name)
+            for mmap_mode in [None, 'r']:
+                loaded = Trajectory.load(file_name, mmap_mode=mmap_mode)
+                if mmap_mode is not None:
+                    self.assertIsInstance(loaded.data, np.memmap)
+                self.assertEqual(loaded.names, trajectory.names)
+                self.assertEqual(list(loaded.keys()), list(trajectory.keys()))
+                for (time, point), (expected_time, expected_point) in zip(loaded.items(), trajectory.items()):
+                    self.assertEqual(time, expected_time)
+                    self.assert_point_equal(point, expected_point)
+                np.testing.assert_array_equal(loaded.to_np(self.names[1:]), trajectory.to_np(self.names[1:]))
+                del loaded
+
+    def test_load_compressed(self):
+        trajectory = self.make_trajectory(5)
+        with tempfile.TemporaryDirectory() as folder:
+            file_name = os.path.join(folder, 'trajectory.npz')
+            np.savez_compressed(file_name,
+                                times=np.array(list(trajectory.keys())),
+                                data=trajectory.data,
+                                valid=trajectory.valid,
+                                names=np.array([str(name) for name in trajectory.names]))
+            self.assertRaises(ValueError, Trajectory.load, file_name, mmap_mode='r')
+
+    def test_to_msg(self):
+        trajectory = self.make_trajectory(10)
+        trajectory.delete(4)
+        joints = [FakeJoint(self.names[2]), FakeJoint(self.names[0], self.names[1])]
+        for fill_velocity_values in [True, False]:
+            actual = trajectory.to_msg(0.05, 2, joints, fill_velocity_values=fill_velocity_values)
+            expected = per_point_to_msg(trajectory, 0.05, 2, joints, fill_velocity_values=fill_velocity_values)
+            self.assertEqual(actual, expected)
+
+        trajectory.set(10, make_joint_states(self.names[:2], 10))
+        self.assertRaises(NotImplementedError, trajectory.to_msg, 0.05, 2, joints)